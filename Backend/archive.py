@@ -0,0 +1,416 @@
+"""Moves old chat messages into compressed segments in the archive database"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from database import db_pool
+
+# Messages older than this many days leave chat_messages...
+RETENTION_DAYS = float(os.environ.get("PORTAL_CHAT_RETENTION_DAYS", "365"))
+# ...unless the room has its own setting, e.g. "year1=180,course_12=90"
+ROOM_RETENTION = os.environ.get("PORTAL_CHAT_RETENTION", "")
+ARCHIVE_INTERVAL = float(os.environ.get("PORTAL_ARCHIVE_INTERVAL", "3600"))  # seconds between runs
+SEGMENT_SIZE = 1000  # messages moved per transaction, and the most one segment holds
+BATCH_PAUSE = 0.05  # seconds between batches so request writes get the lock
+
+
+def parse_room_retention(value: str) -> dict:
+    retention = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        room, _, days = item.partition("=")
+        try:
+            retention[room.strip()] = float(days)
+        except ValueError:
+            raise ValueError(f"Invalid PORTAL_CHAT_RETENTION entry '{item}', expected room=days")
+    return retention
+
+
+def _create_segments(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive.chat_archive_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room TEXT NOT NULL,
+            month TEXT NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS archive.idx_chat_archive_segments_room_max
+        ON chat_archive_segments(room, max_id)
+    """)
+
+
+def _create_search_index(conn):
+    # Unlike chat_messages_fts this index stores its own text, since archived
+    # messages only exist compressed inside segments
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS archive.chat_archive_fts USING fts5(
+            content,
+            sender_name,
+            room UNINDEXED,
+            sender_id UNINDEXED,
+            timestamp UNINDEXED,
+            date UNINDEXED,
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    # Index what earlier runs already archived
+    for segment in conn.execute("SELECT payload FROM archive.chat_archive_segments").fetchall():
+        index_archived(conn, decode_segment(segment["payload"]))
+
+
+def _create_stats(conn):
+    # Messages per room and day, so the chat dashboard still counts archived history
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive.chat_archive_stats (
+            room TEXT NOT NULL,
+            date TEXT NOT NULL,
+            messages INTEGER NOT NULL,
+            PRIMARY KEY (room, date)
+        ) WITHOUT ROWID
+    """)
+    for segment in conn.execute("SELECT payload FROM archive.chat_archive_segments").fetchall():
+        count_archived(conn, decode_segment(segment["payload"]))
+
+
+# Schema steps of the archive database in order; its user_version counts
+# the steps applied. Only ever append.
+ARCHIVE_SCHEMA = [
+    _create_segments,
+    _create_search_index,
+    _create_stats,
+]
+
+
+def ensure_archive_schema(conn):
+    """Bring the attached archive database up to date.
+
+    A current archive costs one PRAGMA read and no DDL.
+    """
+    if conn.execute("PRAGMA archive.user_version").fetchone()[0] >= len(ARCHIVE_SCHEMA):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another worker may have upgraded it while we waited for the lock
+        version = conn.execute("PRAGMA archive.user_version").fetchone()[0]
+        for step in ARCHIVE_SCHEMA[version:]:
+            step(conn)
+        conn.execute(f"PRAGMA archive.user_version = {len(ARCHIVE_SCHEMA)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def encode_segment(messages: list) -> bytes:
+    return zlib.compress(json.dumps(messages, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decode_segment(payload: bytes) -> list:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def count_archived(conn, messages: list):
+    """Add archived messages to the per-room, per-day counts"""
+    counts = {}
+    for msg in messages:
+        key = (msg["room"], msg["date"])
+        counts[key] = counts.get(key, 0) + 1
+    conn.executemany(
+        """INSERT INTO archive.chat_archive_stats (room, date, messages) VALUES (?, ?, ?)
+           ON CONFLICT (room, date) DO UPDATE SET messages = messages + excluded.messages""",
+        [(room, date, count) for (room, date), count in counts.items()]
+    )
+
+
+def index_archived(conn, messages: list):
+    """Add archived messages to the archive's search index, keyed by message id"""
+    conn.executemany(
+        """INSERT OR REPLACE INTO archive.chat_archive_fts
+               (rowid, content, sender_name, room, sender_id, timestamp, date)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        [(msg["id"], msg["content"], msg["sender_name"], msg["room"], msg["sender_id"],
+          msg["timestamp"], msg["date"]) for msg in messages]
+    )
+
+
+# ============================================
+# READS (async, used by the chat history endpoints)
+# ============================================
+
+async def read_archive(conn, room: str, before_id=None, after_id=None, limit: int = 50) -> list:
+    """Up to `limit` archived messages of a room next to a cursor, oldest first.
+
+    With after_id the messages just newer than it; otherwise the ones just
+    older than before_id (or the newest archived ones). Only the segments
+    that overlap the cursor are decompressed.
+    """
+    cursor = conn.cursor()
+    if after_id is not None:
+        await cursor.execute(
+            "SELECT payload FROM archive.chat_archive_segments WHERE room = ? AND max_id > ? ORDER BY max_id",
+            (room, after_id)
+        )
+    elif before_id is not None:
+        await cursor.execute(
+            "SELECT payload FROM archive.chat_archive_segments WHERE room = ? AND min_id < ? ORDER BY max_id DESC",
+            (room, before_id)
+        )
+    else:
+        await cursor.execute(
+            "SELECT payload FROM archive.chat_archive_segments WHERE room = ? ORDER BY max_id DESC",
+            (room,)
+        )
+
+    messages = []
+    while len(messages) < limit:
+        segment = await cursor.fetchone()
+        if segment is None:
+            break
+        decoded = decode_segment(segment["payload"])
+        if after_id is not None:
+            messages.extend(msg for msg in decoded if msg["id"] > after_id)
+        else:
+            older = [msg for msg in decoded if before_id is None or msg["id"] < before_id]
+            messages[:0] = older
+
+    # Segments of one batch are split by month, so guard against a clock that
+    # went backwards leaving their id ranges interleaved
+    messages.sort(key=lambda msg: msg["id"])
+    if after_id is not None:
+        return messages[:limit]
+    return messages[-limit:]
+
+
+def delete_archived(conn, message_id: int):
+    """Remove one archived message inside the caller's write transaction.
+
+    The message is cut out of its segment (an emptied segment is dropped),
+    its search index row and its day's count. Returns the message's room, or
+    None if it isn't archived.
+    """
+    found = conn.execute("SELECT room FROM archive.chat_archive_fts WHERE rowid = ?", (message_id,)).fetchone()
+    if found is None:
+        return None
+    room = found["room"]
+    segment = conn.execute(
+        """SELECT id, payload FROM archive.chat_archive_segments
+           WHERE room = ? AND max_id >= ? AND min_id <= ? ORDER BY max_id LIMIT 1""",
+        (room, message_id, message_id)
+    ).fetchone()
+    messages = decode_segment(segment["payload"]) if segment is not None else []
+    deleted = [msg for msg in messages if msg["id"] == message_id]
+    kept = [msg for msg in messages if msg["id"] != message_id]
+    if kept:
+        conn.execute(
+            """UPDATE archive.chat_archive_segments SET min_id = ?, max_id = ?, message_count = ?, payload = ?
+               WHERE id = ?""",
+            (kept[0]["id"], kept[-1]["id"], len(kept), encode_segment(kept), segment["id"])
+        )
+    elif segment is not None:
+        conn.execute("DELETE FROM archive.chat_archive_segments WHERE id = ?", (segment["id"],))
+    for msg in deleted:
+        conn.execute(
+            "UPDATE archive.chat_archive_stats SET messages = messages - 1 WHERE room = ? AND date = ?",
+            (room, msg["date"])
+        )
+        conn.execute(
+            "DELETE FROM archive.chat_archive_stats WHERE room = ? AND date = ? AND messages <= 0",
+            (room, msg["date"])
+        )
+    conn.execute("DELETE FROM archive.chat_archive_fts WHERE rowid = ?", (message_id,))
+    return room
+
+
+async def has_archived(conn, room: str) -> bool:
+    cursor = conn.cursor()
+    await cursor.execute("SELECT 1 FROM archive.chat_archive_segments WHERE room = ? LIMIT 1", (room,))
+    return await cursor.fetchone() is not None
+
+
+# ============================================
+# ARCHIVAL JOB
+# ============================================
+
+def chat_rooms(conn) -> list:
+    """Every room with messages, one index seek per room instead of a full scan"""
+    rows = conn.execute("""
+        WITH RECURSIVE rooms(room) AS (
+            SELECT MIN(room) FROM chat_messages
+            UNION ALL
+            SELECT (SELECT MIN(room) FROM chat_messages WHERE room > rooms.room)
+            FROM rooms WHERE rooms.room IS NOT NULL
+        )
+        SELECT room FROM rooms WHERE room IS NOT NULL
+    """).fetchall()
+    return [row[0] for row in rows]
+
+
+def archive_batch(conn, room: str, cutoff_ms: int) -> list:
+    """Move up to SEGMENT_SIZE of a room's oldest messages sent before cutoff_ms.
+
+    Returns the ids moved, oldest first.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Ids only grow, so the room's oldest rows come first and we stop at
+        # the first one still inside the retention window
+        rows = conn.execute(
+            "SELECT * FROM chat_messages WHERE room = ? ORDER BY id LIMIT ?",
+            (room, SEGMENT_SIZE)
+        ).fetchall()
+        expired = []
+        for row in rows:
+            if row["timestamp"] >= cutoff_ms:
+                break
+            expired.append(dict(row))
+        if not expired:
+            conn.rollback()
+            return []
+
+        # Main and archive commit separately in WAL mode, so a crash can leave
+        # archived rows behind in chat_messages; they are deleted, not re-archived
+        archived_up_to = conn.execute(
+            "SELECT COALESCE(MAX(max_id), 0) FROM archive.chat_archive_segments WHERE room = ?",
+            (room,)
+        ).fetchone()[0]
+        segments = {}
+        for msg in expired:
+            if msg["id"] > archived_up_to:
+                segments.setdefault(msg["date"][:7], []).append(msg)
+        for month, messages in segments.items():
+            conn.execute(
+                """INSERT INTO archive.chat_archive_segments (room, month, min_id, max_id, message_count, payload)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (room, month, messages[0]["id"], messages[-1]["id"], len(messages), encode_segment(messages))
+            )
+            index_archived(conn, messages)
+            count_archived(conn, messages)
+
+        # Archiving isn't deleting: drop the tombstones the delete trigger
+        # writes so syncing clients keep these messages
+        last_tombstone = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_message_tombstones").fetchone()[0]
+        conn.execute(
+            "DELETE FROM chat_messages WHERE room = ? AND id BETWEEN ? AND ?",
+            (room, expired[0]["id"], expired[-1]["id"])
+        )
+        conn.execute("DELETE FROM chat_message_tombstones WHERE id > ?", (last_tombstone,))
+        conn.commit()
+        return [msg["id"] for msg in expired]
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class ChatArchiver:
+    """Periodically archives expired chat messages on a pooled connection.
+
+    When started with archived(room, through_id), each committed batch is
+    reported to it on the event loop, so cached room tails can drop the
+    messages that left chat_messages.
+    """
+
+    def __init__(self, interval: float = ARCHIVE_INTERVAL, default_days: float = RETENTION_DAYS,
+                 room_days: dict = None):
+        self.interval = interval
+        self.default_days = default_days
+        self.room_days = parse_room_retention(ROOM_RETENTION) if room_days is None else room_days
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._on_archived = None
+        self._loop = None
+        self._runs = 0
+        self._failures = 0
+        self._archived = 0
+        self._last = None
+
+    def retention_days(self, room: str) -> float:
+        return self.room_days.get(room, self.default_days)
+
+    def run_once(self, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        started = time.monotonic()
+        moved = {}
+        with db_pool.connection() as conn:
+            for room in chat_rooms(conn):
+                cutoff_ms = int((now - self.retention_days(room) * 86400) * 1000)
+                while not self._stop.is_set():
+                    ids = archive_batch(conn, room, cutoff_ms)
+                    if ids:
+                        moved[room] = moved.get(room, 0) + len(ids)
+                        if self._on_archived is not None:
+                            self._loop.call_soon_threadsafe(self._on_archived, room, ids[-1])
+                    if len(ids) < SEGMENT_SIZE:
+                        break
+                    time.sleep(BATCH_PAUSE)
+        result = {
+            "archived": moved,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "at": now,
+        }
+        with self._lock:
+            self._runs += 1
+            self._archived += sum(moved.values())
+            self._last = result
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._failures += 1
+                print(f"Warning: chat archival failed: {str(e)}")
+
+    def start(self, archived=None):
+        if self._thread and self._thread.is_alive():
+            return
+        self._on_archived = archived
+        self._loop = asyncio.get_running_loop() if archived is not None else None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chat-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "default_retention_days": self.default_days,
+                "room_retention_days": self.room_days,
+                "runs": self._runs,
+                "failures": self._failures,
+                "archived": self._archived,
+                "last": self._last,
+            }
+
+
+chat_archiver = ChatArchiver()
+
+
+if __name__ == "__main__":
+    # python archive.py  -- archive now instead of waiting for the server's next run
+    with db_pool.connection() as conn:
+        ensure_archive_schema(conn)
+    result = chat_archiver.run_once()
+    for room, count in sorted(result["archived"].items()):
+        print(f"{room}: archived {count} messages")
+    print(f"Done in {result['duration_ms']} ms")
+    db_pool.close()
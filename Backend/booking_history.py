@@ -0,0 +1,150 @@
+"""Moves completed bookings out of the live bookings table"""
+import asyncio
+import sqlite3
+import threading
+import time
+import os
+from datetime import date
+
+from database import db_pool
+
+EXPIRY_INTERVAL = float(os.environ.get("PORTAL_BOOKING_EXPIRY_INTERVAL", "3600"))  # seconds between runs
+BATCH_SIZE = 1000  # bookings moved per transaction
+BATCH_PAUSE = 0.05  # seconds between batches so request writes get the lock
+
+
+def expire_batch(conn, before_date: str) -> list:
+    """Move up to BATCH_SIZE bookings dated before before_date into booking_history.
+
+    Returns the (room_key, booking_date, time_slot) of every booking moved.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM bookings WHERE booking_date < ? ORDER BY booking_date LIMIT ?",
+            (before_date, BATCH_SIZE)
+        ).fetchall()]
+        if not ids:
+            conn.rollback()
+            return []
+
+        id_list = ", ".join(["?"] * len(ids))
+        conn.execute(
+            f"""INSERT OR IGNORE INTO booking_history
+                    (id, user_id, room_key, room_name, booking_date, time_slot, created_at)
+                SELECT id, user_id, room_key, room_name, booking_date, time_slot, created_at
+                FROM bookings WHERE id IN ({id_list})""",
+            ids
+        )
+        # Roll the counts up by the day each booking was made, as the dashboards report them
+        conn.execute(
+            f"""INSERT INTO booking_stats_daily (day, room_key, room_name, bookings)
+                SELECT date(created_at), room_key, room_name, COUNT(*)
+                FROM bookings WHERE id IN ({id_list})
+                GROUP BY date(created_at), room_key, room_name
+                ON CONFLICT (day, room_key, room_name) DO UPDATE SET bookings = bookings + excluded.bookings""",
+            ids
+        )
+        slots = conn.execute(
+            f"DELETE FROM bookings WHERE id IN ({id_list}) RETURNING room_key, booking_date, time_slot",
+            ids
+        ).fetchall()
+        conn.commit()
+        return [tuple(slot) for slot in slots]
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class BookingExpirer:
+    """Periodically moves bookings whose day has passed into booking_history.
+
+    The live table then only holds today's and upcoming bookings, which is
+    all the conflict and quota checks need to look at. When started with
+    released(slots), each committed batch's slots are handed to it on the
+    event loop, so availability caches drop them like cancelled bookings.
+    """
+
+    def __init__(self, interval: float = EXPIRY_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._released = None
+        self._loop = None
+        self._runs = 0
+        self._failures = 0
+        self._moved = 0
+        self._last = None
+
+    def run_once(self, today: str = None) -> dict:
+        today = date.today().isoformat() if today is None else today
+        started = time.monotonic()
+        moved = 0
+        with db_pool.connection() as conn:
+            while not self._stop.is_set():
+                slots = expire_batch(conn, today)
+                moved += len(slots)
+                if slots and self._released is not None:
+                    self._loop.call_soon_threadsafe(self._released, slots)
+                if len(slots) < BATCH_SIZE:
+                    break
+                time.sleep(BATCH_PAUSE)
+            # Nobody can be promoted into a slot that is already over
+            with conn:
+                waitlist = conn.execute("DELETE FROM booking_waitlist WHERE booking_date < ?", (today,)).rowcount
+        result = {
+            "moved": moved,
+            "waitlist_removed": waitlist,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "before": today,
+        }
+        with self._lock:
+            self._runs += 1
+            self._moved += moved
+            self._last = result
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._failures += 1
+                print(f"Warning: booking expiry failed: {str(e)}")
+
+    def start(self, released=None):
+        if self._thread and self._thread.is_alive():
+            return
+        self._released = released
+        self._loop = asyncio.get_running_loop() if released is not None else None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="booking-expirer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "runs": self._runs,
+                "failures": self._failures,
+                "moved": self._moved,
+                "last": self._last,
+            }
+
+
+booking_expirer = BookingExpirer()
+
+
+if __name__ == "__main__":
+    # python booking_history.py  -- expire now instead of waiting for the server's next run
+    result = booking_expirer.run_once()
+    print(f"Moved {result['moved']} completed bookings to booking_history in {result['duration_ms']} ms")
+    db_pool.close()
@@ -0,0 +1,197 @@
+"""Publish/subscribe between the worker processes serving the API"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+from database import DATABASE_PATH
+
+# "memory" for a single process, "sqlite" when running several uvicorn workers
+BUS_BACKEND = os.environ.get("PORTAL_BUS", "memory")
+BUS_POLL_INTERVAL = float(os.environ.get("PORTAL_BUS_POLL_INTERVAL", "0.2"))  # seconds
+BUS_RETENTION = 60  # seconds events stay in bus_events for slow pollers
+
+
+class MemoryBus:
+    """Delivers events to the subscribers of this process only.
+
+    Handlers run on the event loop thread and must not block; publish() is
+    called from the event loop as well.
+    """
+
+    def __init__(self):
+        self._handlers = {}  # channel -> list of handlers
+        self._loop = None
+        # Identifies this process, e.g. for subscribers that treat their own events differently
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        # Metrics
+        self._published = 0
+        self._delivered = 0
+        self._errors = 0
+
+    def subscribe(self, channel: str, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, payload: dict):
+        self._published += 1
+        self._dispatch(channel, payload)
+
+    def _dispatch(self, channel: str, payload: dict):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+                self._delivered += 1
+            except Exception as e:
+                # One broken subscriber must not stop the others or the publisher
+                self._errors += 1
+                print(f"Warning: bus handler for '{channel}' failed: {str(e)}")
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "published": self._published,
+            "delivered": self._delivered,
+            "handler_errors": self._errors,
+        }
+
+
+class SqliteBus(MemoryBus):
+    """Shares events between processes through the bus_events table.
+
+    publish() delivers to local subscribers straight away and queues the
+    event; a background thread writes queued events in one transaction per
+    tick (a batch that fails to commit stays queued for the next) and polls for rows written by other processes, handing them to the
+    event loop. Rows become visible in id order (SQLite has a single writer),
+    so a poller never skips an event. Old rows are pruned after BUS_RETENTION.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, interval: float = BUS_POLL_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.interval = interval
+        self._outbox = deque()  # (channel, json payload); deque appends are thread-safe
+        self._last_id = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self._written = 0
+        self._received = 0
+        self._failures = 0
+        self._last_prune = 0.0
+
+    def publish(self, channel: str, payload: dict):
+        super().publish(channel, payload)
+        self._outbox.append((channel, json.dumps(payload)))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    def _tick(self, conn):
+        batch = []
+        while self._outbox:
+            batch.append(self._outbox.popleft())
+        now = time.time()
+        if batch:
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO bus_events (origin, channel, payload, created_at) VALUES (?, ?, ?, ?)",
+                        [(self.origin, channel, payload, now) for channel, payload in batch]
+                    )
+            except sqlite3.Error:
+                # Back to the front of the outbox, ahead of anything published
+                # since, so the next tick retries the batch in order
+                self._outbox.extendleft(reversed(batch))
+                raise
+            self._written += len(batch)
+
+        rows = conn.execute(
+            "SELECT id, origin, channel, payload FROM bus_events WHERE id > ? ORDER BY id",
+            (self._last_id,)
+        ).fetchall()
+        for event_id, origin, channel, payload in rows:
+            self._last_id = event_id
+            if origin != self.origin:
+                self._received += 1
+                self._loop.call_soon_threadsafe(self._dispatch, channel, json.loads(payload))
+
+        if now - self._last_prune > BUS_RETENTION:
+            with conn:
+                conn.execute("DELETE FROM bus_events WHERE created_at < ?", (now - BUS_RETENTION,))
+            self._last_prune = now
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self._tick(conn)
+                except sqlite3.Error as e:
+                    self._failures += 1
+                    print(f"Warning: bus poll failed: {str(e)}")
+            # Hand over whatever was published during shutdown
+            try:
+                self._tick(conn)
+            except sqlite3.Error:
+                pass
+        finally:
+            conn.close()
+
+    def start(self):
+        super().start()
+        if self._thread and self._thread.is_alive():
+            return
+        # Only events published from now on are of interest to this process
+        conn = self._connect()
+        try:
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus_events").fetchone()[0]
+        finally:
+            conn.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="bus-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.update({
+            "backend": "sqlite",
+            "origin": self.origin,
+            "poll_interval": self.interval,
+            "outbox": len(self._outbox),
+            "written": self._written,
+            "received": self._received,
+            "failures": self._failures,
+        })
+        return stats
+
+
+BUS_BACKENDS = {"memory": MemoryBus, "sqlite": SqliteBus}
+
+
+def create_bus(backend: str = BUS_BACKEND):
+    if backend not in BUS_BACKENDS:
+        raise ValueError(f"Unknown bus backend '{backend}', expected one of: {', '.join(BUS_BACKENDS)}")
+    return BUS_BACKENDS[backend]()
+
+
+bus = create_bus()
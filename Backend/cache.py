@@ -0,0 +1,471 @@
+"""Small in-process caches"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+USER_CACHE_SIZE = int(os.environ.get("PORTAL_USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("PORTAL_USER_CACHE_TTL", "60"))  # seconds
+ROOM_CACHE_MESSAGES = int(os.environ.get("PORTAL_ROOM_CACHE_MESSAGES", "200"))  # newest messages kept per room
+ROOM_CACHE_BYTES = int(os.environ.get("PORTAL_ROOM_CACHE_MB", "32")) * 1024 * 1024
+AVAILABILITY_CACHE_DAYS = int(os.environ.get("PORTAL_AVAILABILITY_CACHE_DAYS", "50000"))  # (room, date) bitmaps kept
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl` seconds after being set.
+
+    A reader that fills the cache from the database takes generation(key)
+    before the read and passes it to set(). invalidate() bumps the key's
+    generation, so a read that started before an invalidation can't write
+    the old row back afterwards. Generations of the least recently
+    invalidated keys are folded into one floor value to stay within maxsize;
+    that can only make a fill be skipped, never let a stale one through.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._generations = OrderedDict()  # key -> generation of its last invalidate(), oldest first
+        self._generation = 0  # last generation handed out
+        self._floor = 0  # generation of every key not in _generations
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+        self._invalidated = 0
+        self._stale_sets = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def generation(self, key) -> int:
+        with self._lock:
+            return self._generations.get(key, self._floor)
+
+    def set(self, key, value, generation: int = None):
+        """Cache value, unless key was invalidated since `generation` was taken"""
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key, self._floor):
+                self._stale_sets += 1
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evicted += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._generations[key] = self._generation
+            self._generations.move_to_end(key)
+            while len(self._generations) > self.maxsize:
+                _, dropped = self._generations.popitem(last=False)
+                self._floor = max(self._floor, dropped)
+            if self._data.pop(key, None) is not None:
+                self._invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            # Every read in flight predates the clear
+            self._generation += 1
+            self._generations.clear()
+            self._floor = self._generation
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "expired": self._expired,
+                "evicted": self._evicted,
+                "invalidated": self._invalidated,
+                "stale_sets": self._stale_sets,
+            }
+
+
+class _RoomBuffer:
+    def __init__(self):
+        self.ids = []  # ascending, parallel to messages and sizes
+        self.messages = []
+        self.sizes = []  # approximate bytes per message
+        self.size = 0
+        self.ready = False  # loaded from the database
+        self.has_older = False  # the room has messages older than ids[0]
+        self.removed = set()  # deleted while loading, in case the load still saw them
+        self.archived_through = 0  # ids up to here have moved to the archive
+
+
+class RoomMessageCache:
+    """The newest messages of recently read chat rooms, oldest first.
+
+    A room's buffer is always a contiguous tail of its history, so the
+    newest page can be served from memory. It is loaded from the database the
+    first time that page is read (warm()) and then kept current by add() and
+    remove(), which the chat bus subscriber calls for every message written
+    or deleted, and by drop_archived() once the archiver moves a room's oldest
+    messages out. Events that arrive while a room is still loading are kept
+    and merged with the loaded rows, so a message committed during the load
+    is never lost. Cold rooms are evicted least recently used first once the
+    total size passes max_bytes.
+    """
+
+    def __init__(self, per_room: int = ROOM_CACHE_MESSAGES, max_bytes: int = ROOM_CACHE_BYTES):
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self._rooms = OrderedDict()  # room -> _RoomBuffer, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    @staticmethod
+    def _sizeof(message: dict) -> int:
+        return len(json.dumps(message))
+
+    def _insert(self, buf: _RoomBuffer, message: dict):
+        i = bisect.bisect_left(buf.ids, message["id"])
+        if i < len(buf.ids) and buf.ids[i] == message["id"]:
+            return
+        if i == 0 and buf.has_older:
+            # Older than the buffered tail: it belongs to history we don't hold
+            return
+        size = self._sizeof(message)
+        buf.ids.insert(i, message["id"])
+        buf.messages.insert(i, message)
+        buf.sizes.insert(i, size)
+        buf.size += size
+        self._size += size
+        while len(buf.ids) > self.per_room:
+            self._pop(buf, 0)
+            buf.has_older = True
+
+    def _pop(self, buf: _RoomBuffer, i: int):
+        buf.ids.pop(i)
+        buf.messages.pop(i)
+        size = buf.sizes.pop(i)
+        buf.size -= size
+        self._size -= size
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._rooms:
+            _, buf = self._rooms.popitem(last=False)
+            self._size -= buf.size
+            self._evicted += 1
+
+    def newest(self, room: str, limit: int):
+        """(messages, has_more) for the newest page, or None if memory can't answer"""
+        with self._lock:
+            buf = self._rooms.get(room)
+            if buf is None or not buf.ready:
+                self._misses += 1
+                return None
+            if len(buf.messages) < limit and buf.has_older:
+                # Deletions shrank the buffer below a page; the database has the rest
+                self._misses += 1
+                return None
+            self._rooms.move_to_end(room)
+            self._hits += 1
+            return buf.messages[-limit:], len(buf.messages) > limit or buf.has_older
+
+    def begin_warm(self, room: str):
+        """Start collecting add()/remove() events for a room about to be loaded"""
+        with self._lock:
+            if room not in self._rooms:
+                self._rooms[room] = _RoomBuffer()
+
+    def warm(self, room: str, messages: list, has_older: bool):
+        """Merge the room's newest rows (oldest first) into its buffer and mark it ready"""
+        with self._lock:
+            buf = self._rooms.get(room)
+            if buf is None:
+                # Evicted while loading; the next read starts over
+                return
+            if not buf.ready:
+                buf.has_older = False
+                for message in messages:
+                    if message["id"] not in buf.removed and message["id"] > buf.archived_through:
+                        self._insert(buf, message)
+                buf.has_older = buf.has_older or has_older
+                buf.removed.clear()
+                buf.ready = True
+            self._rooms.move_to_end(room)
+            self._evict()
+
+    def add(self, room: str, message: dict):
+        with self._lock:
+            buf = self._rooms.get(room)
+            if buf is not None:
+                self._insert(buf, message)
+                self._evict()
+
+    def remove(self, room: str, message_id: int):
+        with self._lock:
+            buf = self._rooms.get(room)
+            if buf is None:
+                return
+            if not buf.ready:
+                buf.removed.add(message_id)
+            i = bisect.bisect_left(buf.ids, message_id)
+            if i < len(buf.ids) and buf.ids[i] == message_id:
+                self._pop(buf, i)
+
+    def drop_archived(self, room: str, through_id: int):
+        """Drop a room's messages up to through_id, which the archiver moved out of chat_messages"""
+        with self._lock:
+            buf = self._rooms.get(room)
+            if buf is None:
+                return
+            buf.archived_through = max(buf.archived_through, through_id)
+            while buf.ids and buf.ids[0] <= through_id:
+                self._pop(buf, 0)
+                buf.has_older = True
+            if buf.ready and not buf.ids:
+                # Nothing cached is left; the next read loads the room again
+                del self._rooms[room]
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "rooms": len(self._rooms),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "per_room": self.per_room,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evicted": self._evicted,
+            }
+
+
+class _DayBitmap:
+    __slots__ = ("bits", "ready", "pending")
+
+    def __init__(self):
+        self.bits = 0
+        self.ready = False
+        self.pending = []  # (bit, booked) events received while loading
+
+
+class _RoomSlots:
+    __slots__ = ("bits", "labels", "days")
+
+    def __init__(self):
+        self.bits = {}  # slot label -> bit position
+        self.labels = []  # bit position -> slot label
+        self.days = 0  # cached days of the room
+
+
+class SlotAvailabilityCache:
+    """Booked slots of recently viewed (room, date) pairs, one bitmap each.
+
+    Every distinct slot label of a room ("9-10am", "Locker 2", ...) is given
+    a bit the first time it is seen, so checking a slot is a dict lookup and
+    a bit test and a whole day is a single int. A room's labels are dropped
+    with its last cached day, and a room that collects more than
+    MAX_SLOT_LABELS is reset, so made-up slot names can't grow them forever.
+
+    A day is loaded from the database the first time it is asked for
+    (warm()) and then kept current by book() and release(), which the
+    bookings bus subscriber calls after every commit in this process. Events
+    that arrive while a day is still loading are replayed on top of the
+    loaded rows. Events from other workers arrive a bus poll late and may be
+    out of order with this worker's own, so they invalidate() the day instead
+    and the next request reads it again. Least recently used days are
+    dropped past maxsize.
+    """
+
+    MAX_SLOT_LABELS = 256  # per room
+
+    def __init__(self, maxsize: int = AVAILABILITY_CACHE_DAYS):
+        self.maxsize = maxsize
+        self._days = OrderedDict()  # (room_key, date) -> _DayBitmap, least recently used first
+        self._rooms = {}  # room_key -> _RoomSlots
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        self._invalidated = 0
+
+    def _bit(self, room_key: str, slot: str) -> int:
+        room = self._rooms[room_key]
+        bit = room.bits.get(slot)
+        if bit is None:
+            bit = room.bits[slot] = len(room.labels)
+            room.labels.append(slot)
+        return bit
+
+    def _decode(self, room_key: str, bits: int) -> list:
+        labels = self._rooms[room_key].labels
+        slots = []
+        while bits:
+            low = bits & -bits
+            slots.append(labels[low.bit_length() - 1])
+            bits ^= low
+        return sorted(slots)
+
+    def _add_day(self, key):
+        self._days[key] = _DayBitmap()
+        self._rooms.setdefault(key[0], _RoomSlots()).days += 1
+
+    def _drop_day(self, key):
+        del self._days[key]
+        room = self._rooms[key[0]]
+        room.days -= 1
+        if not room.days:
+            del self._rooms[key[0]]
+
+    def _reset_room(self, room_key: str):
+        for key in [key for key in self._days if key[0] == room_key]:
+            self._drop_day(key)
+
+    def _ready_day(self, room_key: str, date: str):
+        day = self._days.get((room_key, date))
+        if day is None or not day.ready:
+            self._misses += 1
+            return None
+        self._days.move_to_end((room_key, date))
+        self._hits += 1
+        return day
+
+    def booked(self, room_key: str, date: str):
+        """Sorted booked slot labels, or None if the day isn't loaded"""
+        with self._lock:
+            day = self._ready_day(room_key, date)
+            return None if day is None else self._decode(room_key, day.bits)
+
+    def is_booked(self, room_key: str, date: str, slot: str):
+        """True/False, or None if the day isn't loaded"""
+        with self._lock:
+            day = self._ready_day(room_key, date)
+            if day is None:
+                return None
+            bit = self._rooms[room_key].bits.get(slot)
+            return bit is not None and bool(day.bits >> bit & 1)
+
+    def missing(self, keys) -> list:
+        """The (room_key, date) pairs among keys that aren't loaded yet"""
+        with self._lock:
+            return [key for key in keys if key not in self._days or not self._days[key].ready]
+
+    def begin_warm(self, keys):
+        """Start collecting book()/release() events for days about to be loaded"""
+        with self._lock:
+            for key in keys:
+                if key not in self._days:
+                    self._add_day(key)
+            while len(self._days) > self.maxsize:
+                self._drop_day(next(iter(self._days)))
+                self._evicted += 1
+
+    def warm(self, room_key: str, date: str, slots):
+        """Set a day's bitmap from its booked slots as read from the database"""
+        with self._lock:
+            day = self._days.get((room_key, date))
+            if day is None or day.ready:
+                # Evicted or invalidated while loading, or another request loaded it first
+                return
+            bits = 0
+            for slot in slots:
+                bits |= 1 << self._bit(room_key, slot)
+            for bit, booked in day.pending:
+                bits = bits | (1 << bit) if booked else bits & ~(1 << bit)
+            day.bits = bits
+            day.pending = []
+            day.ready = True
+            if len(self._rooms[room_key].labels) > self.MAX_SLOT_LABELS:
+                self._reset_room(room_key)
+
+    def _apply(self, room_key: str, date: str, slot: str, booked: bool):
+        with self._lock:
+            day = self._days.get((room_key, date))
+            if day is None:
+                return
+            bit = self._bit(room_key, slot)
+            if not day.ready:
+                day.pending.append((bit, booked))
+            elif booked:
+                day.bits |= 1 << bit
+            else:
+                day.bits &= ~(1 << bit)
+            if len(self._rooms[room_key].labels) > self.MAX_SLOT_LABELS:
+                self._reset_room(room_key)
+
+    def book(self, room_key: str, date: str, slot: str):
+        self._apply(room_key, date, slot, True)
+
+    def release(self, room_key: str, date: str, slot: str):
+        self._apply(room_key, date, slot, False)
+
+    def invalidate(self, room_key: str, date: str):
+        """Forget a day, including one that is loading, so the next request reads it again"""
+        with self._lock:
+            if (room_key, date) in self._days:
+                self._drop_day((room_key, date))
+                self._invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._rooms.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "days": len(self._days),
+                "maxsize": self.maxsize,
+                "rooms": len(self._rooms),
+                "slot_labels": sum(len(room.labels) for room in self._rooms.values()),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evicted": self._evicted,
+                "invalidated": self._invalidated,
+            }
+
+
+# Authenticated users keyed by student_id; rows are invalidated whenever they change
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# Newest messages of recently read chat rooms, kept current from the chat bus
+room_cache = RoomMessageCache()
+
+# Booked slots per room and day, kept current from the bookings bus
+availability_cache = SlotAvailabilityCache()
@@ -0,0 +1,128 @@
+"""WebSocket fan-out of chat and notification events to connected clients"""
+import asyncio
+import os
+import time
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+SEND_QUEUE_SIZE = int(os.environ.get("PORTAL_WS_SEND_QUEUE", "100"))  # events buffered per connection
+HEARTBEAT_INTERVAL = 25  # seconds between pings to an otherwise idle client
+HEARTBEAT_TIMEOUT = 60  # seconds without any frame from the client before it is dropped
+
+
+class RoomConnection:
+    def __init__(self, websocket: WebSocket, room: str, user_id: int):
+        self.websocket = websocket
+        self.room = room
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.last_seen = time.monotonic()
+
+
+class ChatGateway:
+    """Tracks open sockets per room and pushes events to them.
+
+    A room is a chat room, "notifications:{user_id}" for one user's
+    notification feed, or "broadcasts:{audience}" for notifications sent to
+    a whole audience. A notification socket sits in its user's room and in
+    the rooms of the user's audiences.
+
+    publish() never waits on a client: each connection has a bounded send
+    queue drained by its own task. When a slow client's queue fills up, its
+    backlog is replaced by a single {"type": "resync"} event and the client
+    catches up over HTTP (GET /chat/sync or GET /notifications), so one slow
+    reader can't stall a room or grow memory without bound.
+
+    Clients receive {"type": "message", "message": {...}}, {"type":
+    "deleted", "message_id": N}, {"type": "resync"} and {"type": "ping"};
+    they should answer pings with {"type": "pong"}.
+    """
+
+    def __init__(self):
+        self.rooms = {}  # room -> set of RoomConnection
+
+        # Metrics
+        self._published = 0
+        self._delivered = 0
+        self._overflows = 0
+        self._timeouts = 0
+
+    def publish(self, room: str, event: dict):
+        """Queue an event for every connection in the room (call from the event loop)"""
+        self._published += 1
+        for conn in list(self.rooms.get(room, ())):
+            try:
+                conn.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._overflows += 1
+                while not conn.queue.empty():
+                    conn.queue.get_nowait()
+                conn.queue.put_nowait({"type": "resync"})
+
+    async def serve(self, websocket: WebSocket, room: str, user_id: int, extra_rooms=()):
+        """Run an accepted-for-this-room socket until either side goes away"""
+        await websocket.accept()
+        conn = RoomConnection(websocket, room, user_id)
+        joined = (room, *extra_rooms)
+        for name in joined:
+            self.rooms.setdefault(name, set()).add(conn)
+
+        tasks = [
+            asyncio.create_task(self._send_loop(conn)),
+            asyncio.create_task(self._receive_loop(conn)),
+            asyncio.create_task(self._heartbeat_loop(conn)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Unregister before awaiting anything: if the server is cancelling
+            # this task, the first await below raises straight away
+            for name in joined:
+                members = self.rooms.get(name)
+                if members is not None:
+                    members.discard(conn)
+                    if not members:
+                        del self.rooms[name]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send_loop(self, conn: RoomConnection):
+        while True:
+            event = await conn.queue.get()
+            await conn.websocket.send_json(event)
+            self._delivered += 1
+
+    async def _heartbeat_loop(self, conn: RoomConnection):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - conn.last_seen > HEARTBEAT_TIMEOUT:
+                self._timeouts += 1
+                await conn.websocket.close(code=1001)
+                return
+            if conn.queue.empty():
+                conn.queue.put_nowait({"type": "ping"})
+
+    async def _receive_loop(self, conn: RoomConnection):
+        try:
+            while True:
+                data = await conn.websocket.receive_json()
+                conn.last_seen = time.monotonic()
+                if isinstance(data, dict) and data.get("type") == "ping" and not conn.queue.full():
+                    conn.queue.put_nowait({"type": "pong"})
+        except (WebSocketDisconnect, ValueError):
+            # Client went away or sent something that isn't JSON
+            return
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "connections": sum(len(members) for members in self.rooms.values()),
+            "published": self._published,
+            "delivered": self._delivered,
+            "overflows": self._overflows,
+            "heartbeat_timeouts": self._timeouts,
+        }
+
+
+chat_gateway = ChatGateway()
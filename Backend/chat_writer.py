@@ -0,0 +1,153 @@
+"""Group commit for chat message inserts"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import ConnectionPool
+
+CHAT_BATCH_SIZE = int(os.environ.get("PORTAL_CHAT_BATCH_SIZE", "64"))  # messages per transaction at most
+CHAT_BATCH_DELAY = float(os.environ.get("PORTAL_CHAT_BATCH_DELAY_MS", "5")) / 1000  # seconds a batch stays open
+
+
+def insert_messages(conn, rows: list) -> list:
+    """Insert rows in one transaction and return their ids in order"""
+    cursor = conn.cursor()
+    ids = []
+    try:
+        for row in rows:
+            cursor.execute(
+                """INSERT INTO chat_messages (room, user_id, sender_name, sender_id, content, timestamp, date)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                row
+            )
+            ids.append(cursor.lastrowid)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return ids
+
+
+class ChatWriter:
+    """Writes chat messages in shared transactions, one commit per batch.
+
+    write() queues a message and returns its id once the batch holding it
+    has committed, so a sent message is durable and readable by the time the
+    sender gets its response. A batch is written max_delay after its first
+    message arrived, or straight away once it is full; while one batch
+    commits the next one fills up. Batches use a dedicated connection so
+    senders that hold a pooled connection can never starve the writer.
+    Only touched from the event loop thread, so the counters need no lock.
+    """
+
+    def __init__(self, max_batch: int = CHAT_BATCH_SIZE, max_delay: float = CHAT_BATCH_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pool = ConnectionPool(size=1)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-writer")
+        self._pending = []  # (row, future, queued_at)
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+
+        # Metrics
+        self._batches = 0
+        self._messages = 0
+        self._failures = 0
+        self._max_batch_seen = 0
+        self._total_commit = 0.0
+        self._max_commit = 0.0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Write whatever is still queued, then stop the writer"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self._pool.close()
+
+    async def write(self, room: str, user_id: int, sender_name: str, sender_id: str,
+                    content: str, timestamp: int, date: str) -> int:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((room, user_id, sender_name, sender_id, content, timestamp, date), future, time.monotonic()))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                if self._stopping:
+                    return
+                continue
+            if len(self._pending) < self.max_batch and not self._stopping:
+                # Let concurrent senders join this batch
+                await asyncio.sleep(self.max_delay)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if self._pending or self._stopping:
+                self._wakeup.set()
+            await self._flush(batch)
+
+    def _write_batch(self, rows: list) -> list:
+        with self._pool.connection() as conn:
+            return insert_messages(conn, rows)
+
+    async def _flush(self, batch: list):
+        started = time.monotonic()
+        try:
+            ids = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._write_batch, [row for row, _, _ in batch]
+            )
+        except Exception as e:
+            self._failures += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        for (_, future, queued_at), message_id in zip(batch, ids):
+            latency = finished - queued_at
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+            if not future.done():
+                future.set_result(message_id)
+
+        commit_time = finished - started
+        self._batches += 1
+        self._messages += len(batch)
+        self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        self._total_commit += commit_time
+        self._max_commit = max(self._max_commit, commit_time)
+
+    def stats(self) -> dict:
+        batches, messages = self._batches, self._messages
+        return {
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+            "pending": len(self._pending),
+            "batches": batches,
+            "messages": messages,
+            "failures": self._failures,
+            "avg_batch_size": round(messages / batches, 2) if batches else 0.0,
+            "max_batch_size": self._max_batch_seen,
+            "avg_commit_ms": round(self._total_commit / batches * 1000, 2) if batches else 0.0,
+            "max_commit_ms": round(self._max_commit * 1000, 2),
+            "avg_latency_ms": round(self._total_latency / messages * 1000, 2) if messages else 0.0,
+            "max_latency_ms": round(self._max_latency * 1000, 2),
+        }
+
+
+chat_writer = ChatWriter()
@@ -0,0 +1,505 @@
+"""SQLite connection pool and storage configuration shared by all request handlers"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+# ============================================
+# CONFIGURATION
+# ============================================
+
+DATABASE_PATH = os.environ.get("PORTAL_DB_PATH", "portal.db")
+# Archived chat history, attached to every pooled connection as "archive"
+ARCHIVE_PATH = os.environ.get("PORTAL_ARCHIVE_PATH", os.path.splitext(DATABASE_PATH)[0] + "_archive.db")
+POOL_SIZE = int(os.environ.get("PORTAL_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("PORTAL_DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+HEALTH_CHECK_AFTER = 30  # re-validate connections that sat idle longer than this (seconds)
+DB_WORKERS = int(os.environ.get("PORTAL_DB_WORKERS", str(POOL_SIZE)))  # threads running queries for async handlers
+QUERY_TIMEOUT = float(os.environ.get("PORTAL_DB_QUERY_TIMEOUT", "10"))  # seconds before a statement is interrupted
+STORAGE_PROFILE = os.environ.get("PORTAL_DB_PROFILE", "balanced")
+DEV_MODE = os.environ.get("PORTAL_DEV_MODE", "0") == "1"  # print query-plan advice at startup
+
+# ============================================
+# STORAGE PROFILES
+# ============================================
+
+# All profiles run in WAL mode so chat writers don't block booking readers.
+# They differ in how hard commits are synced to disk and how much memory
+# each pooled connection may use for page cache and memory-mapped I/O.
+STORAGE_PROFILES = {
+    # fsync on every commit - nothing committed is lost even on power failure
+    "safe": {
+        "synchronous": "FULL",
+        "cache_size": -8000,  # negative = KiB, so 8 MB per connection
+        "mmap_size": 0,
+        "wal_autocheckpoint": 1000,  # pages
+        "checkpoint_interval": 60,  # seconds between background checkpoints
+    },
+    # fsync at checkpoints only - a power failure can lose the last few commits, never corrupts
+    "balanced": {
+        "synchronous": "NORMAL",
+        "cache_size": -32000,
+        "mmap_size": 64 * 1024 * 1024,
+        "wal_autocheckpoint": 1000,
+        "checkpoint_interval": 30,
+    },
+    # no fsync at all and checkpoints left entirely to the background thread;
+    # an OS crash or power failure can lose or corrupt recent writes
+    "throughput": {
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "wal_autocheckpoint": 0,
+        "checkpoint_interval": 10,
+    },
+}
+
+JOURNAL_SIZE_LIMIT = 64 * 1024 * 1024  # WAL is truncated back to this size after a checkpoint
+
+
+def get_storage_profile(name: str) -> dict:
+    try:
+        return STORAGE_PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage profile '{name}', expected one of: {', '.join(STORAGE_PROFILES)}"
+        )
+
+
+def connection_pragmas(profile: dict) -> list:
+    """PRAGMAs applied once when a connection is opened, not on every checkout"""
+    return [
+        "PRAGMA busy_timeout = 5000",
+        "PRAGMA temp_store = MEMORY",
+        f"PRAGMA synchronous = {profile['synchronous']}",
+        f"PRAGMA cache_size = {profile['cache_size']}",
+        f"PRAGMA mmap_size = {profile['mmap_size']}",
+        f"PRAGMA wal_autocheckpoint = {profile['wal_autocheckpoint']}",
+        f"PRAGMA journal_size_limit = {JOURNAL_SIZE_LIMIT}",
+    ]
+
+
+def configure_storage(conn):
+    """Switch the database files to WAL; the journal mode persists in the files themselves"""
+    modes = {}
+    for row in conn.execute("PRAGMA database_list").fetchall():
+        schema = row[1]
+        if schema == "temp":
+            continue
+        modes[schema] = conn.execute(f"PRAGMA {schema}.journal_mode = WAL").fetchone()[0]
+        if modes[schema].lower() != "wal":
+            print(f"Warning: could not enable WAL mode, {schema} database is using '{modes[schema]}'")
+    return modes["main"]
+
+# ============================================
+# CONNECTION POOL
+# ============================================
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes free within the pool timeout"""
+
+
+class ConnectionPool:
+    """A bounded set of long-lived sqlite3 connections.
+
+    Connections are opened lazily up to `size`, handed out with acquire()
+    and returned with release(). Callers that find the pool exhausted wait
+    up to `timeout` seconds before PoolTimeoutError is raised.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 profile: str = STORAGE_PROFILE, archive_path: str = ARCHIVE_PATH):
+        self.path = path
+        self.archive_path = archive_path
+        self.size = size
+        self.timeout = timeout
+        self.profile_name = profile
+        self.profile = get_storage_profile(profile)
+        self._pragmas = connection_pragmas(self.profile)
+        self._idle = deque()  # (connection, last_used) pairs, most recently used on the right
+        self._cond = threading.Condition()
+        self._opened = 0
+        self._in_use = 0
+        self._closed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._replaced = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.archive_path:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        for pragma in self._pragmas:
+            conn.execute(pragma)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Check a connection out of the pool, opening or waiting for one if needed"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        last_used = None
+
+        with self._cond:
+            if self._closed:
+                raise PoolTimeoutError("Connection pool is closed")
+            waited = False
+            while True:
+                if self._idle:
+                    # LIFO keeps the hottest connections (and their page caches) busy
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._checkouts += 1
+            wait_time = time.monotonic() - start
+            if waited:
+                self._waits += 1
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - last_used > HEALTH_CHECK_AFTER and not self._is_healthy(conn):
+                self._discard(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._replaced += 1
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted"""
+        reusable = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Closed or broken connection - drop it and let the pool open a new one
+            reusable = False
+
+        with self._cond:
+            self._in_use -= 1
+            if reusable and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._opened -= 1
+                self._discard(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def health_check(self) -> dict:
+        """Validate every idle connection, replacing any that fail"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+
+        healthy = 0
+        replaced = 0
+        checked = []
+        for conn, _ in idle:
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                conn = self._connect()
+                replaced += 1
+            healthy += 1
+            checked.append((conn, time.monotonic()))
+
+        with self._cond:
+            self._idle.extend(checked)
+            self._replaced += replaced
+            self._cond.notify_all()
+
+        return {"checked": len(idle), "healthy": healthy, "replaced": replaced}
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "profile": self.profile_name,
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "replaced": self._replaced,
+                "avg_wait_ms": round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+    def close(self):
+        """Close all idle connections; checked-out ones are closed when released"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._opened -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+# ============================================
+# BACKGROUND CHECKPOINTER
+# ============================================
+
+class WalCheckpointer:
+    """Periodically checkpoints the WAL so it doesn't grow without bound.
+
+    Runs PASSIVE checkpoints (never blocks readers or writers) on its own
+    connection, and escalates to TRUNCATE once the -wal file has grown past
+    JOURNAL_SIZE_LIMIT, e.g. after long-lived readers held it open.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, interval: float = 30):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._failures = 0
+        self._last = None
+
+    def _wal_size(self) -> int:
+        try:
+            return os.path.getsize(self.path + "-wal")
+        except OSError:
+            return 0
+
+    def checkpoint(self, mode: str = "PASSIVE") -> dict:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        finally:
+            conn.close()
+        result = {
+            "mode": mode,
+            "busy": bool(busy),
+            "log_frames": log_frames,
+            "checkpointed_frames": checkpointed,
+            "at": time.time(),
+        }
+        with self._lock:
+            self._runs += 1
+            self._last = result
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            mode = "TRUNCATE" if self._wal_size() > JOURNAL_SIZE_LIMIT else "PASSIVE"
+            try:
+                self.checkpoint(mode)
+            except sqlite3.Error as e:
+                with self._lock:
+                    self._failures += 1
+                print(f"Warning: WAL checkpoint failed: {str(e)}")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="wal-checkpointer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "runs": self._runs,
+                "failures": self._failures,
+                "wal_bytes": self._wal_size(),
+                "last": self._last,
+            }
+
+
+# ============================================
+# ASYNC ACCESS
+# ============================================
+
+class QueryTimeoutError(Exception):
+    """Raised when a statement runs longer than its timeout and is interrupted"""
+
+
+class AsyncCursor:
+    """Awaitable counterpart of sqlite3.Cursor; every call runs on the database executor"""
+
+    def __init__(self, conn: "AsyncConnection", cursor):
+        self._conn = conn
+        self._cursor = cursor
+
+    async def execute(self, sql: str, params=(), timeout: float = None):
+        await self._conn._run(self._cursor.execute, sql, params, timeout=timeout)
+        return self
+
+    async def executemany(self, sql: str, seq_of_params, timeout: float = None):
+        await self._conn._run(self._cursor.executemany, sql, seq_of_params, timeout=timeout)
+        return self
+
+    async def fetchone(self):
+        return await self._conn._run(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await self._conn._run(self._cursor.fetchall)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+
+class AsyncConnection:
+    """Wraps a pooled sqlite3 connection so handlers can await queries.
+
+    Statements run on a dedicated thread pool instead of the event loop.
+    A statement that outlives its timeout is interrupted with
+    sqlite3.Connection.interrupt() and QueryTimeoutError is raised once the
+    worker thread has let go of the connection.
+    """
+
+    def __init__(self, conn, executor, timeout: float = QUERY_TIMEOUT):
+        self.raw = conn
+        self._executor = executor
+        self.timeout = timeout
+
+    async def _run(self, fn, *args, timeout: float = None):
+        timeout = timeout or self.timeout
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.raw.interrupt()
+            try:
+                await future
+            except sqlite3.OperationalError:
+                pass
+            raise QueryTimeoutError(f"Query did not finish within {timeout}s")
+
+    def cursor(self):
+        return AsyncCursor(self, self.raw.cursor())
+
+    async def execute(self, sql: str, params=(), timeout: float = None):
+        return await self.cursor().execute(sql, params, timeout=timeout)
+
+    async def commit(self):
+        await self._run(self.raw.commit)
+
+    async def rollback(self):
+        await self._run(self.raw.rollback)
+
+    async def transaction(self, fn, *args, timeout: float = None):
+        """Run fn(raw_connection, *args) and commit, as a single job on the executor.
+
+        The write lock is taken and released inside that one job. A transaction
+        spread over several awaits can be left holding the lock while its next
+        statement waits for a query thread - one that may itself be waiting
+        for the lock. fn's exceptions roll the transaction back.
+        """
+        def run():
+            try:
+                result = fn(self.raw, *args)
+                self.raw.commit()
+                return result
+            except BaseException:
+                self.raw.rollback()
+                raise
+        return await self._run(run, timeout=timeout)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.raw.in_transaction
+
+
+class AsyncDatabase:
+    """Checks pooled connections out as AsyncConnections"""
+
+    def __init__(self, pool: ConnectionPool, workers: int = DB_WORKERS, timeout: float = QUERY_TIMEOUT):
+        self.pool = pool
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+
+    async def acquire(self) -> AsyncConnection:
+        # Waiting for a free connection can block for up to the pool timeout, so it
+        # happens on the default executor rather than tying up a query thread
+        conn = await asyncio.get_running_loop().run_in_executor(None, self.pool.acquire)
+        return AsyncConnection(conn, self._executor, self.timeout)
+
+    async def release(self, conn: AsyncConnection):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.pool.release, conn.raw)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Short checkout for code outside the request dependencies (e.g. websockets)"""
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+db_pool = ConnectionPool()
+db = AsyncDatabase(db_pool)
+checkpointer = WalCheckpointer(interval=db_pool.profile["checkpoint_interval"])
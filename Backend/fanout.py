@@ -0,0 +1,200 @@
+"""Sends one notification to many users in the background"""
+import asyncio
+import os
+import time
+
+from database import db
+
+FANOUT_CHUNK_SIZE = int(os.environ.get("PORTAL_FANOUT_CHUNK_SIZE", "1000"))  # notifications inserted per transaction
+CHUNK_PAUSE = 0.01  # seconds between chunks so request writes get the lock
+
+# Who a fan-out goes to: a query selecting user ids as "id", taking the
+# fan-out's audience_arg as its parameter when it has one. Notices for every
+# student or every non-admin are broadcast rows instead (see main.py), so
+# only per-course audiences fan out.
+AUDIENCES = {
+    "course": """SELECT DISTINCT student_id AS id FROM course_registrations
+                 WHERE course_id = ? AND status = 'approved'""",
+}
+
+
+def audience_query(job) -> tuple:
+    if job["audience"] not in AUDIENCES:
+        # Left over from an audience that has since become a broadcast
+        raise ValueError(f"Unknown notification audience '{job['audience']}'")
+    params = () if job["audience_arg"] is None else (job["audience_arg"],)
+    return AUDIENCES[job["audience"]], params
+
+
+async def create_fanout(cursor, audience: str, audience_arg, notification_type: str, title: str,
+                        message: str, created_by: int) -> int:
+    """Record a fan-out in the caller's transaction; submit() it after the commit"""
+    if audience not in AUDIENCES:
+        raise ValueError(f"Unknown notification audience '{audience}'")
+    await cursor.execute(
+        """INSERT INTO notification_fanouts (audience, audience_arg, type, title, message, created_by)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (audience, audience_arg, notification_type, title, message, created_by)
+    )
+    return cursor.lastrowid
+
+
+def begin_fanout(raw_conn, fanout_id: int, now: float):
+    """Mark a fan-out running and count its recipients; None if there is nothing left to do"""
+    raw_conn.execute("BEGIN IMMEDIATE")
+    job = raw_conn.execute("SELECT * FROM notification_fanouts WHERE id = ?", (fanout_id,)).fetchone()
+    if job is None or job["status"] in ("done", "failed"):
+        return None
+    total = job["total"]
+    if total is None:
+        sql, params = audience_query(job)
+        total = raw_conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    raw_conn.execute(
+        """UPDATE notification_fanouts SET status = 'running', total = ?, started_at = COALESCE(started_at, ?)
+           WHERE id = ?""",
+        (total, now, fanout_id)
+    )
+    return job
+
+
+def send_chunk(raw_conn, fanout_id: int, chunk_size: int, now: float) -> list:
+    """Insert the next chunk of a fan-out's notifications and return the recipients.
+
+    The chunk starts after the last user id recorded with the progress, read
+    under the write lock, so a fan-out resumed after a restart (or run by two
+    workers at once) never notifies anyone twice. An empty chunk finishes it.
+    """
+    raw_conn.execute("BEGIN IMMEDIATE")
+    job = raw_conn.execute("SELECT * FROM notification_fanouts WHERE id = ?", (fanout_id,)).fetchone()
+    if job["status"] != "running":
+        return []
+    sql, params = audience_query(job)
+    user_ids = [row[0] for row in raw_conn.execute(
+        f"""INSERT INTO notifications (user_id, type, title, message)
+            SELECT id, ?, ?, ? FROM ({sql}) WHERE id > ? ORDER BY id LIMIT ?
+            RETURNING user_id""",
+        (job["type"], job["title"], job["message"], *params, job["last_user_id"], chunk_size)
+    ).fetchall()]
+    if user_ids:
+        raw_conn.execute(
+            "UPDATE notification_fanouts SET sent = sent + ?, last_user_id = ? WHERE id = ?",
+            (len(user_ids), max(user_ids), fanout_id)
+        )
+    else:
+        raw_conn.execute(
+            "UPDATE notification_fanouts SET status = 'done', finished_at = ? WHERE id = ?",
+            (now, fanout_id)
+        )
+    return user_ids
+
+
+def fail_fanout(raw_conn, fanout_id: int, error: str, now: float):
+    raw_conn.execute(
+        "UPDATE notification_fanouts SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+        (error, now, fanout_id)
+    )
+
+
+class NotificationFanout:
+    """Works through queued fan-outs one at a time on the event loop.
+
+    Each chunk is one INSERT ... SELECT over the audience query, committed
+    together with the fan-out's progress, and its recipients are pushed to
+    their sockets through publish(user_ids, type, title, message) right
+    after. The endpoint that queued a fan-out returns straight away; its
+    progress is in the notification_fanouts row. Fan-outs left unfinished
+    by a restart are picked up again at startup.
+    """
+
+    def __init__(self, chunk_size: int = FANOUT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._publish = None
+        self._queue = None
+        self._task = None
+
+        # Metrics
+        self._completed = 0
+        self._failures = 0
+        self._sent = 0
+        self._chunks = 0
+        self._total_duration = 0.0
+        self._max_duration = 0.0
+        self._last = None
+
+    async def start(self, publish):
+        self._publish = publish
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        async with db.connection() as conn:
+            cursor = conn.cursor()
+            await cursor.execute("SELECT id FROM notification_fanouts WHERE status IN ('pending', 'running') ORDER BY id")
+            for row in await cursor.fetchall():
+                self.submit(row["id"])
+
+    async def stop(self):
+        """Stop after the current chunk; the rest resumes at the next startup"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, fanout_id: int):
+        self._queue.put_nowait(fanout_id)
+
+    async def _run(self):
+        while True:
+            fanout_id = await self._queue.get()
+            try:
+                await self._fan_out(fanout_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failures += 1
+                print(f"Warning: notification fan-out {fanout_id} failed: {str(e)}")
+                try:
+                    async with db.connection() as conn:
+                        await conn.transaction(fail_fanout, fanout_id, str(e), time.time())
+                except Exception:
+                    pass
+
+    async def _fan_out(self, fanout_id: int):
+        async with db.connection() as conn:
+            job = await conn.transaction(begin_fanout, fanout_id, time.time())
+        if job is None:
+            return
+        started = time.monotonic()
+        sent = 0
+        while True:
+            # A fresh checkout per chunk so a long fan-out doesn't keep a connection from requests
+            async with db.connection() as conn:
+                user_ids = await conn.transaction(send_chunk, fanout_id, self.chunk_size, time.time())
+            if not user_ids:
+                break
+            sent += len(user_ids)
+            self._sent += len(user_ids)
+            self._chunks += 1
+            self._publish(user_ids, job["type"], job["title"], job["message"])
+            await asyncio.sleep(CHUNK_PAUSE)
+
+        duration = time.monotonic() - started
+        self._completed += 1
+        self._total_duration += duration
+        self._max_duration = max(self._max_duration, duration)
+        self._last = {"id": fanout_id, "sent": sent, "duration_ms": round(duration * 1000, 1)}
+
+    def stats(self) -> dict:
+        completed = self._completed
+        return {
+            "chunk_size": self.chunk_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "completed": completed,
+            "failures": self._failures,
+            "sent": self._sent,
+            "chunks": self._chunks,
+            "avg_duration_ms": round(self._total_duration / completed * 1000, 1) if completed else 0.0,
+            "max_duration_ms": round(self._max_duration * 1000, 1),
+            "last": self._last,
+        }
+
+
+notification_fanout = NotificationFanout()
@@ -0,0 +1,100 @@
+"""Expiry timers for booking holds"""
+import asyncio
+import heapq
+import os
+import time
+
+HOLD_SECONDS = float(os.environ.get("PORTAL_BOOKING_HOLD_SECONDS", "120"))  # how long a hold reserves its slot
+RETRY_DELAY = 1.0  # seconds before retrying holds whose expiry failed
+
+
+class HoldExpiry:
+    """Calls expire(hold_ids) for booking holds once their deadline passes.
+
+    Deadlines wait in a heap and one event loop timer is armed for the
+    earliest, so the holds table is never scanned: when the timer fires,
+    every due hold is popped and expired in a single call, and the timer is
+    re-armed for the next deadline. Holds confirmed or released early stay
+    in the heap, so expire() must skip ids that are gone or not yet due.
+    Only touched from the event loop thread.
+    """
+
+    def __init__(self):
+        self._heap = []  # (expires_at, hold_id), expires_at in wall-clock seconds
+        self._expire = None
+        self._timer = None
+        self._timer_at = None
+        self._tasks = set()
+
+        # Metrics
+        self._scheduled = 0
+        self._fired = 0
+        self._failures = 0
+        self._max_lateness = 0.0
+
+    def start(self, expire):
+        self._expire = expire
+        self._arm()
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        self._expire = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def schedule(self, hold_id: int, expires_at: float):
+        heapq.heappush(self._heap, (expires_at, hold_id))
+        self._scheduled += 1
+        if self._timer_at is None or expires_at < self._timer_at:
+            self._arm()
+
+    def _arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        if self._heap and self._expire is not None:
+            loop = asyncio.get_running_loop()
+            self._timer_at = self._heap[0][0]
+            # The loop's clock is monotonic while deadlines are wall-clock times
+            self._timer = loop.call_at(loop.time() + max(0.0, self._timer_at - time.time()), self._fire)
+
+    def _fire(self):
+        self._timer = self._timer_at = None
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, hold_id = heapq.heappop(self._heap)
+            self._max_lateness = max(self._max_lateness, now - expires_at)
+            due.append(hold_id)
+        if due:
+            self._fired += len(due)
+            task = asyncio.get_running_loop().create_task(self._run(due))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._arm()
+
+    async def _run(self, hold_ids: list):
+        try:
+            await self._expire(hold_ids)
+        except Exception as e:
+            self._failures += 1
+            print(f"Warning: expiring booking holds failed: {str(e)}")
+            if self._expire is not None:
+                for hold_id in hold_ids:
+                    self.schedule(hold_id, time.time() + RETRY_DELAY)
+
+    def stats(self) -> dict:
+        return {
+            "hold_seconds": HOLD_SECONDS,
+            "pending": len(self._heap),
+            "next_expiry_in": round(self._heap[0][0] - time.time(), 3) if self._heap else None,
+            "scheduled": self._scheduled,
+            "fired": self._fired,
+            "failures": self._failures,
+            "max_lateness_ms": round(self._max_lateness * 1000, 2),
+        }
+
+
+hold_expiry = HoldExpiry()
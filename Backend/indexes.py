@@ -0,0 +1,217 @@
+"""Secondary indexes for the hot query paths and a query-plan advisor"""
+import sqlite3
+import sys
+
+from database import DATABASE_PATH
+
+# The secondary indexes a fully migrated database has, i.e. every index whose
+# name starts with this prefix. Migrations create and drop their own indexes
+# with explicit statements, so replaying an old migration always does what it
+# did when it shipped; a change here goes with a migration that makes it.
+# check_indexes() compares a database against this list.
+MANAGED_PREFIX = "idx_"
+
+MANAGED_INDEXES = {
+    # chat history pages: one room, keyset-paginated by id
+    "idx_chat_messages_room_id": "chat_messages(room, id)",
+    # chat sync: deletions in one room since a client's tombstone cursor
+    "idx_chat_message_tombstones_room_id": "chat_message_tombstones(room, id)",
+    # get_notifications and get_unread_count
+    "idx_notifications_user_read_created": "notifications(user_id, is_read, created_at)",
+    # broadcasts merged into get_notifications and get_unread_count
+    "idx_broadcast_notifications_created_audience": "broadcast_notifications(created_at, audience)",
+    # per-user "max 2 per category" quota check, upcoming bookings only
+    "idx_bookings_user_room_date": "bookings(user_id, room_key, booking_date)",
+    # booking expiry: bookings whose day has passed
+    "idx_bookings_date": "bookings(booking_date)",
+    # active users on the dashboard
+    "idx_booking_history_created": "booking_history(created_at)",
+    # holds count toward the same quota
+    "idx_booking_holds_user_room": "booking_holds(user_id, room_key)",
+    # waitlist of one slot in FIFO order, for promotion on cancel
+    "idx_booking_waitlist_slot": "booking_waitlist(room_key, booking_date, time_slot, id)",
+    # a user's own waitlist entries
+    "idx_booking_waitlist_user": "booking_waitlist(user_id)",
+    # admin registration queue filtered by status, newest first
+    "idx_course_registrations_status_created": "course_registrations(status, created_at)",
+    # course roster and attendance fan-out: approved students of one course
+    "idx_course_registrations_course_status": "course_registrations(course_id, status)",
+}
+
+# Upcoming bookings plus unexpired holds of one user in one room. main.py
+# runs this text, so the advisor always checks the plan the app uses.
+BOOKING_QUOTA_SQL = """SELECT (SELECT COUNT(*) FROM bookings WHERE user_id = ? AND room_key = ? AND booking_date >= ?)
+                + (SELECT COUNT(*) FROM booking_holds WHERE user_id = ? AND room_key = ? AND expires_at > ?)"""
+
+# Queries the advisor checks, with sample parameters to bind
+HOT_QUERIES = {
+    "get_chat_messages": (
+        "SELECT * FROM chat_messages WHERE room = ? ORDER BY id DESC LIMIT ?",
+        ("year1", 51),
+    ),
+    "get_chat_messages_before": (
+        "SELECT * FROM chat_messages WHERE room = ? AND id < ? ORDER BY id DESC LIMIT ?",
+        ("year1", 1000, 51),
+    ),
+    "get_chat_messages_after": (
+        "SELECT * FROM chat_messages WHERE room = ? AND id > ? ORDER BY id LIMIT ?",
+        ("year1", 1000, 51),
+    ),
+    "sync_chat_tombstones": (
+        "SELECT id, message_id FROM chat_message_tombstones WHERE room = ? AND id > ? ORDER BY id",
+        ("year1", 10),
+    ),
+    "get_notifications": (
+        "SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC LIMIT 50",
+        (1,),
+    ),
+    "get_unread_count": (
+        "SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = 0",
+        (1,),
+    ),
+    "get_broadcasts": (
+        """SELECT -b.id, b.type, b.title, b.message,
+                  EXISTS (SELECT 1 FROM broadcast_reads r WHERE r.user_id = ? AND r.broadcast_id = b.id),
+                  b.created_at
+           FROM broadcast_notifications b
+           WHERE b.audience IN (?, ?) AND b.created_at >= ?
+           ORDER BY b.created_at DESC
+           LIMIT 50""",
+        (1, "non_admins", "students", "2025-01-01"),
+    ),
+    "get_unread_broadcasts": (
+        """SELECT COUNT(*) FROM broadcast_notifications b
+           WHERE b.audience IN (?, ?) AND b.created_at >= ?
+             AND NOT EXISTS (SELECT 1 FROM broadcast_reads r WHERE r.user_id = ? AND r.broadcast_id = b.id)""",
+        ("non_admins", "students", "2025-01-01", 1),
+    ),
+    "load_availability": (
+        """SELECT room_key, booking_date, time_slot FROM bookings
+           WHERE room_key IN (?, ?) AND booking_date BETWEEN ? AND ?
+           UNION ALL
+           SELECT room_key, booking_date, time_slot FROM booking_holds
+           WHERE room_key IN (?, ?) AND booking_date BETWEEN ? AND ? AND expires_at > ?""",
+        ("meeting", "kitchen", "2025-01-01", "2025-01-07", "meeting", "kitchen", "2025-01-01", "2025-01-07", 0),
+    ),
+    "booking_quota_used": (
+        BOOKING_QUOTA_SQL,
+        (1, "meeting", "2025-01-01", 1, "meeting", 0),
+    ),
+    "promote_from_waitlist": (
+        """SELECT * FROM booking_waitlist
+           WHERE room_key = ? AND booking_date = ? AND time_slot = ?
+           ORDER BY id""",
+        ("meeting", "2025-01-01", "9-10am"),
+    ),
+    "expire_bookings": (
+        "SELECT id FROM bookings WHERE booking_date < ? ORDER BY booking_date LIMIT ?",
+        ("2025-01-01", 1000),
+    ),
+    "get_course_registrations": (
+        """SELECT cr.*, u.name, u.student_id AS user_student_id, c.code, c.title, c.credits
+           FROM course_registrations cr
+           JOIN users u ON cr.student_id = u.id
+           JOIN courses c ON cr.course_id = c.id
+           WHERE cr.status = ?
+           ORDER BY cr.created_at DESC""",
+        ("pending",),
+    ),
+    "get_course_students": (
+        """SELECT cr.student_id, u.student_id AS user_student_id, u.name, cr.semester, cr.year
+           FROM course_registrations cr
+           JOIN users u ON cr.student_id = u.id
+           WHERE cr.course_id = ? AND cr.status = 'approved'
+           ORDER BY u.student_id""",
+        (1,),
+    ),
+}
+
+
+def managed_indexes(conn) -> set:
+    # Compared with substr, not LIKE: in LIKE 'idx_%' the "_" matches any character
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND substr(name, 1, ?) = ?",
+        (len(MANAGED_PREFIX), MANAGED_PREFIX)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def check_indexes(conn) -> dict:
+    """Managed indexes a database lacks, and prefixed ones MANAGED_INDEXES doesn't list"""
+    existing = managed_indexes(conn)
+    return {
+        "missing": sorted(set(MANAGED_INDEXES) - existing),
+        "unexpected": sorted(existing - set(MANAGED_INDEXES)),
+    }
+
+
+def ensure_indexes(conn) -> dict:
+    """Force a database's managed indexes to match MANAGED_INDEXES (development only; caller commits).
+
+    Migrations never call this: they carry their own CREATE/DROP INDEX
+    statements. It is for scratch databases and for trying out an index
+    before writing the migration that ships it.
+    """
+    drift = check_indexes(conn)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+
+    created = []
+    analyze = set()
+    for name in drift["missing"]:
+        target = MANAGED_INDEXES[name]
+        table = target.split("(")[0]
+        if table in tables:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+            created.append(name)
+            analyze.add(table)
+
+    for name in drift["unexpected"]:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    # Fresh statistics for the tables that gained an index, not the whole database
+    for table in sorted(analyze):
+        conn.execute(f"ANALYZE {table}")
+    return {"created": created, "dropped": drift["unexpected"]}
+
+
+def explain_hot_queries(conn) -> list:
+    """Run EXPLAIN QUERY PLAN over every registered query and flag full scans"""
+    report = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        # "SCAN t" reads the whole table; "SEARCH t USING INDEX" is what we want.
+        # Temp b-tree sorts are reported too, but they only sort the rows the
+        # index already narrowed down, so they aren't treated as problems.
+        # A SELECT without FROM (e.g. a sum of subqueries) shows up as
+        # "SCAN CONSTANT ROW", which reads no table.
+        warnings = [step for step in plan if step.startswith("SCAN ") and step != "SCAN CONSTANT ROW"]
+        sorts = [step for step in plan if step.startswith("USE TEMP B-TREE")]
+        report.append({"query": name, "plan": plan, "warnings": warnings, "sorts": sorts})
+    return report
+
+
+def print_advice(conn):
+    drift = check_indexes(conn)
+    if drift["missing"] or drift["unexpected"]:
+        print(f"Warning: indexes differ from indexes.py: missing {drift['missing']}, unexpected {drift['unexpected']}")
+    for entry in explain_hot_queries(conn):
+        if entry["warnings"]:
+            print(f"Warning: query '{entry['query']}' scans a whole table:")
+            for step in entry["warnings"]:
+                print(f"    {step}")
+
+
+if __name__ == "__main__":
+    # python indexes.py [path/to/portal.db]
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DATABASE_PATH)
+    drift = check_indexes(conn)
+    for name in drift["missing"]:
+        print(f"[MISSING] {name} ON {MANAGED_INDEXES[name]}")
+    for name in drift["unexpected"]:
+        print(f"[UNEXPECTED] {name}")
+    for entry in explain_hot_queries(conn):
+        status = "WARN" if entry["warnings"] else "OK"
+        print(f"[{status}] {entry['query']}")
+        for step in entry["plan"]:
+            print(f"    {step}")
+    conn.close()
@@ -1,16 +1,31 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, Query, status, Request, WebSocket
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 from jose import JWTError, jwt
+from database import db, db_pool, checkpointer, configure_storage, PoolTimeoutError, QueryTimeoutError, DEV_MODE
+from indexes import print_advice, BOOKING_QUOTA_SQL
+from migrate import run_migrations
+from passwords import password_hasher, HashPoolBusy
+from cache import user_cache, room_cache, availability_cache
+from chat_realtime import chat_gateway
+from bus import bus
+from archive import chat_archiver, ensure_archive_schema, read_archive, has_archived, delete_archived
+from chat_writer import chat_writer
+from holds import hold_expiry, HOLD_SECONDS
+from booking_history import booking_expirer
+from fanout import notification_fanout, create_fanout
+import asyncio
 import sqlite3
 import json
 import hashlib
-import bcrypt
+import html
+import time
 import traceback
 
 # ============================================
@@ -20,8 +35,41 @@ import traceback
 SECRET_KEY = "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
-
-app = FastAPI(title=" Booking System API")
+YEAR_ROOMS = {1: "year1", 2: "year2", 3: "year3", 4: "year4"}
+CHAT_PAGE_SIZE = 50  # messages per page when the client doesn't ask for a limit
+CHAT_PAGE_MAX = 200
+CHAT_SEARCH_PAGE_SIZE = 20
+CHAT_SEARCH_PAGE_MAX = 50
+BOOKINGS_PER_ROOM = 2  # bookings one user may hold for the same room
+AVAILABILITY_MAX_DAYS = 62  # longest date range of one availability request
+AVAILABILITY_MAX_ROOMS = 20
+RECURRENCE_STEPS = {"daily": 1, "weekly": 7}  # days between occurrences at interval 1
+RECURRING_BOOKING_MAX = 100  # occurrences one recurring request may create
+UNREAD_COUNT_CAP = 999  # unread counts stop here, so a never-opened room costs at most this many index entries
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    checkpointer.start()
+    bus.start()
+    chat_archiver.start(publish_archived_messages)
+    booking_expirer.start(publish_expired_bookings)
+    chat_writer.start()
+    hold_expiry.start(expire_booking_holds)
+    await schedule_booking_holds()
+    await notification_fanout.start(publish_notifications)
+    yield
+    await notification_fanout.stop()
+    await hold_expiry.stop()
+    await chat_writer.stop()
+    booking_expirer.stop()
+    chat_archiver.stop()
+    bus.stop()
+    checkpointer.stop()
+    password_hasher.shutdown()
+    db.shutdown()
+    db_pool.close()
+
+app = FastAPI(title=" Booking System API", lifespan=lifespan)
 
 # Global exception handler to ensure JSON responses
 @app.exception_handler(Exception)
@@ -37,6 +85,14 @@ async def global_exception_handler(request: Request, exc: Exception):
         }
     )
 
+@app.exception_handler(QueryTimeoutError)
+async def query_timeout_handler(request: Request, exc: QueryTimeoutError):
+    """Report interrupted long-running queries as a gateway timeout"""
+    return JSONResponse(
+        status_code=504,
+        content={"detail": "Database query timed out"}
+    )
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """Handle validation errors"""
@@ -66,233 +122,40 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # DATABASE SETUP
 # ============================================
 
-def get_db():
-    conn = sqlite3.connect("portal.db")
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Users table - Updated with role and profile_photo
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            email TEXT,
-            password_hash TEXT NOT NULL,
-            role TEXT DEFAULT 'student' CHECK(role IN ('student', 'admin')),
-            year INTEGER NOT NULL,
-            profile_photo TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # Add role and email columns if they don't exist (for existing databases)
+async def acquire_db():
     try:
-        cursor.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'student'")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
-    
+        return await db.acquire()
+    except PoolTimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please try again"
+        )
+
+async def get_db():
+    """Check a pooled connection out for the duration of a request"""
+    conn = await acquire_db()
     try:
-        cursor.execute("ALTER TABLE users ADD COLUMN email TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
+        yield conn
+    finally:
+        await db.release(conn)
+
+@asynccontextmanager
+async def short_db():
+    """Brief checkout for handlers that must not hold a connection while they wait
+    on something else (e.g. password hashing)"""
+    conn = await acquire_db()
     try:
-        cursor.execute("ALTER TABLE users ADD COLUMN profile_photo TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    # Courses table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS courses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT UNIQUE NOT NULL,
-            title TEXT NOT NULL,
-            credits INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # Course Registrations table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS course_registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            course_id INTEGER NOT NULL,
-            semester TEXT NOT NULL,
-            year INTEGER NOT NULL,
-            status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'approved', 'rejected')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id),
-            UNIQUE(student_id, course_id, semester, year)
-        )
-    """)
-    
-    # Grades table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS grades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER NOT NULL,
-            course_id INTEGER NOT NULL,
-            grade TEXT NOT NULL,
-            semester TEXT NOT NULL,
-            year INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES users(id),
-            FOREIGN KEY (course_id) REFERENCES courses(id),
-            UNIQUE(student_id, course_id, semester, year)
-        )
-    """)
-    
-    # Notifications table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            title TEXT NOT NULL,
-            message TEXT NOT NULL,
-            is_read INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    """)
-    
-    # Announcements table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS announcements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            admin_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (admin_id) REFERENCES users(id)
-        )
-    """)
-    
-    # Bookings table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            room_key TEXT NOT NULL,
-            room_name TEXT NOT NULL,
-            booking_date TEXT NOT NULL,
-            time_slot TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    """)
-    
-    # Chat messages table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room TEXT NOT NULL,
-            user_id INTEGER NOT NULL,
-            sender_name TEXT NOT NULL,
-            sender_id TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp INTEGER NOT NULL,
-            date TEXT NOT NULL
-        )
-    """)
-    
-    # Course chatrooms table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS course_chatrooms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            course_id INTEGER NOT NULL,
-            room_key TEXT UNIQUE NOT NULL,
-            created_by INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
-            FOREIGN KEY (created_by) REFERENCES users(id)
-        )
-    """)
-    
-    # Course chatroom members table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS course_chatroom_members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            role TEXT DEFAULT 'member' CHECK(role IN ('admin', 'member')),
-            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (room_id) REFERENCES course_chatrooms(id) ON DELETE CASCADE,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            UNIQUE(room_id, user_id)
-        )
-    """)
-    
-    # Attendance sessions table (created by admin)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS attendance_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            course_id INTEGER NOT NULL,
-            course_code TEXT NOT NULL,
-            course_title TEXT NOT NULL,
-            session_date TEXT NOT NULL,
-            time_slot TEXT NOT NULL,
-            created_by INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (course_id) REFERENCES courses(id),
-            FOREIGN KEY (created_by) REFERENCES users(id)
-        )
-    """)
-    
-    # Attendance records table (student check-ins)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS attendance_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL,
-            student_id INTEGER NOT NULL,
-            student_student_id TEXT NOT NULL,
-            student_name TEXT NOT NULL,
-            checked_in_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (session_id) REFERENCES attendance_sessions(id) ON DELETE CASCADE,
-            FOREIGN KEY (student_id) REFERENCES users(id),
-            UNIQUE(session_id, student_id)
-        )
-    """)
-    
-    # Events table (created by admin)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_name TEXT NOT NULL,
-            event_date TEXT NOT NULL,
-            time_slot TEXT NOT NULL,
-            created_by INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (created_by) REFERENCES users(id)
-        )
-    """)
-    
-    # Event attendance records table (student attendances)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS event_attendance_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            student_id INTEGER NOT NULL,
-            student_student_id TEXT NOT NULL,
-            student_name TEXT NOT NULL,
-            attended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (event_id) REFERENCES events(id) ON DELETE CASCADE,
-            FOREIGN KEY (student_id) REFERENCES users(id),
-            UNIQUE(event_id, student_id)
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+        yield conn
+    finally:
+        await db.release(conn)
+
+def init_db():
+    with db_pool.connection() as conn:
+        configure_storage(conn)
+        run_migrations(conn)
+        ensure_archive_schema(conn)
+        if DEV_MODE:
+            print_advice(conn)
 
 # Initialize database on startup
 init_db()
@@ -343,6 +206,36 @@ class BookingResponse(BaseModel):
     student_id: str
     created_at: str
 
+class BookingRoom(BaseModel):
+    room_key: str
+    room_name: str
+
+class RecurringBookingCreate(BaseModel):
+    rooms: List[BookingRoom]
+    time_slot: str
+    start_date: str
+    end_date: str  # inclusive
+    frequency: str = "weekly"  # "daily" or "weekly"
+    interval: int = 1  # every `interval` days or weeks
+
+class WaitlistEntryResponse(BaseModel):
+    id: int
+    room_key: str
+    room_name: str
+    booking_date: str
+    time_slot: str
+    position: int  # 1 = next in line
+    created_at: str
+
+class BookingHoldResponse(BaseModel):
+    id: int
+    room_key: str
+    room_name: str
+    booking_date: str
+    time_slot: str
+    expires_at: float  # Unix time
+    expires_in: float  # seconds left
+
 class ChatMessage(BaseModel):
     room: str
     content: str
@@ -356,6 +249,13 @@ class ChatMessageResponse(BaseModel):
     timestamp: int
     date: str
 
+class ChatReadCursor(BaseModel):
+    last_read_id: int
+
+class ChatSearchResult(ChatMessageResponse):
+    highlighted: str  # HTML-escaped content with matches wrapped in <mark>
+    rank: float  # bm25 score, lower is a better match
+
 # New models for University System
 class CourseCreate(BaseModel):
     code: str
@@ -417,13 +317,25 @@ class TranscriptResponse(BaseModel):
     gpa: float
 
 class NotificationResponse(BaseModel):
-    id: int
+    id: int  # negative for broadcasts (announcements, events) shared by many users
     type: str
     title: str
     message: str
     is_read: bool
     created_at: str
 
+class NotificationFanoutResponse(BaseModel):
+    id: int
+    type: str
+    title: str
+    status: str  # pending, running, done or failed
+    total: Optional[int] = None  # recipients, known once the fan-out starts
+    sent: int
+    progress: float  # 0 to 1
+    error: Optional[str] = None
+    created_at: str
+    duration_ms: Optional[float] = None
+
 class AnnouncementCreate(BaseModel):
     title: str
     content: str
@@ -478,11 +390,24 @@ class UserActivityStats(BaseModel):
 # ============================================
 
 
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def hashing_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HashPoolBusy:
+        raise hashing_busy_exception()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashPoolBusy:
+        raise hashing_busy_exception()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -495,15 +420,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user_by_student_id(student_id: str):
-    conn = get_db()
+async def get_user_by_student_id(conn, student_id: str):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE student_id = ?", (student_id,))
-    user = cursor.fetchone()
-    conn.close()
+    await cursor.execute("SELECT * FROM users WHERE student_id = ?", (student_id,))
+    user = await cursor.fetchone()
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def authenticate_token(conn, token: str):
+    """Resolve a bearer token to its user row, raising 401 if it isn't valid"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -518,12 +442,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_student_id(student_id=token_data.student_id)
+    user = user_cache.get(token_data.student_id)
     if user is None:
-        raise credentials_exception
+        # Taken before the read, so an update committed meanwhile isn't cached over
+        generation = user_cache.generation(token_data.student_id)
+        user = await get_user_by_student_id(conn, student_id=token_data.student_id)
+        if user is None:
+            raise credentials_exception
+        user_cache.set(token_data.student_id, user, generation)
     return user
 
-async def get_current_admin(current_user = Depends(get_current_user)):
+async def get_current_user(token: str = Depends(oauth2_scheme), conn = Depends(get_db)):
+    return await authenticate_token(conn, token)
+
+async def get_current_user_short(token: str = Depends(oauth2_scheme)):
+    """get_current_user on a brief checkout, for handlers that don't keep a
+    connection for the whole request"""
+    async with short_db() as conn:
+        return await authenticate_token(conn, token)
+
+def require_admin(current_user):
     role = current_user["role"] if "role" in current_user.keys() else "student"
     if role != "admin":
         raise HTTPException(
@@ -532,6 +470,103 @@ async def get_current_admin(current_user = Depends(get_current_user)):
         )
     return current_user
 
+async def get_current_admin(current_user = Depends(get_current_user)):
+    return require_admin(current_user)
+
+async def get_current_admin_short(current_user = Depends(get_current_user_short)):
+    return require_admin(current_user)
+
+# ============================================
+# REAL-TIME EVENTS
+# ============================================
+
+# Everything below goes through the bus so it reaches every worker process:
+# each process pushes events to its own websockets and updates its own caches.
+
+def publish_chat_event(room: str, event: dict):
+    bus.publish("chat", {"room": room, "event": event})
+
+def publish_archived_messages(room: str, through_id: int):
+    """chat_archiver callback: the room's messages up to through_id left chat_messages"""
+    publish_chat_event(room, {"type": "archived", "through_id": through_id})
+
+def publish_notifications(user_ids, notification_type: str, title: str, message: str):
+    """Push freshly inserted notifications to the recipients' open sockets (call after commit)"""
+    bus.publish("notifications", {
+        "user_ids": list(user_ids),
+        "notification": {"type": notification_type, "title": title, "message": message}
+    })
+
+def publish_broadcast(audience: str, notification_type: str, title: str, message: str):
+    """Push a freshly inserted broadcast to the open sockets of its audience (call after commit)"""
+    bus.publish("notifications", {
+        "audience": audience,
+        "notification": {"type": notification_type, "title": title, "message": message}
+    })
+
+def invalidate_cached_user(student_id: str):
+    bus.publish("user_cache", {"student_id": student_id})
+
+def publish_booking_event(room_key: str, booking_date: str, time_slot: str, booked: bool):
+    """Mark a slot booked or free in every worker's availability cache (call after commit)"""
+    bus.publish("bookings", {
+        "room_key": room_key, "booking_date": booking_date, "time_slot": time_slot, "booked": booked,
+        "origin": bus.origin
+    })
+
+def publish_hold_event(hold_id: int, expires_at: float):
+    """Arm the hold's expiry timer in every worker; whichever fires first frees the slot"""
+    bus.publish("booking_holds", {"id": hold_id, "expires_at": expires_at})
+
+def apply_booking_event(event: dict):
+    if event.get("origin") != bus.origin:
+        # Another worker's event can land after a later one of ours for the same slot
+        availability_cache.invalidate(event["room_key"], event["booking_date"])
+    elif event["booked"]:
+        availability_cache.book(event["room_key"], event["booking_date"], event["time_slot"])
+    else:
+        availability_cache.release(event["room_key"], event["booking_date"], event["time_slot"])
+
+def apply_chat_event(event: dict):
+    room, payload = event["room"], event["event"]
+    if payload["type"] == "message":
+        room_cache.add(room, payload["message"])
+    elif payload["type"] == "deleted":
+        room_cache.remove(room, payload["message_id"])
+    elif payload["type"] == "archived":
+        # Still part of the room's history, so clients aren't told
+        room_cache.drop_archived(room, payload["through_id"])
+        return
+    chat_gateway.publish(room, payload)
+
+def deliver_notifications(event: dict):
+    rooms = [notification_room(user_id) for user_id in event.get("user_ids", ())]
+    if "audience" in event:
+        rooms.append(broadcast_room(event["audience"]))
+    for room in rooms:
+        chat_gateway.publish(room, {"type": "notification", "notification": event["notification"]})
+
+def notification_room(user_id: int) -> str:
+    return f"notifications:{user_id}"
+
+def broadcast_room(audience: str) -> str:
+    return f"broadcasts:{audience}"
+
+def broadcast_audiences(user) -> list:
+    """Audiences whose broadcasts the user receives: events go to everyone but admins, announcements to students"""
+    audiences = []
+    if user["role"] != "admin":
+        audiences.append("non_admins")
+    if user["role"] == "student":
+        audiences.append("students")
+    return audiences
+
+bus.subscribe("chat", apply_chat_event)
+bus.subscribe("notifications", deliver_notifications)
+bus.subscribe("user_cache", lambda event: user_cache.invalidate(event["student_id"]))
+bus.subscribe("bookings", apply_booking_event)
+bus.subscribe("booking_holds", lambda event: hold_expiry.schedule(event["id"], event["expires_at"]))
+
 # ============================================
 # AUTHENTICATION ENDPOINTS
 # ============================================
@@ -542,28 +577,28 @@ async def signup(user: UserSignup):
     if user.year not in [1, 2, 3, 4]:
         raise HTTPException(status_code=400, detail="Year must be 1, 2, 3, or 4")
     
-    # Check if user already exists
-    existing_user = get_user_by_student_id(user.student_id)
+    # Check if user already exists. No connection is held while the password
+    # hashes; a signup racing for the same student ID hits the unique constraint
+    async with short_db() as conn:
+        existing_user = await get_user_by_student_id(conn, user.student_id)
     if existing_user:
         raise HTTPException(status_code=400, detail="Student ID already registered")
     
     # Create new user
-    conn = get_db()
-    cursor = conn.cursor()
-    hashed_password = get_password_hash(user.password)
-    
-    try:
-        cursor.execute(
-            "INSERT INTO users (student_id, name, password_hash, year) VALUES (?, ?, ?, ?)",
-            (user.student_id, user.name, hashed_password, user.year)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-    except sqlite3.IntegrityError:
-        conn.close()
-        raise HTTPException(status_code=400, detail="Student ID already exists")
+    hashed_password = await get_password_hash(user.password)
     
-    conn.close()
+    async with short_db() as conn:
+        cursor = conn.cursor()
+        try:
+            await cursor.execute(
+                "INSERT INTO users (student_id, name, password_hash, year) VALUES (?, ?, ?, ?)",
+                (user.student_id, user.name, hashed_password, user.year)
+            )
+            await conn.commit()
+            user_id = cursor.lastrowid
+        except sqlite3.IntegrityError:
+            await conn.rollback()
+            raise HTTPException(status_code=400, detail="Student ID already exists")
     
     return UserResponse(
         id=user_id,
@@ -575,7 +610,9 @@ async def signup(user: UserSignup):
 @app.post("/login", response_model=Token)
 async def login(user: UserLogin):
     try:
-        db_user = get_user_by_student_id(user.student_id)
+        # Release the connection before waiting on the password hash pool
+        async with short_db() as conn:
+            db_user = await get_user_by_student_id(conn, user.student_id)
         
         if not db_user:
             raise HTTPException(
@@ -584,7 +621,7 @@ async def login(user: UserLogin):
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        if not verify_password(user.password, db_user["password_hash"]):
+        if not await verify_password(user.password, db_user["password_hash"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect student ID or password",
@@ -623,46 +660,385 @@ async def get_current_user_info(current_user = Depends(get_current_user)):
 # BOOKING ENDPOINTS
 # ============================================
 
-@app.post("/bookings", response_model=BookingResponse)
-async def create_booking(booking: BookingCreate, current_user = Depends(get_current_user)):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if slot is already booked
-    cursor.execute(
-        "SELECT * FROM bookings WHERE room_key = ? AND booking_date = ? AND time_slot = ?",
+def parse_booking_date(value: str):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+
+def booking_quota_used(raw_conn, user_id: int, room_key: str, now: float) -> int:
+    """Upcoming bookings plus unexpired holds the user has for a room.
+
+    Bookings of past days no longer count, whether or not the expiry job
+    has moved them to booking_history yet.
+    """
+    return raw_conn.execute(
+        BOOKING_QUOTA_SQL,
+        (user_id, room_key, datetime.fromtimestamp(now).date().isoformat(), user_id, room_key, now)
+    ).fetchone()[0]
+
+def check_booking_quota(raw_conn, user_id: int, room_key: str, now: float):
+    if booking_quota_used(raw_conn, user_id, room_key, now) >= BOOKINGS_PER_ROOM:
+        raise HTTPException(
+            status_code=400,
+            detail=f"You can't book more than {BOOKINGS_PER_ROOM} times in the same category"
+        )
+
+def check_expired_hold(raw_conn, hold, now: float):
+    """Refuse a slot whose hold has expired but whose waitlist hasn't been served yet.
+
+    The hold's expiry timer is due and will book the slot for the first
+    user in line, so nobody else may take it first.
+    """
+    if hold["expires_at"] <= now and raw_conn.execute(
+        "SELECT 1 FROM booking_waitlist WHERE room_key = ? AND booking_date = ? AND time_slot = ?",
+        (hold["room_key"], hold["booking_date"], hold["time_slot"])
+    ).fetchone():
+        raise HTTPException(status_code=400, detail="This time slot is being released to its waitlist")
+
+def book_slot(raw_conn, user_id: int, room_key: str, room_name: str, booking_date: str,
+              time_slot: str, now: float) -> int:
+    """Insert a booking inside a BEGIN IMMEDIATE transaction and return its id.
+
+    The user's own hold on the slot turns into the booking; someone else's
+    unexpired hold blocks it. The unique index on (room_key, booking_date,
+    time_slot) rejects a slot that is already booked.
+    """
+    hold = raw_conn.execute(
+        """SELECT id, user_id, room_key, booking_date, time_slot, expires_at FROM booking_holds
+           WHERE room_key = ? AND booking_date = ? AND time_slot = ?""",
+        (room_key, booking_date, time_slot)
+    ).fetchone()
+    if hold is not None:
+        if hold["user_id"] != user_id and hold["expires_at"] > now:
+            raise HTTPException(status_code=400, detail="This time slot is being held by another user")
+        check_expired_hold(raw_conn, hold, now)
+        raw_conn.execute("DELETE FROM booking_holds WHERE id = ?", (hold["id"],))
+    
+    check_booking_quota(raw_conn, user_id, room_key, now)
+    try:
+        cursor = raw_conn.execute(
+            """INSERT INTO bookings (user_id, room_key, room_name, booking_date, time_slot)
+               VALUES (?, ?, ?, ?, ?)""",
+            (user_id, room_key, room_name, booking_date, time_slot)
+        )
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="This time slot is already booked")
+    return cursor.lastrowid
+
+def reserve_booking(raw_conn, user_id: int, booking: BookingCreate) -> int:
+    # IMMEDIATE takes the write lock up front, so the checks and the insert
+    # see the same state and concurrent requests queue instead of racing
+    raw_conn.execute("BEGIN IMMEDIATE")
+    return book_slot(raw_conn, user_id, booking.room_key, booking.room_name, booking.booking_date,
+                     booking.time_slot, time.time())
+
+def place_hold(raw_conn, user_id: int, booking: BookingCreate) -> tuple:
+    """Hold a free slot for HOLD_SECONDS and return (hold_id, expires_at)"""
+    now = time.time()
+    raw_conn.execute("BEGIN IMMEDIATE")
+    if raw_conn.execute(
+        "SELECT 1 FROM bookings WHERE room_key = ? AND booking_date = ? AND time_slot = ?",
         (booking.room_key, booking.booking_date, booking.time_slot)
-    )
-    existing = cursor.fetchone()
-    
-    if existing:
-        conn.close()
+    ).fetchone():
         raise HTTPException(status_code=400, detail="This time slot is already booked")
     
-    # Check booking limit (max 2 per category per user)
-    cursor.execute(
-        "SELECT COUNT(*) as count FROM bookings WHERE user_id = ? AND room_key = ?",
-        (current_user["id"], booking.room_key)
+    hold = raw_conn.execute(
+        """SELECT id, user_id, room_key, booking_date, time_slot, expires_at FROM booking_holds
+           WHERE room_key = ? AND booking_date = ? AND time_slot = ?""",
+        (booking.room_key, booking.booking_date, booking.time_slot)
+    ).fetchone()
+    if hold is not None:
+        if hold["expires_at"] > now:
+            if hold["user_id"] == user_id:
+                return hold["id"], hold["expires_at"]
+            raise HTTPException(status_code=400, detail="This time slot is being held by another user")
+        # Expired but its timer hasn't run yet
+        check_expired_hold(raw_conn, hold, now)
+        raw_conn.execute("DELETE FROM booking_holds WHERE id = ?", (hold["id"],))
+    
+    check_booking_quota(raw_conn, user_id, booking.room_key, now)
+    expires_at = now + HOLD_SECONDS
+    cursor = raw_conn.execute(
+        """INSERT INTO booking_holds (user_id, room_key, room_name, booking_date, time_slot, expires_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (user_id, booking.room_key, booking.room_name, booking.booking_date, booking.time_slot, expires_at)
     )
-    count_result = cursor.fetchone()
+    return cursor.lastrowid, expires_at
+
+def confirm_hold(raw_conn, user_id: int, hold_id: int) -> int:
+    now = time.time()
+    raw_conn.execute("BEGIN IMMEDIATE")
+    hold = raw_conn.execute(
+        "SELECT * FROM booking_holds WHERE id = ? AND user_id = ?",
+        (hold_id, user_id)
+    ).fetchone()
+    if hold is None or hold["expires_at"] <= now:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+    return book_slot(raw_conn, user_id, hold["room_key"], hold["room_name"], hold["booking_date"],
+                     hold["time_slot"], now)
+
+def join_waitlist(raw_conn, user_id: int, booking: BookingCreate) -> tuple:
+    """Queue the user for a booked or held slot and return (entry_id, position)"""
+    raw_conn.execute("BEGIN IMMEDIATE")
+    holder = raw_conn.execute(
+        "SELECT user_id FROM bookings WHERE room_key = ? AND booking_date = ? AND time_slot = ?",
+        (booking.room_key, booking.booking_date, booking.time_slot)
+    ).fetchone()
+    if holder is None:
+        # Queue behind a hold too: if it expires or is released the slot goes to the line
+        holder = raw_conn.execute(
+            """SELECT user_id FROM booking_holds
+               WHERE room_key = ? AND booking_date = ? AND time_slot = ? AND expires_at > ?""",
+            (booking.room_key, booking.booking_date, booking.time_slot, time.time())
+        ).fetchone()
+        if holder is None:
+            raise HTTPException(status_code=400, detail="This time slot isn't booked, book it directly")
+        if holder["user_id"] == user_id:
+            raise HTTPException(status_code=400, detail="You are holding this time slot, confirm the hold instead")
+    if holder["user_id"] == user_id:
+        raise HTTPException(status_code=400, detail="You have already booked this time slot")
+    try:
+        cursor = raw_conn.execute(
+            """INSERT INTO booking_waitlist (user_id, room_key, room_name, booking_date, time_slot)
+               VALUES (?, ?, ?, ?, ?)""",
+            (user_id, booking.room_key, booking.room_name, booking.booking_date, booking.time_slot)
+        )
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="You are already on the waitlist for this time slot")
+    position = raw_conn.execute(
+        """SELECT COUNT(*) FROM booking_waitlist
+           WHERE room_key = ? AND booking_date = ? AND time_slot = ? AND id <= ?""",
+        (booking.room_key, booking.booking_date, booking.time_slot, cursor.lastrowid)
+    ).fetchone()[0]
+    return cursor.lastrowid, position
+
+def promote_from_waitlist(raw_conn, room_key: str, booking_date: str, time_slot: str, now: float):
+    """Give a just-freed slot to the first waiting user under their quota.
+
+    Runs inside the freeing transaction, so the slot is never seen free.
+    Returns the notification to push as (user_id, title, message), or None.
+    Users over their quota keep their place for a later opening.
+    """
+    waiting = raw_conn.execute(
+        """SELECT * FROM booking_waitlist
+           WHERE room_key = ? AND booking_date = ? AND time_slot = ?
+           ORDER BY id""",
+        (room_key, booking_date, time_slot)
+    ).fetchall()
+    for entry in waiting:
+        if booking_quota_used(raw_conn, entry["user_id"], room_key, now) >= BOOKINGS_PER_ROOM:
+            continue
+        raw_conn.execute("DELETE FROM booking_waitlist WHERE id = ?", (entry["id"],))
+        raw_conn.execute(
+            """INSERT INTO bookings (user_id, room_key, room_name, booking_date, time_slot)
+               VALUES (?, ?, ?, ?, ?)""",
+            (entry["user_id"], room_key, entry["room_name"], booking_date, time_slot)
+        )
+        title = "Waitlist Booking Confirmed"
+        message = f"A slot opened up: {entry['room_name']} on {booking_date} at {time_slot} is now booked for you."
+        raw_conn.execute(
+            """INSERT INTO notifications (user_id, type, title, message)
+               VALUES (?, ?, ?, ?)""",
+            (entry["user_id"], "booking_waitlist", title, message)
+        )
+        return entry["user_id"], title, message
+    return None
+
+def cancel_and_promote(raw_conn, user_id: int, booking_id: int) -> tuple:
+    """Delete the user's booking and hand the slot to its waitlist; returns (booking, promotion)"""
+    raw_conn.execute("BEGIN IMMEDIATE")
+    booking = raw_conn.execute(
+        "SELECT * FROM bookings WHERE id = ? AND user_id = ?",
+        (booking_id, user_id)
+    ).fetchone()
+    if booking is None:
+        raise HTTPException(status_code=404, detail="Booking not found or unauthorized")
+    raw_conn.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+    promotion = promote_from_waitlist(
+        raw_conn, booking["room_key"], booking["booking_date"], booking["time_slot"], time.time()
+    )
+    return booking, promotion
+
+def remove_holds(raw_conn, condition: str, params) -> list:
+    """Delete the holds matching condition and hand each freed slot to its waitlist.
+
+    Returns (slot, promotion) for every removed hold, where promotion is
+    promote_from_waitlist()'s result for that slot.
+    """
+    now = time.time()
+    raw_conn.execute("BEGIN IMMEDIATE")
+    released = raw_conn.execute(
+        f"DELETE FROM booking_holds WHERE {condition} RETURNING room_key, booking_date, time_slot",
+        params
+    ).fetchall()
+    return [
+        (row, promote_from_waitlist(raw_conn, row["room_key"], row["booking_date"], row["time_slot"], now))
+        for row in released
+    ]
+
+def publish_released_holds(released: list):
+    for row, promotion in released:
+        if promotion is None:
+            publish_booking_event(row["room_key"], row["booking_date"], row["time_slot"], booked=False)
+        else:
+            # The slot went straight from the hold to the next user in line, so it stays booked
+            promoted_user_id, title, message = promotion
+            publish_notifications([promoted_user_id], "booking_waitlist", title, message)
+
+async def expire_booking_holds(hold_ids: list):
+    """hold_expiry callback: drop holds whose time is up and free their slots"""
+    async with db.connection() as conn:
+        released = await conn.transaction(
+            remove_holds,
+            f"id IN ({', '.join(['?'] * len(hold_ids))}) AND expires_at <= ?",
+            (*hold_ids, time.time())
+        )
+    publish_released_holds(released)
+
+def publish_expired_bookings(slots: list):
+    """booking_expirer callback: bookings moved to booking_history no longer occupy their slots"""
+    for room_key, booking_date, time_slot in slots:
+        publish_booking_event(room_key, booking_date, time_slot, booked=False)
+
+async def schedule_booking_holds():
+    """Arm the expiry timers of holds left over from before a restart"""
+    async with db.connection() as conn:
+        cursor = conn.cursor()
+        await cursor.execute("SELECT id, expires_at FROM booking_holds")
+        for row in await cursor.fetchall():
+            hold_expiry.schedule(row["id"], row["expires_at"])
+
+def reserve_recurring_bookings(raw_conn, user_id: int, is_admin: bool, recurrence: RecurringBookingCreate,
+                               occurrences: list) -> list:
+    """Book every (room_key, room_name, date) occurrence of a slot as one series, or none of them.
+
+    Availability and the per-room quota are checked for all occurrences in
+    one pass under the write lock; every occurrence counts toward the quota
+    like a single booking would. Admins, who book series for clubs and
+    events, aren't limited. If any occurrence can't be booked, a 409 lists
+    each one with the reason and nothing is written.
+    """
+    now = time.time()
+    time_slot = recurrence.time_slot
+    raw_conn.execute("BEGIN IMMEDIATE")
+    room_keys = sorted({room_key for room_key, _, _ in occurrences})
+    dates = [date for _, _, date in occurrences]
+    rooms_sql = ', '.join(['?'] * len(room_keys))
+    
+    booked = {
+        (row["room_key"], row["booking_date"])
+        for row in raw_conn.execute(
+            f"""SELECT room_key, booking_date FROM bookings
+                WHERE room_key IN ({rooms_sql}) AND booking_date BETWEEN ? AND ? AND time_slot = ?""",
+            (*room_keys, min(dates), max(dates), time_slot)
+        ).fetchall()
+    }
+    holds = {
+        (row["room_key"], row["booking_date"]): row
+        for row in raw_conn.execute(
+            f"""SELECT id, user_id, room_key, booking_date, expires_at FROM booking_holds
+                WHERE room_key IN ({rooms_sql}) AND booking_date BETWEEN ? AND ? AND time_slot = ?""",
+            (*room_keys, min(dates), max(dates), time_slot)
+        ).fetchall()
+    }
+    waitlisted = {
+        (row["room_key"], row["booking_date"])
+        for row in raw_conn.execute(
+            f"""SELECT DISTINCT room_key, booking_date FROM booking_waitlist
+                WHERE room_key IN ({rooms_sql}) AND booking_date BETWEEN ? AND ? AND time_slot = ?""",
+            (*room_keys, min(dates), max(dates), time_slot)
+        ).fetchall()
+    }
+    quota_left = {room_key: BOOKINGS_PER_ROOM - booking_quota_used(raw_conn, user_id, room_key, now)
+                  for room_key in room_keys}
+    
+    conflicts = []
+    accepted = []
+    replaced_holds = []
+    for room_key, room_name, date in occurrences:
+        hold = holds.get((room_key, date))
+        reason = None
+        if (room_key, date) in booked:
+            reason = "already booked"
+        elif hold is not None and hold["user_id"] != user_id and hold["expires_at"] > now:
+            reason = "held by another user"
+        elif hold is not None and hold["expires_at"] <= now and (room_key, date) in waitlisted:
+            reason = "being released to its waitlist"
+        elif not is_admin:
+            if hold is not None and hold["user_id"] == user_id and hold["expires_at"] > now:
+                # The user's own hold turns into this booking and frees its quota
+                quota_left[room_key] += 1
+            if quota_left[room_key] <= 0:
+                reason = f"over the limit of {BOOKINGS_PER_ROOM} bookings for this room"
+            else:
+                quota_left[room_key] -= 1
+        if reason:
+            conflicts.append({"room_key": room_key, "booking_date": date, "time_slot": time_slot, "reason": reason})
+        else:
+            accepted.append((room_key, room_name, date))
+            if hold is not None:
+                replaced_holds.append(hold["id"])
     
-    if count_result["count"] >= 2:
-        conn.close()
-        raise HTTPException(status_code=400, detail="You can't book more than 2 times in the same category")
+    if conflicts:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": f"{len(conflicts)} of {len(occurrences)} occurrences can't be booked, nothing was booked",
+                "conflicts": conflicts
+            }
+        )
     
-    # Create booking
-    cursor.execute(
-        """INSERT INTO bookings (user_id, room_key, room_name, booking_date, time_slot) 
-           VALUES (?, ?, ?, ?, ?)""",
-        (current_user["id"], booking.room_key, booking.room_name, booking.booking_date, booking.time_slot)
+    if replaced_holds:
+        raw_conn.execute(
+            f"DELETE FROM booking_holds WHERE id IN ({', '.join(['?'] * len(replaced_holds))})",
+            replaced_holds
+        )
+    series_id = raw_conn.execute(
+        """INSERT INTO booking_series (user_id, time_slot, frequency, interval, start_date, end_date)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (user_id, time_slot, recurrence.frequency, recurrence.interval, recurrence.start_date, recurrence.end_date)
+    ).lastrowid
+    ids = []
+    for room_key, room_name, date in accepted:
+        cursor = raw_conn.execute(
+            """INSERT INTO bookings (user_id, room_key, room_name, booking_date, time_slot, series_id)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (user_id, room_key, room_name, date, time_slot, series_id)
+        )
+        ids.append(cursor.lastrowid)
+    return ids
+
+async def load_availability(conn, room_keys: List[str], dates: List[str]) -> dict:
+    """Booked or held slots as {room_key: {date: [slot, ...]}}, read in one query and cached"""
+    keys = [(room_key, date) for room_key in room_keys for date in dates]
+    # Register first so bookings made while the query runs are replayed on top
+    availability_cache.begin_warm(keys)
+    rooms_sql = ', '.join(['?'] * len(room_keys))
+    cursor = conn.cursor()
+    await cursor.execute(
+        f"""SELECT room_key, booking_date, time_slot FROM bookings
+            WHERE room_key IN ({rooms_sql}) AND booking_date BETWEEN ? AND ?
+            UNION ALL
+            SELECT room_key, booking_date, time_slot FROM booking_holds
+            WHERE room_key IN ({rooms_sql}) AND booking_date BETWEEN ? AND ? AND expires_at > ?""",
+        (*room_keys, min(dates), max(dates), *room_keys, min(dates), max(dates), time.time())
     )
-    conn.commit()
-    booking_id = cursor.lastrowid
-    
-    # Get created booking
-    cursor.execute("SELECT * FROM bookings WHERE id = ?", (booking_id,))
-    new_booking = cursor.fetchone()
-    conn.close()
+    found = {}
+    for row in await cursor.fetchall():
+        found.setdefault((row["room_key"], row["booking_date"]), []).append(row["time_slot"])
+    
+    result = {room_key: {} for room_key in room_keys}
+    for room_key, date in keys:
+        slots = found.get((room_key, date), [])
+        availability_cache.warm(room_key, date, slots)
+        result[room_key][date] = sorted(slots)
+    return result
+
+async def booking_response(conn, booking_id: int, current_user) -> BookingResponse:
+    cursor = conn.cursor()
+    await cursor.execute("SELECT * FROM bookings WHERE id = ?", (booking_id,))
+    new_booking = await cursor.fetchone()
     
     return BookingResponse(
         id=new_booking["id"],
@@ -675,11 +1051,108 @@ async def create_booking(booking: BookingCreate, current_user = Depends(get_curr
         created_at=new_booking["created_at"]
     )
 
+@app.post("/bookings", response_model=BookingResponse)
+async def create_booking(booking: BookingCreate, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    booking_id = await conn.transaction(reserve_booking, current_user["id"], booking)
+    publish_booking_event(booking.room_key, booking.booking_date, booking.time_slot, booked=True)
+    
+    return await booking_response(conn, booking_id, current_user)
+
+@app.post("/bookings/recurring")
+async def create_recurring_bookings(
+    recurrence: RecurringBookingCreate,
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
+    """Book one time slot in a set of rooms on a daily or weekly pattern, all or nothing"""
+    if recurrence.frequency not in RECURRENCE_STEPS:
+        raise HTTPException(status_code=400, detail=f"frequency must be one of: {', '.join(RECURRENCE_STEPS)}")
+    if recurrence.interval < 1:
+        raise HTTPException(status_code=400, detail="interval must be at least 1")
+    rooms = {room.room_key: room.room_name for room in recurrence.rooms}
+    if not rooms:
+        raise HTTPException(status_code=400, detail="Give at least one room")
+    start, end = parse_booking_date(recurrence.start_date), parse_booking_date(recurrence.end_date)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must be on or after start_date")
+    
+    step = timedelta(days=RECURRENCE_STEPS[recurrence.frequency] * recurrence.interval)
+    dates = []
+    day = start
+    while day <= end:
+        dates.append(day.isoformat())
+        day += step
+    if len(dates) * len(rooms) > RECURRING_BOOKING_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A recurring booking can create at most {RECURRING_BOOKING_MAX} bookings"
+        )
+    occurrences = [(room_key, room_name, date) for date in dates for room_key, room_name in rooms.items()]
+    
+    role = current_user["role"] if "role" in current_user.keys() else "student"
+    booking_ids = await conn.transaction(
+        reserve_recurring_bookings, current_user["id"], role == "admin", recurrence, occurrences
+    )
+    for room_key, _, date in occurrences:
+        publish_booking_event(room_key, date, recurrence.time_slot, booked=True)
+    
+    cursor = conn.cursor()
+    await cursor.execute(
+        f"SELECT * FROM bookings WHERE id IN ({', '.join(['?'] * len(booking_ids))}) ORDER BY booking_date, room_key",
+        booking_ids
+    )
+    bookings = [
+        BookingResponse(
+            id=b["id"],
+            room_key=b["room_key"],
+            room_name=b["room_name"],
+            booking_date=b["booking_date"],
+            time_slot=b["time_slot"],
+            student_name=current_user["name"],
+            student_id=current_user["student_id"],
+            created_at=b["created_at"]
+        )
+        for b in await cursor.fetchall()
+    ]
+    return {"bookings": bookings, "count": len(bookings)}
+
+@app.post("/bookings/holds", response_model=BookingHoldResponse)
+async def create_booking_hold(booking: BookingCreate, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    """Reserve a slot for HOLD_SECONDS while the user confirms; holds count as booked for everyone else"""
+    hold_id, expires_at = await conn.transaction(place_hold, current_user["id"], booking)
+    publish_booking_event(booking.room_key, booking.booking_date, booking.time_slot, booked=True)
+    publish_hold_event(hold_id, expires_at)
+    
+    return BookingHoldResponse(
+        id=hold_id,
+        room_key=booking.room_key,
+        room_name=booking.room_name,
+        booking_date=booking.booking_date,
+        time_slot=booking.time_slot,
+        expires_at=expires_at,
+        expires_in=round(max(0.0, expires_at - time.time()), 3)
+    )
+
+@app.post("/bookings/holds/{hold_id}/confirm", response_model=BookingResponse)
+async def confirm_booking_hold(hold_id: int, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    booking_id = await conn.transaction(confirm_hold, current_user["id"], hold_id)
+    booking = await booking_response(conn, booking_id, current_user)
+    publish_booking_event(booking.room_key, booking.booking_date, booking.time_slot, booked=True)
+    return booking
+
+@app.delete("/bookings/holds/{hold_id}")
+async def release_booking_hold(hold_id: int, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    released = await conn.transaction(remove_holds, "id = ? AND user_id = ?", (hold_id, current_user["id"]))
+    if not released:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+    publish_released_holds(released)
+    
+    return {"message": "Hold released"}
+
 @app.get("/bookings", response_model=List[BookingResponse])
-async def get_user_bookings(current_user = Depends(get_current_user)):
-    conn = get_db()
+async def get_user_bookings(current_user = Depends(get_current_user), conn = Depends(get_db)):
     cursor = conn.cursor()
-    cursor.execute(
+    await cursor.execute(
         """SELECT b.*, u.name, u.student_id 
            FROM bookings b 
            JOIN users u ON b.user_id = u.id 
@@ -687,8 +1160,7 @@ async def get_user_bookings(current_user = Depends(get_current_user)):
            ORDER BY b.booking_date, b.time_slot""",
         (current_user["id"],)
     )
-    bookings = cursor.fetchall()
-    conn.close()
+    bookings = await cursor.fetchall()
     
     return [
         BookingResponse(
@@ -708,45 +1180,313 @@ async def get_user_bookings(current_user = Depends(get_current_user)):
 async def check_slot_availability(
     room_key: str,
     booking_date: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT time_slot FROM bookings WHERE room_key = ? AND booking_date = ?",
-        (room_key, booking_date)
-    )
-    booked_slots = [row["time_slot"] for row in cursor.fetchall()]
-    conn.close()
+    booked_slots = availability_cache.booked(room_key, booking_date)
+    if booked_slots is None:
+        booked_slots = (await load_availability(conn, [room_key], [booking_date]))[room_key][booking_date]
     
     return {"booked_slots": booked_slots}
 
-@app.delete("/bookings/{booking_id}")
-async def cancel_booking(booking_id: int, current_user = Depends(get_current_user)):
-    conn = get_db()
-    cursor = conn.cursor()
+@app.get("/bookings/availability")
+async def get_availability_range(
+    request: Request,
+    room_keys: str = Query(..., description="Comma-separated room keys"),
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
+    """Booked slots of several rooms over a date range, for week and calendar views.
+
+    Served from the availability cache, or one indexed range scan when any
+    day isn't cached yet. The response carries an ETag of its content; a
+    request whose If-None-Match still matches gets an empty 304.
+    """
+    rooms = list(dict.fromkeys(key.strip() for key in room_keys.split(",") if key.strip()))
+    if not rooms or len(rooms) > AVAILABILITY_MAX_ROOMS:
+        raise HTTPException(status_code=400, detail=f"Give between 1 and {AVAILABILITY_MAX_ROOMS} room keys")
+    start, end = parse_booking_date(start_date), parse_booking_date(end_date)
+    days = (end - start).days + 1
+    if days < 1 or days > AVAILABILITY_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"end_date must be on or after start_date and at most {AVAILABILITY_MAX_DAYS} days later"
+        )
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
     
-    # Check if booking exists and belongs to user
-    cursor.execute(
-        "SELECT * FROM bookings WHERE id = ? AND user_id = ?",
-        (booking_id, current_user["id"])
-    )
-    booking = cursor.fetchone()
+    booked = {room_key: {date: availability_cache.booked(room_key, date) for date in dates} for room_key in rooms}
+    if any(slots is None for by_date in booked.values() for slots in by_date.values()):
+        booked = await load_availability(conn, rooms, dates)
     
-    if not booking:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Booking not found or unauthorized")
-    
-    cursor.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
-    conn.commit()
-    conn.close()
+    body = {"start_date": dates[0], "end_date": dates[-1], "rooms": booked}
+    payload = json.dumps(body, separators=(",", ":"))
+    etag = '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+@app.delete("/bookings/{booking_id}")
+async def cancel_booking(booking_id: int, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    booking, promotion = await conn.transaction(cancel_and_promote, current_user["id"], booking_id)
+    if promotion is None:
+        publish_booking_event(booking["room_key"], booking["booking_date"], booking["time_slot"], booked=False)
+    else:
+        # The slot went straight to the next user in line, so it stays booked
+        promoted_user_id, title, message = promotion
+        publish_notifications([promoted_user_id], "booking_waitlist", title, message)
     
     return {"message": "Booking cancelled successfully"}
 
+@app.post("/bookings/waitlist", response_model=WaitlistEntryResponse)
+async def join_booking_waitlist(booking: BookingCreate, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    """Queue for a booked or held slot; if it is freed, the first user in line gets it automatically"""
+    entry_id, position = await conn.transaction(join_waitlist, current_user["id"], booking)
+    
+    cursor = conn.cursor()
+    await cursor.execute("SELECT created_at FROM booking_waitlist WHERE id = ?", (entry_id,))
+    entry = await cursor.fetchone()
+    return WaitlistEntryResponse(
+        id=entry_id,
+        room_key=booking.room_key,
+        room_name=booking.room_name,
+        booking_date=booking.booking_date,
+        time_slot=booking.time_slot,
+        position=position,
+        created_at=entry["created_at"]
+    )
+
+@app.get("/bookings/waitlist", response_model=List[WaitlistEntryResponse])
+async def get_booking_waitlist(current_user = Depends(get_current_user), conn = Depends(get_db)):
+    cursor = conn.cursor()
+    await cursor.execute(
+        """SELECT w.*,
+                  (SELECT COUNT(*) FROM booking_waitlist ahead
+                   WHERE ahead.room_key = w.room_key AND ahead.booking_date = w.booking_date
+                     AND ahead.time_slot = w.time_slot AND ahead.id <= w.id) AS position
+           FROM booking_waitlist w
+           WHERE w.user_id = ?
+           ORDER BY w.booking_date, w.time_slot""",
+        (current_user["id"],)
+    )
+    return [
+        WaitlistEntryResponse(
+            id=entry["id"],
+            room_key=entry["room_key"],
+            room_name=entry["room_name"],
+            booking_date=entry["booking_date"],
+            time_slot=entry["time_slot"],
+            position=entry["position"],
+            created_at=entry["created_at"]
+        )
+        for entry in await cursor.fetchall()
+    ]
+
+@app.delete("/bookings/waitlist/{entry_id}")
+async def leave_booking_waitlist(entry_id: int, current_user = Depends(get_current_user), conn = Depends(get_db)):
+    cursor = conn.cursor()
+    await cursor.execute(
+        "DELETE FROM booking_waitlist WHERE id = ? AND user_id = ?",
+        (entry_id, current_user["id"])
+    )
+    await conn.commit()
+    if cursor.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    
+    return {"message": "Left the waitlist"}
+
 # ============================================
 # CHAT ENDPOINTS
 # ============================================
 
+def chat_message_from_row(msg) -> ChatMessageResponse:
+    return ChatMessageResponse(
+        id=msg["id"],
+        room=msg["room"],
+        sender_name=msg["sender_name"],
+        sender_id=msg["sender_id"],
+        content=msg["content"],
+        timestamp=msg["timestamp"],
+        date=msg["date"]
+    )
+
+async def fetch_message_page(
+    conn,
+    room: str,
+    before_id: Optional[int],
+    after_id: Optional[int],
+    limit: int
+) -> dict:
+    """One page of a room's history, oldest first.
+
+    Pages are keyed on the message id rather than the timestamp, so cursors
+    stay stable when messages are inserted concurrently. Without a cursor the
+    newest page is returned; before_id walks back through older history and
+    after_id fetches what arrived after the newest message a client has.
+    The newest page comes from room_cache when the room is loaded there, and
+    history that has been archived is read back from the archive segments.
+    """
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id, not both")
+    
+    # Read the deletion cursor first: a message deleted after this point is
+    # then reported by the client's next sync even if the page still has it
+    deleted_since = await latest_tombstone_id(conn, room)
+    
+    if before_id is None and after_id is None:
+        page = room_cache.newest(room, limit)
+        if page is None and limit <= room_cache.per_room:
+            await warm_room_cache(conn, room)
+            page = room_cache.newest(room, limit)
+        if page is not None:
+            messages, has_more = page
+            return {
+                "messages": messages,
+                "has_more": has_more,
+                "before_id": messages[0]["id"] if messages else None,
+                "after_id": messages[-1]["id"] if messages else None,
+                "deleted_since": deleted_since
+            }
+    
+    cursor = conn.cursor()
+    # One extra row tells us whether another page exists
+    if after_id is not None:
+        await cursor.execute(
+            "SELECT * FROM chat_messages WHERE room = ? AND id > ? ORDER BY id LIMIT ?",
+            (room, after_id, limit + 1)
+        )
+        rows = await cursor.fetchall()
+        # A cursor inside the archived range is followed by archived messages first
+        archived = await read_archive(conn, room, after_id=after_id, limit=limit + 1)
+        if archived:
+            merged = {msg["id"]: msg for msg in archived}
+            merged.update((row["id"], row) for row in rows)
+            rows = [merged[message_id] for message_id in sorted(merged)][:limit + 1]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before_id is not None:
+            await cursor.execute(
+                "SELECT * FROM chat_messages WHERE room = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (room, before_id, limit + 1)
+            )
+        else:
+            await cursor.execute(
+                "SELECT * FROM chat_messages WHERE room = ? ORDER BY id DESC LIMIT ?",
+                (room, limit + 1)
+            )
+        rows = await cursor.fetchall()
+        if len(rows) <= limit:
+            # Scrolled past the hot window: carry on into the archive
+            oldest = rows[-1]["id"] if rows else before_id
+            archived = await read_archive(conn, room, before_id=oldest, limit=limit + 1 - len(rows))
+            rows = list(rows) + archived[::-1]
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+    
+    return {
+        "messages": [chat_message_from_row(msg) for msg in rows],
+        "has_more": has_more,
+        "before_id": rows[0]["id"] if rows else before_id,
+        "after_id": rows[-1]["id"] if rows else after_id,
+        "deleted_since": deleted_since
+    }
+
+async def warm_room_cache(conn, room: str):
+    """Load a room's newest messages into room_cache"""
+    # Register first so messages sent while the query runs are merged in
+    room_cache.begin_warm(room)
+    cursor = conn.cursor()
+    await cursor.execute(
+        "SELECT * FROM chat_messages WHERE room = ? ORDER BY id DESC LIMIT ?",
+        (room, room_cache.per_room + 1)
+    )
+    rows = await cursor.fetchall()
+    room_cache.warm(
+        room,
+        [chat_message_from_row(msg).model_dump() for msg in rows[:room_cache.per_room][::-1]],
+        has_older=len(rows) > room_cache.per_room or await has_archived(conn, room)
+    )
+
+async def latest_tombstone_id(conn, room: str) -> int:
+    """Current deletion cursor for a room, handed to clients to start syncing from"""
+    cursor = conn.cursor()
+    await cursor.execute(
+        "SELECT MAX(id) AS id FROM chat_message_tombstones WHERE room = ?",
+        (room,)
+    )
+    row = await cursor.fetchone()
+    return row["id"] or 0
+
+async def ensure_room_access(conn, room: str, current_user):
+    """Raise 403 unless the user can read the room.
+
+    Students see their own year room and the course rooms they are members
+    of; admins see every year room and every course room.
+    """
+    role = current_user["role"] if "role" in current_user.keys() else "student"
+    
+    if room in YEAR_ROOMS.values():
+        if role == "admin" or room == YEAR_ROOMS.get(current_user["year"]):
+            return
+    else:
+        cursor = conn.cursor()
+        if role == "admin":
+            await cursor.execute("SELECT id FROM course_chatrooms WHERE room_key = ?", (room,))
+        else:
+            await cursor.execute("""
+                SELECT cc.id FROM course_chatrooms cc
+                JOIN course_chatroom_members ccm ON cc.id = ccm.room_id
+                WHERE cc.room_key = ? AND ccm.user_id = ?
+            """, (room, current_user["id"]))
+        if await cursor.fetchone():
+            return
+    
+    raise HTTPException(status_code=403, detail="Access denied to this chat room")
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix.
+
+    Each word is quoted, so FTS5 operators and punctuation typed by the user
+    are searched for literally instead of raising a syntax error.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if not words:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    words[-1] += "*"
+    return " ".join(words)
+
+# highlight() markers: control characters nobody types, swapped for <mark> after escaping
+HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE = "\x02", "\x03"
+
+def render_highlight(text: str) -> str:
+    return html.escape(text).replace(HIGHLIGHT_OPEN, "<mark>").replace(HIGHLIGHT_CLOSE, "</mark>")
+
+async def readable_rooms(conn, current_user) -> List[str]:
+    """Every room the user can read, following the same rules as ensure_room_access"""
+    role = current_user["role"] if "role" in current_user.keys() else "student"
+    cursor = conn.cursor()
+    if role == "admin":
+        await cursor.execute("SELECT room_key FROM course_chatrooms ORDER BY room_key")
+        return list(YEAR_ROOMS.values()) + [row["room_key"] for row in await cursor.fetchall()]
+    
+    await cursor.execute("""
+        SELECT cc.room_key FROM course_chatrooms cc
+        JOIN course_chatroom_members ccm ON cc.id = ccm.room_id
+        WHERE ccm.user_id = ?
+        ORDER BY cc.room_key
+    """, (current_user["id"],))
+    return [YEAR_ROOMS[current_user["year"]]] + [row["room_key"] for row in await cursor.fetchall()]
+
+async def searchable_rooms(conn, current_user) -> Optional[List[str]]:
+    """Rooms the user may search, or None for every room (admins)"""
+    role = current_user["role"] if "role" in current_user.keys() else "student"
+    if role == "admin":
+        return None
+    return await readable_rooms(conn, current_user)
+
 @app.get("/chat/rooms")
 async def get_available_rooms(current_user = Depends(get_current_user)):
     # Return only the room for the user's year
@@ -762,7 +1502,14 @@ async def get_available_rooms(current_user = Depends(get_current_user)):
     return {"room": rooms[year]}
 
 @app.get("/chat/messages/{room}")
-async def get_chat_messages(room: str, current_user = Depends(get_current_user)):
+async def get_chat_messages(
+    room: str,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_PAGE_MAX),
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
     # Verify user has access to this room
     year_rooms = {
         1: "year1",
@@ -774,32 +1521,10 @@ async def get_chat_messages(room: str, current_user = Depends(get_current_user))
     if room != year_rooms[current_user["year"]]:
         raise HTTPException(status_code=403, detail="Access denied to this chat room")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT * FROM chat_messages WHERE room = ? ORDER BY timestamp",
-        (room,)
-    )
-    messages = cursor.fetchall()
-    conn.close()
-    
-    return {
-        "messages": [
-            ChatMessageResponse(
-                id=msg["id"],
-                room=msg["room"],
-                sender_name=msg["sender_name"],
-                sender_id=msg["sender_id"],
-                content=msg["content"],
-                timestamp=msg["timestamp"],
-                date=msg["date"]
-            )
-            for msg in messages
-        ]
-    }
+    return await fetch_message_page(conn, room, before_id, after_id, limit)
 
 @app.post("/chat/messages")
-async def send_chat_message(message: ChatMessage, current_user = Depends(get_current_user)):
+async def send_chat_message(message: ChatMessage, current_user = Depends(get_current_user_short)):
     # Verify user has access to this room
     year_rooms = {
         1: "year1",
@@ -814,19 +1539,12 @@ async def send_chat_message(message: ChatMessage, current_user = Depends(get_cur
     timestamp = int(datetime.now().timestamp() * 1000)
     date = datetime.now().strftime("%Y-%m-%d")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        """INSERT INTO chat_messages (room, user_id, sender_name, sender_id, content, timestamp, date)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (message.room, current_user["id"], current_user["name"], current_user["student_id"], 
-         message.content, timestamp, date)
+    message_id = await chat_writer.write(
+        message.room, current_user["id"], current_user["name"], current_user["student_id"],
+        message.content, timestamp, date
     )
-    conn.commit()
-    message_id = cursor.lastrowid
-    conn.close()
     
-    return ChatMessageResponse(
+    response = ChatMessageResponse(
         id=message_id,
         room=message.room,
         sender_name=current_user["name"],
@@ -835,6 +1553,215 @@ async def send_chat_message(message: ChatMessage, current_user = Depends(get_cur
         timestamp=timestamp,
         date=date
     )
+    publish_chat_event(message.room, {"type": "message", "message": response.model_dump()})
+    return response
+
+@app.get("/chat/sync/{room}")
+async def sync_chat_messages(
+    room: str,
+    since_id: int,
+    deleted_since: int = 0,
+    limit: int = Query(CHAT_PAGE_MAX, ge=1, le=CHAT_PAGE_MAX),
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
+    """Changes to a room since the client's last poll.
+
+    since_id is the newest message id the client holds and deleted_since
+    its tombstone cursor (both are returned by the history endpoints and by
+    every sync). Works for year rooms and course rooms, so a steady-state
+    poll costs O(new messages) instead of re-reading the room's history.
+    """
+    await ensure_room_access(conn, room, current_user)
+    
+    cursor = conn.cursor()
+    await cursor.execute(
+        "SELECT * FROM chat_messages WHERE room = ? AND id > ? ORDER BY id LIMIT ?",
+        (room, since_id, limit + 1)
+    )
+    rows = await cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    await cursor.execute(
+        "SELECT id, message_id FROM chat_message_tombstones WHERE room = ? AND id > ? ORDER BY id",
+        (room, deleted_since)
+    )
+    tombstones = await cursor.fetchall()
+    
+    return {
+        "messages": [chat_message_from_row(msg) for msg in rows],
+        "deleted_ids": [t["message_id"] for t in tombstones],
+        "has_more": has_more,
+        "since_id": rows[-1]["id"] if rows else since_id,
+        "deleted_since": tombstones[-1]["id"] if tombstones else deleted_since
+    }
+
+@app.websocket("/ws/chat/{room}")
+async def chat_websocket(websocket: WebSocket, room: str, token: str):
+    """Live feed of a year or course room.
+
+    Browsers can't set headers on a websocket, so the JWT comes in the token
+    query parameter. Access follows ensure_room_access; messages are still
+    sent through the POST endpoints, which publish to every open socket.
+    """
+    try:
+        # Only hold a pooled connection for the handshake, not the socket's lifetime
+        async with db.connection() as conn:
+            current_user = await authenticate_token(conn, token)
+            await ensure_room_access(conn, room, current_user)
+    except (HTTPException, PoolTimeoutError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await chat_gateway.serve(websocket, room, current_user["id"])
+
+@app.websocket("/ws/notifications")
+async def notifications_websocket(websocket: WebSocket, token: str):
+    """Live feed of the caller's new notifications ({"type": "notification", ...} events)"""
+    try:
+        async with db.connection() as conn:
+            current_user = await authenticate_token(conn, token)
+    except (HTTPException, PoolTimeoutError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await chat_gateway.serve(
+        websocket,
+        notification_room(current_user["id"]),
+        current_user["id"],
+        extra_rooms=[broadcast_room(audience) for audience in broadcast_audiences(current_user)]
+    )
+
+@app.get("/chat/search")
+async def search_chat_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    room: Optional[str] = None,
+    limit: int = Query(CHAT_SEARCH_PAGE_SIZE, ge=1, le=CHAT_SEARCH_PAGE_MAX),
+    offset: int = Query(0, ge=0),
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
+    """Full-text search over the rooms the user can read, best matches first.
+
+    Matches on message text and sender name; every word has to match and the
+    last one may be a prefix ("hom" finds "homework"). Pass room to search a
+    single room, and offset (next_offset from the previous page) to page on.
+    """
+    if room is not None:
+        await ensure_room_access(conn, room, current_user)
+        rooms = [room]
+    else:
+        rooms = await searchable_rooms(conn, current_user)
+    
+    # Live messages and archived ones are indexed separately; search both
+    room_filter = f" AND {{}}.room IN ({', '.join('?' * len(rooms))})" if rooms is not None else ""
+    sql = f"""
+        SELECT * FROM (
+            SELECT m.id, m.room, m.sender_name, m.sender_id, m.content, m.timestamp, m.date,
+                   bm25(chat_messages_fts) AS rank,
+                   highlight(chat_messages_fts, 0, ?, ?) AS highlighted
+            FROM chat_messages_fts
+            JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+            WHERE chat_messages_fts MATCH ?{room_filter.format("m")}
+            UNION ALL
+            SELECT rowid, room, sender_name, sender_id, content, timestamp, date,
+                   bm25(chat_archive_fts),
+                   highlight(chat_archive_fts, 0, ?, ?)
+            FROM archive.chat_archive_fts
+            WHERE chat_archive_fts MATCH ?{room_filter.format("chat_archive_fts")}
+        )
+        ORDER BY rank, id DESC LIMIT ? OFFSET ?
+    """
+    params = []
+    for _ in range(2):
+        params.extend([HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, fts_query(q)])
+        if rooms is not None:
+            params.extend(rooms)
+    params.extend([limit + 1, offset])
+    
+    cursor = conn.cursor()
+    await cursor.execute(sql, params)
+    rows = await cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return {
+        "results": [
+            ChatSearchResult(
+                **chat_message_from_row(row).model_dump(),
+                highlighted=render_highlight(row["highlighted"]),
+                rank=row["rank"]
+            )
+            for row in rows
+        ],
+        "has_more": has_more,
+        "next_offset": offset + len(rows) if has_more else None
+    }
+
+@app.put("/chat/read-cursors/{room}")
+async def update_read_cursor(
+    room: str,
+    read_cursor: ChatReadCursor,
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
+    """Record that the user has read a room up to last_read_id; the cursor never moves back"""
+    await ensure_room_access(conn, room, current_user)
+    
+    cursor = conn.cursor()
+    await cursor.execute(
+        """INSERT INTO chat_read_cursors (user_id, room, last_read_id) VALUES (?, ?, ?)
+           ON CONFLICT (user_id, room) DO UPDATE SET
+               last_read_id = MAX(last_read_id, excluded.last_read_id),
+               updated_at = CURRENT_TIMESTAMP""",
+        (current_user["id"], room, read_cursor.last_read_id)
+    )
+    await conn.commit()
+    await cursor.execute(
+        "SELECT last_read_id FROM chat_read_cursors WHERE user_id = ? AND room = ?",
+        (current_user["id"], room)
+    )
+    row = await cursor.fetchone()
+    return {"room": room, "last_read_id": row["last_read_id"]}
+
+@app.get("/chat/unread-counts")
+async def get_unread_counts(current_user = Depends(get_current_user), conn = Depends(get_db)):
+    """Unread messages in every room the user can read, in one query.
+
+    Each count is a range scan of the (room, id) index past the user's read
+    cursor, capped at UNREAD_COUNT_CAP (clients show "999+").
+    """
+    rooms = await readable_rooms(conn, current_user)
+    
+    cursor = conn.cursor()
+    await cursor.execute(f"""
+        WITH rooms(room) AS (VALUES {', '.join(['(?)'] * len(rooms))})
+        SELECT rooms.room,
+               COALESCE(rc.last_read_id, 0) AS last_read_id,
+               (SELECT COUNT(*) FROM (
+                    SELECT 1 FROM chat_messages m
+                    WHERE m.room = rooms.room AND m.id > COALESCE(rc.last_read_id, 0)
+                    LIMIT ?
+               )) AS unread,
+               (SELECT MAX(id) FROM chat_messages m WHERE m.room = rooms.room) AS latest_id
+        FROM rooms
+        LEFT JOIN chat_read_cursors rc ON rc.user_id = ? AND rc.room = rooms.room
+    """, (*rooms, UNREAD_COUNT_CAP, current_user["id"]))
+    rows = await cursor.fetchall()
+    
+    return {
+        "rooms": [
+            {
+                "room": row["room"],
+                "unread": row["unread"],
+                "last_read_id": row["last_read_id"],
+                "latest_id": row["latest_id"]
+            }
+            for row in rows
+        ],
+        "total_unread": sum(row["unread"] for row in rows)
+    }
 
 # ============================================
 # ADMIN CHAT ENDPOINTS (Admin Only - Access All Year Groups)
@@ -853,39 +1780,24 @@ async def get_admin_chat_rooms(current_user = Depends(get_current_admin)):
     return {"rooms": list(rooms.values())}
 
 @app.get("/admin/chat/messages/{room}")
-async def get_admin_chat_messages(room: str, current_user = Depends(get_current_admin)):
+async def get_admin_chat_messages(
+    room: str,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_PAGE_MAX),
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
+):
     # Admin can access any room
     valid_rooms = ["year1", "year2", "year3", "year4"]
     
     if room not in valid_rooms:
         raise HTTPException(status_code=400, detail="Invalid room")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT * FROM chat_messages WHERE room = ? ORDER BY timestamp",
-        (room,)
-    )
-    messages = cursor.fetchall()
-    conn.close()
-    
-    return {
-        "messages": [
-            ChatMessageResponse(
-                id=msg["id"],
-                room=msg["room"],
-                sender_name=msg["sender_name"],
-                sender_id=msg["sender_id"],
-                content=msg["content"],
-                timestamp=msg["timestamp"],
-                date=msg["date"]
-            )
-            for msg in messages
-        ]
-    }
+    return await fetch_message_page(conn, room, before_id, after_id, limit)
 
 @app.post("/admin/chat/messages")
-async def send_admin_chat_message(message: ChatMessage, current_user = Depends(get_current_admin)):
+async def send_admin_chat_message(message: ChatMessage, current_user = Depends(get_current_admin_short)):
     # Admin can send messages to any room
     valid_rooms = ["year1", "year2", "year3", "year4"]
     
@@ -917,20 +1829,12 @@ async def send_admin_chat_message(message: ChatMessage, current_user = Depends(g
     if not admin_id:
         raise HTTPException(status_code=400, detail="Admin ID not found")
     
-    conn = None
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute(
-            """INSERT INTO chat_messages (room, user_id, sender_name, sender_id, content, timestamp, date)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (message.room, admin_id, admin_name, sender_id, 
-             message.content, timestamp, date)
+        message_id = await chat_writer.write(
+            message.room, admin_id, admin_name, sender_id, message.content, timestamp, date
         )
-        conn.commit()
-        message_id = cursor.lastrowid
         
-        return ChatMessageResponse(
+        response = ChatMessageResponse(
             id=message_id,
             room=message.room,
             sender_name=admin_name,
@@ -939,22 +1843,46 @@ async def send_admin_chat_message(message: ChatMessage, current_user = Depends(g
             timestamp=timestamp,
             date=date
         )
+        publish_chat_event(message.room, {"type": "message", "message": response.model_dump()})
+        return response
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+
+def remove_chat_message(raw_conn, message_id: int):
+    """Delete a live or archived message and return its room, or None if there is no such message.
+
+    One transaction, so a message the archiver moves meanwhile is still found.
+    """
+    raw_conn.execute("BEGIN IMMEDIATE")
+    live = raw_conn.execute("DELETE FROM chat_messages WHERE id = ? RETURNING room", (message_id,)).fetchone()
+    if live is not None:
+        return live["room"]
+    room = delete_archived(raw_conn, message_id)
+    if room is not None:
+        # The delete trigger only covers chat_messages
+        raw_conn.execute(
+            "INSERT INTO chat_message_tombstones (room, message_id) VALUES (?, ?)",
+            (room, message_id)
+        )
+    return room
+
+@app.delete("/admin/chat/messages/{message_id}")
+async def delete_chat_message(message_id: int, current_user = Depends(get_current_admin), conn = Depends(get_db)):
+    """Delete a message from any room (admin only); syncing clients receive it as a tombstone"""
+    room = await conn.transaction(remove_chat_message, message_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    publish_chat_event(room, {"type": "deleted", "message_id": message_id})
+    
+    return {"message": "Message deleted successfully"}
 
 # ============================================
 # COURSE CHATROOM ENDPOINTS
 # ============================================
 
 @app.get("/course-chatrooms")
-async def get_course_chatrooms(current_user = Depends(get_current_user)):
+async def get_course_chatrooms(current_user = Depends(get_current_user), conn = Depends(get_db)):
     """Get course chatrooms - admin sees all, students see only ones they're members of"""
-    conn = get_db()
     cursor = conn.cursor()
     
     try:
@@ -963,7 +1891,7 @@ async def get_course_chatrooms(current_user = Depends(get_current_user)):
         
         if role == "admin":
             # Admin sees all course chatrooms
-            cursor.execute("""
+            await cursor.execute("""
                 SELECT cc.id, cc.course_id, cc.room_key, c.code, c.title, 
                        ccm.role as user_role, cc.created_at
                 FROM course_chatrooms cc
@@ -973,7 +1901,7 @@ async def get_course_chatrooms(current_user = Depends(get_current_user)):
             """, (user_id,))
         else:
             # Students see only chatrooms they're members of
-            cursor.execute("""
+            await cursor.execute("""
                 SELECT cc.id, cc.course_id, cc.room_key, c.code, c.title, 
                        ccm.role as user_role, cc.created_at
                 FROM course_chatrooms cc
@@ -983,8 +1911,7 @@ async def get_course_chatrooms(current_user = Depends(get_current_user)):
                 ORDER BY c.code
             """, (user_id,))
         
-        chatrooms = cursor.fetchall()
-        conn.close()
+        chatrooms = await cursor.fetchall()
         
         return {
             "chatrooms": [
@@ -1001,14 +1928,18 @@ async def get_course_chatrooms(current_user = Depends(get_current_user)):
             ]
         }
     except Exception as e:
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=f"Failed to get chatrooms: {str(e)}")
 
 @app.get("/course-chatrooms/{room_key}/messages")
-async def get_course_chat_messages(room_key: str, current_user = Depends(get_current_user)):
+async def get_course_chat_messages(
+    room_key: str,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_PAGE_MAX),
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
+):
     """Get messages from a course chatroom"""
-    conn = get_db()
     cursor = conn.cursor()
     
     try:
@@ -1018,77 +1949,50 @@ async def get_course_chat_messages(room_key: str, current_user = Depends(get_cur
         # Verify user has access to this chatroom
         if role == "admin":
             # Admin can access any course chatroom
-            cursor.execute("SELECT id FROM course_chatrooms WHERE room_key = ?", (room_key,))
+            await cursor.execute("SELECT id FROM course_chatrooms WHERE room_key = ?", (room_key,))
         else:
             # Students must be members
-            cursor.execute("""
+            await cursor.execute("""
                 SELECT cc.id FROM course_chatrooms cc
                 JOIN course_chatroom_members ccm ON cc.id = ccm.room_id
                 WHERE cc.room_key = ? AND ccm.user_id = ?
             """, (room_key, user_id))
         
-        chatroom = cursor.fetchone()
+        chatroom = await cursor.fetchone()
         if not chatroom:
-            conn.close()
             raise HTTPException(status_code=403, detail="Access denied to this chatroom")
         
-        # Get messages
-        cursor.execute(
-            "SELECT * FROM chat_messages WHERE room = ? ORDER BY timestamp",
-            (room_key,)
-        )
-        messages = cursor.fetchall()
-        conn.close()
-        
-        return {
-            "messages": [
-                ChatMessageResponse(
-                    id=msg["id"],
-                    room=msg["room"],
-                    sender_name=msg["sender_name"],
-                    sender_id=msg["sender_id"],
-                    content=msg["content"],
-                    timestamp=msg["timestamp"],
-                    date=msg["date"]
-                )
-                for msg in messages
-            ]
-        }
+        return await fetch_message_page(conn, room_key, before_id, after_id, limit)
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=f"Failed to get messages: {str(e)}")
 
 @app.post("/course-chatrooms/{room_key}/messages")
-async def send_course_chat_message(room_key: str, message: ChatMessage, current_user = Depends(get_current_user)):
+async def send_course_chat_message(room_key: str, message: ChatMessage, current_user = Depends(get_current_user_short)):
     """Send message to a course chatroom"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
     try:
         user_id = current_user["id"]
         role = current_user["role"] if "role" in current_user.keys() else "student"
         
-        # Verify user has access to this chatroom
-        if role == "admin":
-            cursor.execute("SELECT id FROM course_chatrooms WHERE room_key = ?", (room_key,))
-        else:
-            cursor.execute("""
-                SELECT cc.id FROM course_chatrooms cc
-                JOIN course_chatroom_members ccm ON cc.id = ccm.room_id
-                WHERE cc.room_key = ? AND ccm.user_id = ?
-            """, (room_key, user_id))
-        
-        chatroom = cursor.fetchone()
+        # Verify user has access to this chatroom. The write goes through the
+        # chat writer's own connection, so none is held while it is queued
+        async with short_db() as conn:
+            cursor = conn.cursor()
+            if role == "admin":
+                await cursor.execute("SELECT id FROM course_chatrooms WHERE room_key = ?", (room_key,))
+            else:
+                await cursor.execute("""
+                    SELECT cc.id FROM course_chatrooms cc
+                    JOIN course_chatroom_members ccm ON cc.id = ccm.room_id
+                    WHERE cc.room_key = ? AND ccm.user_id = ?
+                """, (room_key, user_id))
+            chatroom = await cursor.fetchone()
         if not chatroom:
-            conn.close()
             raise HTTPException(status_code=403, detail="Access denied to this chatroom")
         
         # Verify room_key matches
         if message.room != room_key:
-            conn.close()
             raise HTTPException(status_code=400, detail="Room key mismatch")
         
         timestamp = int(datetime.now().timestamp() * 1000)
@@ -1106,15 +2010,11 @@ async def send_course_chat_message(room_key: str, message: ChatMessage, current_
             student_id = f"user_{user_id}"
         
         # Insert message
-        cursor.execute(
-            """INSERT INTO chat_messages (room, user_id, sender_name, sender_id, content, timestamp, date)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (room_key, user_id, sender_name, student_id, message.content, timestamp, date)
+        message_id = await chat_writer.write(
+            room_key, user_id, sender_name, student_id, message.content, timestamp, date
         )
-        conn.commit()
-        message_id = cursor.lastrowid
         
-        return ChatMessageResponse(
+        response = ChatMessageResponse(
             id=message_id,
             room=room_key,
             sender_name=sender_name,
@@ -1123,43 +2023,34 @@ async def send_course_chat_message(room_key: str, message: ChatMessage, current_
             timestamp=timestamp,
             date=date
         )
+        publish_chat_event(room_key, {"type": "message", "message": response.model_dump()})
+        return response
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
-            conn.close()
         raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 @app.delete("/course-chatrooms/{room_key}")
-async def delete_course_chatroom(room_key: str, current_user = Depends(get_current_admin)):
+async def delete_course_chatroom(room_key: str, current_user = Depends(get_current_admin), conn = Depends(get_db)):
     """Delete a course chatroom (admin only)"""
-    conn = get_db()
     cursor = conn.cursor()
     
     try:
         # Verify chatroom exists
-        cursor.execute("SELECT id, course_id FROM course_chatrooms WHERE room_key = ?", (room_key,))
-        chatroom = cursor.fetchone()
+        await cursor.execute("SELECT id, course_id FROM course_chatrooms WHERE room_key = ?", (room_key,))
+        chatroom = await cursor.fetchone()
         if not chatroom:
-            conn.close()
             raise HTTPException(status_code=404, detail="Chatroom not found")
         
         # Delete chatroom (cascade will delete members and messages)
-        cursor.execute("DELETE FROM course_chatrooms WHERE room_key = ?", (room_key,))
-        conn.commit()
-        conn.close()
+        await cursor.execute("DELETE FROM course_chatrooms WHERE room_key = ?", (room_key,))
+        await conn.commit()
         
         return {"message": "Chatroom deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
-            conn.close()
+        await conn.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete chatroom: {str(e)}")
 
 # ============================================
@@ -1167,46 +2058,43 @@ async def delete_course_chatroom(room_key: str, current_user = Depends(get_curre
 # ============================================
 
 @app.post("/courses", response_model=CourseResponse)
-async def create_course(course: CourseCreate, current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def create_course(course: CourseCreate, current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
     try:
-        cursor.execute(
+        await cursor.execute(
             "INSERT INTO courses (code, title, credits) VALUES (?, ?, ?)",
             (course.code, course.title, course.credits)
         )
-        conn.commit()
+        await conn.commit()
         course_id = cursor.lastrowid
         
         # Create chatroom for the course
         try:
             admin_id = current_user["id"]
             room_key = f"course_{course_id}"
-            cursor.execute(
+            await cursor.execute(
                 "INSERT INTO course_chatrooms (course_id, room_key, created_by) VALUES (?, ?, ?)",
                 (course_id, room_key, admin_id)
             )
-            conn.commit()
+            await conn.commit()
             room_id = cursor.lastrowid
             
             # Add admin as administrator of the chatroom
-            cursor.execute(
+            await cursor.execute(
                 "INSERT INTO course_chatroom_members (room_id, user_id, role) VALUES (?, ?, ?)",
                 (room_id, admin_id, "admin")
             )
-            conn.commit()
+            await conn.commit()
         except Exception as e:
             # Log error but don't fail course creation
             print(f"Warning: Failed to create chatroom for course {course_id}: {str(e)}")
         
     except sqlite3.IntegrityError:
-        conn.close()
         raise HTTPException(status_code=400, detail="Course code already exists")
     
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    new_course = cursor.fetchone()
-    conn.close()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+    new_course = await cursor.fetchone()
     
     return CourseResponse(
         id=new_course["id"],
@@ -1216,12 +2104,10 @@ async def create_course(course: CourseCreate, current_user = Depends(get_current
     )
 
 @app.get("/courses", response_model=List[CourseResponse])
-async def get_courses(current_user = Depends(get_current_user)):
-    conn = get_db()
+async def get_courses(current_user = Depends(get_current_user), conn = Depends(get_db)):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM courses ORDER BY code")
-    courses = cursor.fetchall()
-    conn.close()
+    await cursor.execute("SELECT * FROM courses ORDER BY code")
+    courses = await cursor.fetchall()
     
     return [
         CourseResponse(
@@ -1234,12 +2120,10 @@ async def get_courses(current_user = Depends(get_current_user)):
     ]
 
 @app.get("/courses/{course_id}", response_model=CourseResponse)
-async def get_course(course_id: int, current_user = Depends(get_current_user)):
-    conn = get_db()
+async def get_course(course_id: int, current_user = Depends(get_current_user), conn = Depends(get_db)):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    course = cursor.fetchone()
-    conn.close()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+    course = await cursor.fetchone()
     
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -1252,29 +2136,25 @@ async def get_course(course_id: int, current_user = Depends(get_current_user)):
     )
 
 @app.put("/courses/{course_id}", response_model=CourseResponse)
-async def update_course(course_id: int, course: CourseCreate, current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def update_course(course_id: int, course: CourseCreate, current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    existing = cursor.fetchone()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+    existing = await cursor.fetchone()
     if not existing:
-        conn.close()
         raise HTTPException(status_code=404, detail="Course not found")
     
     try:
-        cursor.execute(
+        await cursor.execute(
             "UPDATE courses SET code = ?, title = ?, credits = ? WHERE id = ?",
             (course.code, course.title, course.credits, course_id)
         )
-        conn.commit()
+        await conn.commit()
     except sqlite3.IntegrityError:
-        conn.close()
         raise HTTPException(status_code=400, detail="Course code already exists")
     
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    updated = cursor.fetchone()
-    conn.close()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+    updated = await cursor.fetchone()
     
     return CourseResponse(
         id=updated["id"],
@@ -1284,19 +2164,16 @@ async def update_course(course_id: int, course: CourseCreate, current_user = Dep
     )
 
 @app.delete("/courses/{course_id}")
-async def delete_course(course_id: int, current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def delete_course(course_id: int, current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    course = cursor.fetchone()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+    course = await cursor.fetchone()
     if not course:
-        conn.close()
         raise HTTPException(status_code=404, detail="Course not found")
     
-    cursor.execute("DELETE FROM courses WHERE id = ?", (course_id,))
-    conn.commit()
-    conn.close()
+    await cursor.execute("DELETE FROM courses WHERE id = ?", (course_id,))
+    await conn.commit()
     
     return {"message": "Course deleted successfully"}
 
@@ -1307,45 +2184,44 @@ async def delete_course(course_id: int, current_user = Depends(get_current_admin
 @app.post("/course-registrations", response_model=List[CourseRegistrationResponse])
 async def create_course_registrations(
     registration: CourseRegistrationCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
     role = current_user["role"] if "role" in current_user.keys() else "student"
     if role == "admin":
         raise HTTPException(status_code=403, detail="Students only")
     
-    conn = get_db()
     cursor = conn.cursor()
     created_registrations = []
     
     for course_id in registration.course_ids:
         # Check if course exists
-        cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-        course = cursor.fetchone()
+        await cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
+        course = await cursor.fetchone()
         if not course:
-            conn.close()
             raise HTTPException(status_code=404, detail=f"Course {course_id} not found")
         
         # Check if already registered
-        cursor.execute(
+        await cursor.execute(
             """SELECT * FROM course_registrations 
                WHERE student_id = ? AND course_id = ? AND semester = ? AND year = ?""",
             (current_user["id"], course_id, registration.semester, registration.year)
         )
-        existing = cursor.fetchone()
+        existing = await cursor.fetchone()
         if existing:
             continue  # Skip if already registered
         
         # Create registration
-        cursor.execute(
+        await cursor.execute(
             """INSERT INTO course_registrations (student_id, course_id, semester, year, status)
                VALUES (?, ?, ?, ?, 'pending')""",
             (current_user["id"], course_id, registration.semester, registration.year)
         )
-        conn.commit()
+        await conn.commit()
         reg_id = cursor.lastrowid
         
         # Get created registration
-        cursor.execute(
+        await cursor.execute(
             """SELECT cr.*, u.name, u.student_id AS user_student_id, c.code, c.title, c.credits
                FROM course_registrations cr
                JOIN users u ON cr.student_id = u.id
@@ -1353,11 +2229,9 @@ async def create_course_registrations(
                WHERE cr.id = ?""",
             (reg_id,)
         )
-        reg = cursor.fetchone()
+        reg = await cursor.fetchone()
         created_registrations.append(reg)
     
-    conn.close()
-    
     return [
         CourseRegistrationResponse(
             id=r["id"],
@@ -1379,16 +2253,16 @@ async def create_course_registrations(
 @app.get("/course-registrations", response_model=List[CourseRegistrationResponse])
 async def get_course_registrations(
     status: Optional[str] = None,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
     cursor = conn.cursor()
     
     role = current_user["role"] if "role" in current_user.keys() else "student"
     if role == "admin":
         # Admin sees all registrations
         if status:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT cr.*, u.name, u.student_id AS user_student_id, c.code, c.title, c.credits
                    FROM course_registrations cr
                    JOIN users u ON cr.student_id = u.id
@@ -1398,7 +2272,7 @@ async def get_course_registrations(
                 (status,)
             )
         else:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT cr.*, u.name, u.student_id AS user_student_id, c.code, c.title, c.credits
                    FROM course_registrations cr
                    JOIN users u ON cr.student_id = u.id
@@ -1408,7 +2282,7 @@ async def get_course_registrations(
     else:
         # Students see only their registrations
         if status:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT cr.*, u.name, u.student_id AS user_student_id, c.code, c.title, c.credits
                    FROM course_registrations cr
                    JOIN users u ON cr.student_id = u.id
@@ -1418,7 +2292,7 @@ async def get_course_registrations(
                 (current_user["id"], status)
             )
         else:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT cr.*, u.name, u.student_id AS user_student_id, c.code, c.title, c.credits
                    FROM course_registrations cr
                    JOIN users u ON cr.student_id = u.id
@@ -1428,8 +2302,7 @@ async def get_course_registrations(
                 (current_user["id"],)
             )
     
-    registrations = cursor.fetchall()
-    conn.close()
+    registrations = await cursor.fetchall()
     
     return [
         CourseRegistrationResponse(
@@ -1452,14 +2325,14 @@ async def get_course_registrations(
 @app.get("/courses/{course_id}/students", response_model=List[dict])
 async def get_course_students(
     course_id: int,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
     """Get all registered students for a specific course with their grades"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Get all approved registrations for this course
-    cursor.execute(
+    await cursor.execute(
         """SELECT cr.student_id, u.student_id AS user_student_id, u.name, cr.semester, cr.year
            FROM course_registrations cr
            JOIN users u ON cr.student_id = u.id
@@ -1467,16 +2340,16 @@ async def get_course_students(
            ORDER BY u.student_id""",
         (course_id,)
     )
-    registrations = cursor.fetchall()
+    registrations = await cursor.fetchall()
     
     # Get all grades for this course
-    cursor.execute(
+    await cursor.execute(
         """SELECT g.student_id, g.grade, g.semester, g.year
            FROM grades g
            WHERE g.course_id = ?""",
         (course_id,)
     )
-    grades = cursor.fetchall()
+    grades = await cursor.fetchall()
     
     # Create a map of student_id -> grade
     grade_map = {}
@@ -1497,32 +2370,30 @@ async def get_course_students(
             "year": reg["year"]
         })
     
-    conn.close()
     return result
 
 @app.patch("/course-registrations/{registration_id}")
 async def update_registration_status(
     registration_id: int,
     status: str,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
     if status not in ["approved", "rejected"]:
         raise HTTPException(status_code=400, detail="Status must be 'approved' or 'rejected'")
     
-    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM course_registrations WHERE id = ?", (registration_id,))
-    registration = cursor.fetchone()
+    await cursor.execute("SELECT * FROM course_registrations WHERE id = ?", (registration_id,))
+    registration = await cursor.fetchone()
     if not registration:
-        conn.close()
         raise HTTPException(status_code=404, detail="Registration not found")
     
-    cursor.execute(
+    await cursor.execute(
         "UPDATE course_registrations SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
         (status, registration_id)
     )
-    conn.commit()
+    await conn.commit()
     
     # If approved, add student to course chatroom
     if status == "approved":
@@ -1531,21 +2402,21 @@ async def update_registration_status(
             student_id = registration["student_id"]
             
             # Find the course chatroom
-            cursor.execute(
+            await cursor.execute(
                 "SELECT id FROM course_chatrooms WHERE course_id = ?",
                 (course_id,)
             )
-            chatroom = cursor.fetchone()
+            chatroom = await cursor.fetchone()
             
             if chatroom:
                 room_id = chatroom["id"]
                 # Add student to chatroom (ignore if already exists)
                 try:
-                    cursor.execute(
+                    await cursor.execute(
                         "INSERT INTO course_chatroom_members (room_id, user_id, role) VALUES (?, ?, ?)",
                         (room_id, student_id, "member")
                     )
-                    conn.commit()
+                    await conn.commit()
                 except sqlite3.IntegrityError:
                     # Student already in chatroom, ignore
                     pass
@@ -1554,18 +2425,15 @@ async def update_registration_status(
             print(f"Warning: Failed to add student to chatroom: {str(e)}")
     
     # Create notification for student
-    cursor.execute(
+    title = f"Course Registration {status.capitalize()}"
+    notification_message = f"Your registration for course has been {status}."
+    await cursor.execute(
         """INSERT INTO notifications (user_id, type, title, message)
            VALUES (?, ?, ?, ?)""",
-        (
-            registration["student_id"],
-            "registration_update",
-            f"Course Registration {status.capitalize()}",
-            f"Your registration for course has been {status}."
-        )
+        (registration["student_id"], "registration_update", title, notification_message)
     )
-    conn.commit()
-    conn.close()
+    await conn.commit()
+    publish_notifications([registration["student_id"]], "registration_update", title, notification_message)
     
     return {"message": f"Registration {status} successfully"}
 
@@ -1574,46 +2442,42 @@ async def update_registration_status(
 # ============================================
 
 @app.post("/grades", response_model=GradeResponse)
-async def create_grade(grade: GradeCreate, current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def create_grade(grade: GradeCreate, current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
     # Verify student exists
-    cursor.execute("SELECT * FROM users WHERE id = ?", (grade.student_id,))
-    student = cursor.fetchone()
+    await cursor.execute("SELECT * FROM users WHERE id = ?", (grade.student_id,))
+    student = await cursor.fetchone()
     if not student:
-        conn.close()
         raise HTTPException(status_code=404, detail="Student not found")
     
     # Verify course exists
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (grade.course_id,))
-    course = cursor.fetchone()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (grade.course_id,))
+    course = await cursor.fetchone()
     if not course:
-        conn.close()
         raise HTTPException(status_code=404, detail="Course not found")
     
     # Check if registration is approved
-    cursor.execute(
+    await cursor.execute(
         """SELECT * FROM course_registrations 
            WHERE student_id = ? AND course_id = ? AND semester = ? AND year = ? AND status = 'approved'""",
         (grade.student_id, grade.course_id, grade.semester, grade.year)
     )
-    registration = cursor.fetchone()
+    registration = await cursor.fetchone()
     if not registration:
-        conn.close()
         raise HTTPException(status_code=400, detail="Student is not enrolled in this course")
     
     # Check if grade already exists
-    cursor.execute(
+    await cursor.execute(
         """SELECT id FROM grades 
            WHERE student_id = ? AND course_id = ? AND semester = ? AND year = ?""",
         (grade.student_id, grade.course_id, grade.semester, grade.year)
     )
-    existing_grade = cursor.fetchone()
+    existing_grade = await cursor.fetchone()
     
     if existing_grade:
         # Update existing grade
-        cursor.execute(
+        await cursor.execute(
             """UPDATE grades SET grade = ?, updated_at = CURRENT_TIMESTAMP
                WHERE id = ?""",
             (grade.grade, existing_grade["id"])
@@ -1621,17 +2485,17 @@ async def create_grade(grade: GradeCreate, current_user = Depends(get_current_ad
         grade_id = existing_grade["id"]
     else:
         # Insert new grade
-        cursor.execute(
+        await cursor.execute(
             """INSERT INTO grades (student_id, course_id, grade, semester, year)
                VALUES (?, ?, ?, ?, ?)""",
             (grade.student_id, grade.course_id, grade.grade, grade.semester, grade.year)
         )
         grade_id = cursor.lastrowid
     
-    conn.commit()
+    await conn.commit()
     
     # Get created/updated grade
-    cursor.execute(
+    await cursor.execute(
         """SELECT g.*, u.name, c.code, c.title, c.credits
            FROM grades g
            JOIN users u ON g.student_id = u.id
@@ -1639,21 +2503,17 @@ async def create_grade(grade: GradeCreate, current_user = Depends(get_current_ad
            WHERE g.id = ?""",
         (grade_id,)
     )
-    grade_data = cursor.fetchone()
+    grade_data = await cursor.fetchone()
     
     # Create notification for student
-    cursor.execute(
+    notification_message = f"Your grade for {course['code']} has been released: {grade.grade}"
+    await cursor.execute(
         """INSERT INTO notifications (user_id, type, title, message)
            VALUES (?, ?, ?, ?)""",
-        (
-            grade.student_id,
-            "grade_released",
-            "Grade Released",
-            f"Your grade for {course['code']} has been released: {grade.grade}"
-        )
+        (grade.student_id, "grade_released", "Grade Released", notification_message)
     )
-    conn.commit()
-    conn.close()
+    await conn.commit()
+    publish_notifications([grade.student_id], "grade_released", "Grade Released", notification_message)
     
     return GradeResponse(
         id=grade_data["id"],
@@ -1672,16 +2532,16 @@ async def create_grade(grade: GradeCreate, current_user = Depends(get_current_ad
 async def get_grades(
     student_id: Optional[int] = None,
     course_id: Optional[int] = None,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
     cursor = conn.cursor()
     
     role = current_user["role"] if "role" in current_user.keys() else "student"
     if role == "admin":
         # Admin can see all grades or filter
         if student_id and course_id:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT g.*, u.name, u.student_id as user_student_id, c.code, c.title, c.credits
                    FROM grades g
                    JOIN users u ON g.student_id = u.id
@@ -1690,7 +2550,7 @@ async def get_grades(
                 (student_id, course_id)
             )
         elif student_id:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT g.*, u.name, u.student_id as user_student_id, c.code, c.title, c.credits
                    FROM grades g
                    JOIN users u ON g.student_id = u.id
@@ -1699,7 +2559,7 @@ async def get_grades(
                 (student_id,)
             )
         elif course_id:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT g.*, u.name, u.student_id as user_student_id, c.code, c.title, c.credits
                    FROM grades g
                    JOIN users u ON g.student_id = u.id
@@ -1709,7 +2569,7 @@ async def get_grades(
                 (course_id,)
             )
         else:
-            cursor.execute(
+            await cursor.execute(
                 """SELECT g.*, u.name, u.student_id as user_student_id, c.code, c.title, c.credits
                    FROM grades g
                    JOIN users u ON g.student_id = u.id
@@ -1718,7 +2578,7 @@ async def get_grades(
             )
     else:
         # Students see only their grades
-        cursor.execute(
+        await cursor.execute(
             """SELECT g.*, u.name, c.code, c.title, c.credits
                FROM grades g
                JOIN users u ON g.student_id = u.id
@@ -1728,8 +2588,7 @@ async def get_grades(
             (current_user["id"],)
         )
     
-    grades = cursor.fetchall()
-    conn.close()
+    grades = await cursor.fetchall()
     
     return [
         GradeResponse(
@@ -1778,25 +2637,24 @@ def calculate_gpa(grades_data):
 @app.get("/transcript/{student_id}", response_model=TranscriptResponse)
 async def get_transcript(
     student_id: int,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
     # Students can only see their own transcript
     role = current_user["role"] if "role" in current_user.keys() else "student"
     if role != "admin" and current_user["id"] != student_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    conn = get_db()
     cursor = conn.cursor()
     
     # Get student info
-    cursor.execute("SELECT * FROM users WHERE id = ?", (student_id,))
-    student = cursor.fetchone()
+    await cursor.execute("SELECT * FROM users WHERE id = ?", (student_id,))
+    student = await cursor.fetchone()
     if not student:
-        conn.close()
         raise HTTPException(status_code=404, detail="Student not found")
     
     # Get all grades with course info
-    cursor.execute(
+    await cursor.execute(
         """SELECT g.*, c.code, c.title, c.credits
            FROM grades g
            JOIN courses c ON g.course_id = c.id
@@ -1804,17 +2662,17 @@ async def get_transcript(
            ORDER BY g.year DESC, g.semester DESC""",
         (student_id,)
     )
-    grades = cursor.fetchall()
+    grades = await cursor.fetchall()
     
     # Get all approved registrations (for total credits calculation)
-    cursor.execute(
+    await cursor.execute(
         """SELECT DISTINCT cr.course_id, c.credits
            FROM course_registrations cr
            JOIN courses c ON cr.course_id = c.id
            WHERE cr.student_id = ? AND cr.status = 'approved'""",
         (student_id,)
     )
-    all_courses = cursor.fetchall()
+    all_courses = await cursor.fetchall()
     
     total_credits = sum(c["credits"] for c in all_courses)
     earned_credits = sum(g["credits"] for g in grades)
@@ -1834,8 +2692,6 @@ async def get_transcript(
     
     gpa = calculate_gpa(courses_data)
     
-    conn.close()
-    
     return TranscriptResponse(
         student_id=student["id"],
         student_name=student["name"],
@@ -1847,26 +2703,42 @@ async def get_transcript(
     )
 
 @app.get("/transcript", response_model=TranscriptResponse)
-async def get_my_transcript(current_user = Depends(get_current_user)):
-    return await get_transcript(current_user["id"], current_user)
+async def get_my_transcript(current_user = Depends(get_current_user), conn = Depends(get_db)):
+    return await get_transcript(current_user["id"], current_user, conn)
 
 # ============================================
 # NOTIFICATIONS ENDPOINTS
 # ============================================
 
 @app.get("/notifications", response_model=List[NotificationResponse])
-async def get_notifications(current_user = Depends(get_current_user)):
-    conn = get_db()
+async def get_notifications(current_user = Depends(get_current_user), conn = Depends(get_db)):
+    """The newest 50 of the user's own notifications and the broadcasts sent to them since they joined"""
     cursor = conn.cursor()
-    cursor.execute(
-        """SELECT * FROM notifications 
-           WHERE user_id = ? 
-           ORDER BY created_at DESC 
-           LIMIT 50""",
-        (current_user["id"],)
+    audiences = broadcast_audiences(current_user)
+    await cursor.execute(
+        f"""SELECT * FROM (
+                SELECT * FROM (
+                    SELECT id, type, title, message, is_read, created_at FROM notifications
+                    WHERE user_id = ?
+                    ORDER BY created_at DESC
+                    LIMIT 50
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT -b.id, b.type, b.title, b.message,
+                           EXISTS (SELECT 1 FROM broadcast_reads r WHERE r.user_id = ? AND r.broadcast_id = b.id),
+                           b.created_at
+                    FROM broadcast_notifications b
+                    WHERE b.audience IN ({', '.join(['?'] * len(audiences))}) AND b.created_at >= ?
+                    ORDER BY b.created_at DESC
+                    LIMIT 50
+                )
+            )
+            ORDER BY created_at DESC
+            LIMIT 50""",
+        (current_user["id"], current_user["id"], *audiences, current_user["created_at"])
     )
-    notifications = cursor.fetchall()
-    conn.close()
+    notifications = await cursor.fetchall()
     
     return [
         NotificationResponse(
@@ -1883,33 +2755,77 @@ async def get_notifications(current_user = Depends(get_current_user)):
 @app.patch("/notifications/{notification_id}/read")
 async def mark_notification_read(
     notification_id: int,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute(
-        "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ?",
-        (notification_id, current_user["id"])
-    )
-    conn.commit()
-    conn.close()
+    if notification_id < 0:
+        await cursor.execute(
+            """INSERT OR IGNORE INTO broadcast_reads (user_id, broadcast_id)
+               SELECT ?, id FROM broadcast_notifications WHERE id = ?""",
+            (current_user["id"], -notification_id)
+        )
+    else:
+        await cursor.execute(
+            "UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ?",
+            (notification_id, current_user["id"])
+        )
+    await conn.commit()
     
     return {"message": "Notification marked as read"}
 
 @app.get("/notifications/unread-count")
-async def get_unread_count(current_user = Depends(get_current_user)):
-    conn = get_db()
+async def get_unread_count(current_user = Depends(get_current_user), conn = Depends(get_db)):
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = 0",
-        (current_user["id"],)
+    audiences = broadcast_audiences(current_user)
+    await cursor.execute(
+        f"""SELECT (SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = 0)
+                 + (SELECT COUNT(*) FROM broadcast_notifications b
+                    WHERE b.audience IN ({', '.join(['?'] * len(audiences))}) AND b.created_at >= ?
+                      AND NOT EXISTS (SELECT 1 FROM broadcast_reads r WHERE r.user_id = ? AND r.broadcast_id = b.id)
+                   ) as count""",
+        (current_user["id"], *audiences, current_user["created_at"], current_user["id"])
     )
-    result = cursor.fetchone()
-    conn.close()
+    result = await cursor.fetchone()
     
     return {"count": result["count"]}
 
+@app.get("/notifications/fanouts/{fanout_id}", response_model=NotificationFanoutResponse)
+async def get_notification_fanout(
+    fanout_id: int,
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
+):
+    """Progress of a notification fan-out queued by an attendance session"""
+    cursor = conn.cursor()
+    await cursor.execute("SELECT * FROM notification_fanouts WHERE id = ?", (fanout_id,))
+    fanout = await cursor.fetchone()
+    if not fanout:
+        raise HTTPException(status_code=404, detail="Notification fan-out not found")
+    
+    total, sent = fanout["total"], fanout["sent"]
+    if fanout["status"] == "done":
+        progress = 1.0
+    else:
+        progress = round(sent / total, 4) if total else 0.0
+    duration_ms = None
+    if fanout["started_at"] is not None and fanout["finished_at"] is not None:
+        duration_ms = round((fanout["finished_at"] - fanout["started_at"]) * 1000, 1)
+    
+    return NotificationFanoutResponse(
+        id=fanout["id"],
+        type=fanout["type"],
+        title=fanout["title"],
+        status=fanout["status"],
+        total=total,
+        sent=sent,
+        progress=progress,
+        error=fanout["error"],
+        created_at=fanout["created_at"],
+        duration_ms=duration_ms
+    )
+
 # ============================================
 # ANNOUNCEMENTS ENDPOINTS
 # ============================================
@@ -1917,44 +2833,35 @@ async def get_unread_count(current_user = Depends(get_current_user)):
 @app.post("/announcements", response_model=AnnouncementResponse)
 async def create_announcement(
     announcement: AnnouncementCreate,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute(
+    await cursor.execute(
         "INSERT INTO announcements (admin_id, title, content) VALUES (?, ?, ?)",
         (current_user["id"], announcement.title, announcement.content)
     )
-    conn.commit()
     announcement_id = cursor.lastrowid
     
-    # Create notifications for all students
-    cursor.execute("SELECT id FROM users WHERE role = 'student'")
-    students = cursor.fetchall()
-    for student in students:
-        cursor.execute(
-            """INSERT INTO notifications (user_id, type, title, message)
-               VALUES (?, ?, ?, ?)""",
-            (
-                student["id"],
-                "announcement",
-                announcement.title,
-                announcement.content[:100] + "..." if len(announcement.content) > 100 else announcement.content
-            )
-        )
-    conn.commit()
-    conn.close()
+    # One broadcast notification for all students
+    preview = announcement.content[:100] + "..." if len(announcement.content) > 100 else announcement.content
+    await cursor.execute(
+        """INSERT INTO broadcast_notifications (audience, type, title, message, created_by)
+           VALUES (?, ?, ?, ?, ?)""",
+        ("students", "announcement", announcement.title, preview, current_user["id"])
+    )
+    await conn.commit()
+    publish_broadcast("students", "announcement", announcement.title, preview)
     
-    cursor.execute(
+    await cursor.execute(
         """SELECT a.*, u.name as admin_name
            FROM announcements a
            JOIN users u ON a.admin_id = u.id
            WHERE a.id = ?""",
         (announcement_id,)
     )
-    ann = cursor.fetchone()
-    conn.close()
+    ann = await cursor.fetchone()
     
     return AnnouncementResponse(
         id=ann["id"],
@@ -1966,18 +2873,16 @@ async def create_announcement(
     )
 
 @app.get("/announcements", response_model=List[AnnouncementResponse])
-async def get_announcements(current_user = Depends(get_current_user)):
-    conn = get_db()
+async def get_announcements(current_user = Depends(get_current_user), conn = Depends(get_db)):
     cursor = conn.cursor()
-    cursor.execute(
+    await cursor.execute(
         """SELECT a.*, u.name as admin_name
            FROM announcements a
            JOIN users u ON a.admin_id = u.id
            ORDER BY a.created_at DESC
            LIMIT 20"""
     )
-    announcements = cursor.fetchall()
-    conn.close()
+    announcements = await cursor.fetchall()
     
     return [
         AnnouncementResponse(
@@ -1996,31 +2901,28 @@ async def get_announcements(current_user = Depends(get_current_user)):
 # ============================================
 
 @app.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_dashboard_stats(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
     # Total students
-    cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'student'")
-    total_students = cursor.fetchone()["count"]
+    await cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'student'")
+    total_students = (await cursor.fetchone())["count"]
     
     # Pending registrations
-    cursor.execute("SELECT COUNT(*) as count FROM course_registrations WHERE status = 'pending'")
-    pending_registrations = cursor.fetchone()["count"]
+    await cursor.execute("SELECT COUNT(*) as count FROM course_registrations WHERE status = 'pending'")
+    pending_registrations = (await cursor.fetchone())["count"]
     
     # Approved courses (total approved registrations)
-    cursor.execute("SELECT COUNT(*) as count FROM course_registrations WHERE status = 'approved'")
-    approved_courses = cursor.fetchone()["count"]
+    await cursor.execute("SELECT COUNT(*) as count FROM course_registrations WHERE status = 'approved'")
+    approved_courses = (await cursor.fetchone())["count"]
     
     # Total courses
-    cursor.execute("SELECT COUNT(*) as count FROM courses")
-    total_courses = cursor.fetchone()["count"]
+    await cursor.execute("SELECT COUNT(*) as count FROM courses")
+    total_courses = (await cursor.fetchone())["count"]
     
     # Students with grades
-    cursor.execute("SELECT COUNT(DISTINCT student_id) as count FROM grades")
-    students_with_grades = cursor.fetchone()["count"]
-    
-    conn.close()
+    await cursor.execute("SELECT COUNT(DISTINCT student_id) as count FROM grades")
+    students_with_grades = (await cursor.fetchone())["count"]
     
     return DashboardStats(
         total_students=total_students,
@@ -2031,12 +2933,10 @@ async def get_dashboard_stats(current_user = Depends(get_current_admin)):
     )
 
 @app.get("/students", response_model=List[UserResponse])
-async def get_students(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_students(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE role = 'student' ORDER BY student_id")
-    students = cursor.fetchall()
-    conn.close()
+    await cursor.execute("SELECT * FROM users WHERE role = 'student' ORDER BY student_id")
+    students = await cursor.fetchall()
     
     return [
         UserResponse(
@@ -2056,56 +2956,62 @@ async def get_students(current_user = Depends(get_current_admin)):
 # ============================================
 
 @app.get("/dashboard/booking-stats", response_model=BookingStats)
-async def get_booking_stats(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_booking_stats(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
+    # Live bookings plus the per-day counts of bookings moved to booking_history
+    per_day = """
+        WITH per_day(day, room_name, count) AS (
+            SELECT date(created_at), room_name, COUNT(*) FROM bookings GROUP BY 1, 2
+            UNION ALL
+            SELECT day, room_name, bookings FROM booking_stats_daily
+        )
+    """
+    
     # Daily bookings (last 30 days)
-    cursor.execute("""
-        SELECT strftime('%Y-%m-%d', created_at) as date, COUNT(*) as count
-        FROM bookings
-        WHERE created_at >= datetime('now', '-30 days')
-        GROUP BY strftime('%Y-%m-%d', created_at)
+    await cursor.execute(per_day + """
+        SELECT day as date, SUM(count) as count
+        FROM per_day
+        WHERE day >= date('now', '-30 days')
+        GROUP BY day
         ORDER BY date
     """)
-    daily_data = cursor.fetchall()
+    daily_data = await cursor.fetchall()
     daily = [{"date": row["date"], "count": row["count"]} for row in daily_data]
     
     # Weekly bookings (last 12 weeks)
-    cursor.execute("""
-        SELECT strftime('%Y-W%W', created_at) as week, COUNT(*) as count
-        FROM bookings
-        WHERE created_at >= datetime('now', '-84 days')
-        GROUP BY strftime('%Y-W%W', created_at)
+    await cursor.execute(per_day + """
+        SELECT strftime('%Y-W%W', day) as week, SUM(count) as count
+        FROM per_day
+        WHERE day >= date('now', '-84 days')
+        GROUP BY strftime('%Y-W%W', day)
         ORDER BY week
     """)
-    weekly_data = cursor.fetchall()
+    weekly_data = await cursor.fetchall()
     weekly = [{"week": row["week"], "count": row["count"]} for row in weekly_data]
     
     # Monthly bookings (last 12 months)
-    cursor.execute("""
-        SELECT strftime('%Y-%m', created_at) as month, COUNT(*) as count
-        FROM bookings
-        WHERE created_at >= datetime('now', '-12 months')
-        GROUP BY strftime('%Y-%m', created_at)
+    await cursor.execute(per_day + """
+        SELECT strftime('%Y-%m', day) as month, SUM(count) as count
+        FROM per_day
+        WHERE day >= date('now', '-12 months')
+        GROUP BY strftime('%Y-%m', day)
         ORDER BY month
     """)
-    monthly_data = cursor.fetchall()
+    monthly_data = await cursor.fetchall()
     monthly = [{"month": row["month"], "count": row["count"]} for row in monthly_data]
     
     # Most booked rooms
-    cursor.execute("""
-        SELECT room_name, COUNT(*) as count
-        FROM bookings
+    await cursor.execute(per_day + """
+        SELECT room_name, SUM(count) as count
+        FROM per_day
         GROUP BY room_name
         ORDER BY count DESC
         LIMIT 10
     """)
-    rooms_data = cursor.fetchall()
+    rooms_data = await cursor.fetchall()
     most_booked_rooms = [{"room_name": row["room_name"], "count": row["count"]} for row in rooms_data]
     
-    conn.close()
-    
     return BookingStats(
         daily=daily,
         weekly=weekly,
@@ -2114,37 +3020,43 @@ async def get_booking_stats(current_user = Depends(get_current_admin)):
     )
 
 @app.get("/dashboard/chat-stats", response_model=ChatStats)
-async def get_chat_stats(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_chat_stats(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
+    # Live messages plus the per-day counts of archived ones
+    per_day = """
+        WITH per_day(room, date, count) AS (
+            SELECT room, date, COUNT(*) FROM chat_messages GROUP BY room, date
+            UNION ALL
+            SELECT room, date, messages FROM archive.chat_archive_stats
+        )
+    """
+    
     # Total messages
-    cursor.execute("SELECT COUNT(*) as count FROM chat_messages")
-    total_messages = cursor.fetchone()["count"]
+    await cursor.execute(per_day + "SELECT COALESCE(SUM(count), 0) as count FROM per_day")
+    total_messages = (await cursor.fetchone())["count"]
     
     # Messages by room
-    cursor.execute("""
-        SELECT room, COUNT(*) as count
-        FROM chat_messages
+    await cursor.execute(per_day + """
+        SELECT room, SUM(count) as count
+        FROM per_day
         GROUP BY room
         ORDER BY count DESC
     """)
-    rooms_data = cursor.fetchall()
+    rooms_data = await cursor.fetchall()
     messages_by_room = [{"room": row["room"], "count": row["count"]} for row in rooms_data]
     
     # Messages by date (last 30 days)
-    cursor.execute("""
-        SELECT date, COUNT(*) as count
-        FROM chat_messages
+    await cursor.execute(per_day + """
+        SELECT date, SUM(count) as count
+        FROM per_day
         WHERE date >= date('now', '-30 days')
         GROUP BY date
         ORDER BY date
     """)
-    date_data = cursor.fetchall()
+    date_data = await cursor.fetchall()
     messages_by_date = [{"date": row["date"], "count": row["count"]} for row in date_data]
     
-    conn.close()
-    
     return ChatStats(
         total_messages=total_messages,
         messages_by_room=messages_by_room,
@@ -2152,17 +3064,16 @@ async def get_chat_stats(current_user = Depends(get_current_admin)):
     )
 
 @app.get("/dashboard/gpa-stats", response_model=GPAStats)
-async def get_gpa_stats(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_gpa_stats(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
     # Get all grades with credits
-    cursor.execute("""
+    await cursor.execute("""
         SELECT g.grade, c.credits, g.student_id
         FROM grades g
         JOIN courses c ON g.course_id = c.id
     """)
-    all_grades = cursor.fetchall()
+    all_grades = await cursor.fetchall()
     
     # Calculate GPA for each student
     grade_points = {
@@ -2215,8 +3126,6 @@ async def get_gpa_stats(current_user = Depends(get_current_admin)):
     
     gpa_distribution = [{"range": k, "count": v} for k, v in distribution.items()]
     
-    conn.close()
-    
     return GPAStats(
         average_gpa=average_gpa,
         gpa_distribution=gpa_distribution,
@@ -2224,22 +3133,21 @@ async def get_gpa_stats(current_user = Depends(get_current_admin)):
     )
 
 @app.get("/dashboard/credit-stats", response_model=CreditUsageStats)
-async def get_credit_stats(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_credit_stats(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
     # Total credits from approved registrations
-    cursor.execute("""
+    await cursor.execute("""
         SELECT SUM(c.credits) as total
         FROM course_registrations cr
         JOIN courses c ON cr.course_id = c.id
         WHERE cr.status = 'approved'
     """)
-    total_result = cursor.fetchone()
+    total_result = await cursor.fetchone()
     total_credits = total_result["total"] if total_result["total"] else 0
     
     # Credits by semester
-    cursor.execute("""
+    await cursor.execute("""
         SELECT cr.semester, cr.year, SUM(c.credits) as total
         FROM course_registrations cr
         JOIN courses c ON cr.course_id = c.id
@@ -2247,25 +3155,23 @@ async def get_credit_stats(current_user = Depends(get_current_admin)):
         GROUP BY cr.semester, cr.year
         ORDER BY cr.year DESC, cr.semester DESC
     """)
-    semester_data = cursor.fetchall()
+    semester_data = await cursor.fetchall()
     credits_by_semester = [
         {"semester": f"{row['year']}-S{row['semester']}", "credits": row["total"]}
         for row in semester_data
     ]
     
     # Average credits per student
-    cursor.execute("""
+    await cursor.execute("""
         SELECT COUNT(DISTINCT cr.student_id) as student_count
         FROM course_registrations cr
         WHERE cr.status = 'approved'
     """)
-    student_count_result = cursor.fetchone()
+    student_count_result = await cursor.fetchone()
     student_count = student_count_result["student_count"] if student_count_result["student_count"] else 1
     
     average_credits = round(total_credits / student_count, 2) if student_count > 0 else 0.0
     
-    conn.close()
-    
     return CreditUsageStats(
         total_credits=total_credits,
         credits_by_semester=credits_by_semester,
@@ -2273,35 +3179,34 @@ async def get_credit_stats(current_user = Depends(get_current_admin)):
     )
 
 @app.get("/dashboard/user-activity", response_model=UserActivityStats)
-async def get_user_activity_stats(current_user = Depends(get_current_admin)):
-    conn = get_db()
+async def get_user_activity_stats(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     cursor = conn.cursor()
     
     # New users by date (last 30 days)
-    cursor.execute("""
+    await cursor.execute("""
         SELECT strftime('%Y-%m-%d', created_at) as date, COUNT(*) as count
         FROM users
         WHERE role = 'student' AND created_at >= datetime('now', '-30 days')
         GROUP BY strftime('%Y-%m-%d', created_at)
         ORDER BY date
     """)
-    date_data = cursor.fetchall()
+    date_data = await cursor.fetchall()
     new_users_by_date = [{"date": row["date"], "count": row["count"]} for row in date_data]
     
     # Total active users (users who have made bookings or sent messages in last 30 days)
-    cursor.execute("""
+    await cursor.execute("""
         SELECT COUNT(DISTINCT user_id) as count
         FROM (
             SELECT user_id FROM bookings WHERE created_at >= datetime('now', '-30 days')
             UNION
+            SELECT user_id FROM booking_history WHERE created_at >= datetime('now', '-30 days')
+            UNION
             SELECT user_id FROM chat_messages WHERE timestamp >= (strftime('%s', 'now', '-30 days') * 1000)
         )
     """)
-    active_result = cursor.fetchone()
+    active_result = await cursor.fetchone()
     total_active_users = active_result["count"] if active_result["count"] else 0
     
-    conn.close()
-    
     return UserActivityStats(
         new_users_by_date=new_users_by_date,
         total_active_users=total_active_users
@@ -2314,9 +3219,9 @@ async def get_user_activity_stats(current_user = Depends(get_current_admin)):
 @app.put("/profile", response_model=UserResponse)
 async def update_profile(
     profile: ProfileUpdate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
     cursor = conn.cursor()
     
     updates = []
@@ -2330,25 +3235,23 @@ async def update_profile(
         values.append(profile.email)
     if profile.year is not None:
         if profile.year not in [1, 2, 3, 4]:
-            conn.close()
             raise HTTPException(status_code=400, detail="Year must be 1, 2, 3, or 4")
         updates.append("year = ?")
         values.append(profile.year)
     
     if not updates:
-        conn.close()
         raise HTTPException(status_code=400, detail="No fields to update")
     
     values.append(current_user["id"])
-    cursor.execute(
+    await cursor.execute(
         f"UPDATE users SET {', '.join(updates)} WHERE id = ?",
         values
     )
-    conn.commit()
+    await conn.commit()
+    invalidate_cached_user(current_user["student_id"])
     
-    cursor.execute("SELECT * FROM users WHERE id = ?", (current_user["id"],))
-    updated_user = cursor.fetchone()
-    conn.close()
+    await cursor.execute("SELECT * FROM users WHERE id = ?", (current_user["id"],))
+    updated_user = await cursor.fetchone()
     
     return UserResponse(
         id=updated_user["id"],
@@ -2363,17 +3266,17 @@ async def update_profile(
 @app.put("/profile/photo")
 async def update_profile_photo(
     photo_url: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
-    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute(
+    await cursor.execute(
         "UPDATE users SET profile_photo = ? WHERE id = ?",
         (photo_url, current_user["id"])
     )
-    conn.commit()
-    conn.close()
+    await conn.commit()
+    invalidate_cached_user(current_user["student_id"])
     
     return {"message": "Profile photo updated successfully"}
 
@@ -2400,6 +3303,7 @@ class AttendanceSessionResponse(BaseModel):
     time_slot: str
     created_by: int
     created_at: str
+    fanout_id: Optional[int] = None  # notification fan-out queued by the create request
 
 class AttendanceRecordResponse(BaseModel):
     id: int
@@ -2428,57 +3332,39 @@ class EventAttendanceRecordResponse(BaseModel):
 @app.post("/attendance/sessions", response_model=AttendanceSessionResponse)
 async def create_attendance_session(
     session: AttendanceSessionCreate,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
     """Create a new attendance session"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Get course info
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (session.course_id,))
-    course = cursor.fetchone()
+    await cursor.execute("SELECT * FROM courses WHERE id = ?", (session.course_id,))
+    course = await cursor.fetchone()
     if not course:
-        conn.close()
         raise HTTPException(status_code=404, detail="Course not found")
     
     # Create attendance session
-    cursor.execute(
+    await cursor.execute(
         """INSERT INTO attendance_sessions (course_id, course_code, course_title, session_date, time_slot, created_by)
            VALUES (?, ?, ?, ?, ?, ?)""",
         (session.course_id, course["code"], course["title"], session.session_date, session.time_slot, current_user["id"])
     )
     session_id = cursor.lastrowid
     
-    # Get all students registered for this course (approved registrations)
-    cursor.execute(
-        """SELECT DISTINCT u.id, u.student_id, u.name
-           FROM users u
-           JOIN course_registrations cr ON u.id = cr.student_id
-           WHERE cr.course_id = ? AND cr.status = 'approved'""",
-        (session.course_id,)
+    # Notify the students registered for this course (approved registrations) in the background
+    title = f"Attendance Check Available - {course['code']}"
+    notification_message = f"Attendance check is available for {course['code']} on {session.session_date} at {session.time_slot}. Click 'Check' to mark your attendance."
+    fanout_id = await create_fanout(
+        cursor, "course", session.course_id, "attendance", title, notification_message, current_user["id"]
     )
-    students = cursor.fetchall()
     
-    # Create notifications for all registered students
-    for student in students:
-        cursor.execute(
-            """INSERT INTO notifications (user_id, type, title, message)
-               VALUES (?, ?, ?, ?)""",
-            (
-                student["id"],
-                "attendance",
-                f"Attendance Check Available - {course['code']}",
-                f"Attendance check is available for {course['code']} on {session.session_date} at {session.time_slot}. Click 'Check' to mark your attendance.",
-            )
-        )
-    
-    conn.commit()
+    await conn.commit()
+    notification_fanout.submit(fanout_id)
     
     # Get created session
-    cursor.execute("SELECT * FROM attendance_sessions WHERE id = ?", (session_id,))
-    created_session = cursor.fetchone()
-    
-    conn.close()
+    await cursor.execute("SELECT * FROM attendance_sessions WHERE id = ?", (session_id,))
+    created_session = await cursor.fetchone()
     
     return AttendanceSessionResponse(
         id=created_session["id"],
@@ -2488,80 +3374,77 @@ async def create_attendance_session(
         session_date=created_session["session_date"],
         time_slot=created_session["time_slot"],
         created_by=created_session["created_by"],
-        created_at=created_session["created_at"]
+        created_at=created_session["created_at"],
+        fanout_id=fanout_id
     )
 
 @app.post("/attendance/check-in/{session_id}")
 async def check_in_attendance(
     session_id: int,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
     """Student checks in for attendance"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Get session
-    cursor.execute("SELECT * FROM attendance_sessions WHERE id = ?", (session_id,))
-    session = cursor.fetchone()
+    await cursor.execute("SELECT * FROM attendance_sessions WHERE id = ?", (session_id,))
+    session = await cursor.fetchone()
     if not session:
-        conn.close()
         raise HTTPException(status_code=404, detail="Attendance session not found")
     
     # Check if already checked in
-    cursor.execute(
+    await cursor.execute(
         "SELECT * FROM attendance_records WHERE session_id = ? AND student_id = ?",
         (session_id, current_user["id"])
     )
-    existing = cursor.fetchone()
+    existing = await cursor.fetchone()
     if existing:
-        conn.close()
         raise HTTPException(status_code=400, detail="Already checked in for this session")
     
     # Check if student is registered for this course
-    cursor.execute(
+    await cursor.execute(
         """SELECT * FROM course_registrations 
            WHERE student_id = ? AND course_id = ? AND status = 'approved'""",
         (current_user["id"], session["course_id"])
     )
-    registration = cursor.fetchone()
+    registration = await cursor.fetchone()
     if not registration:
-        conn.close()
         raise HTTPException(status_code=403, detail="You are not registered for this course")
     
     # Create attendance record
-    cursor.execute(
+    await cursor.execute(
         """INSERT INTO attendance_records (session_id, student_id, student_student_id, student_name)
            VALUES (?, ?, ?, ?)""",
         (session_id, current_user["id"], current_user["student_id"], current_user["name"])
     )
     
-    conn.commit()
-    conn.close()
+    await conn.commit()
     
     return {"message": "Attendance checked in successfully"}
 
 @app.get("/attendance/sessions", response_model=List[AttendanceSessionResponse])
 async def get_attendance_sessions(
     course_id: Optional[int] = None,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
     """Get attendance sessions (admin sees all, students see sessions for their courses)"""
-    conn = get_db()
     cursor = conn.cursor()
     
     role = current_user["role"] if "role" in current_user.keys() else "student"
     
     if role == "admin":
         if course_id:
-            cursor.execute(
+            await cursor.execute(
                 "SELECT * FROM attendance_sessions WHERE course_id = ? ORDER BY session_date DESC, time_slot DESC",
                 (course_id,)
             )
         else:
-            cursor.execute("SELECT * FROM attendance_sessions ORDER BY session_date DESC, time_slot DESC")
+            await cursor.execute("SELECT * FROM attendance_sessions ORDER BY session_date DESC, time_slot DESC")
     else:
         # Students see only sessions for courses they're registered in
-        cursor.execute(
+        await cursor.execute(
             """SELECT DISTINCT a.* FROM attendance_sessions a
                JOIN course_registrations cr ON a.course_id = cr.course_id
                WHERE cr.student_id = ? AND cr.status = 'approved'
@@ -2569,8 +3452,7 @@ async def get_attendance_sessions(
             (current_user["id"],)
         )
     
-    sessions = cursor.fetchall()
-    conn.close()
+    sessions = await cursor.fetchall()
     
     return [
         AttendanceSessionResponse(
@@ -2589,28 +3471,26 @@ async def get_attendance_sessions(
 @app.get("/attendance/sessions/{session_id}/records", response_model=List[AttendanceRecordResponse])
 async def get_attendance_records(
     session_id: int,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
     """Get attendance records for a specific session (admin only)"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Verify session exists
-    cursor.execute("SELECT * FROM attendance_sessions WHERE id = ?", (session_id,))
-    session = cursor.fetchone()
+    await cursor.execute("SELECT * FROM attendance_sessions WHERE id = ?", (session_id,))
+    session = await cursor.fetchone()
     if not session:
-        conn.close()
         raise HTTPException(status_code=404, detail="Attendance session not found")
     
     # Get all attendance records for this session
-    cursor.execute(
+    await cursor.execute(
         """SELECT * FROM attendance_records 
            WHERE session_id = ? 
            ORDER BY checked_in_at ASC""",
         (session_id,)
     )
-    records = cursor.fetchall()
-    conn.close()
+    records = await cursor.fetchall()
     
     return [
         AttendanceRecordResponse(
@@ -2631,46 +3511,35 @@ async def get_attendance_records(
 @app.post("/events", response_model=EventResponse)
 async def create_event(
     event: EventCreate,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
     """Create a new event announcement"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Create event
-    cursor.execute(
+    await cursor.execute(
         """INSERT INTO events (event_name, event_date, time_slot, created_by)
            VALUES (?, ?, ?, ?)""",
         (event.event_name, event.event_date, event.time_slot, current_user["id"])
     )
     event_id = cursor.lastrowid
     
-    # Get ALL students (not just course-registered ones)
-    cursor.execute(
-        """SELECT id, student_id, name FROM users WHERE role != 'admin' OR role IS NULL"""
+    # One broadcast notification for ALL students (not just course-registered ones)
+    title = f"Event Announcement - {event.event_name}"
+    notification_message = f"Event '{event.event_name}' is scheduled on {event.event_date} at {event.time_slot}. Click 'Attend' to confirm your attendance."
+    await cursor.execute(
+        """INSERT INTO broadcast_notifications (audience, type, title, message, created_by)
+           VALUES (?, ?, ?, ?, ?)""",
+        ("non_admins", "event", title, notification_message, current_user["id"])
     )
-    students = cursor.fetchall()
-    
-    # Create notifications for all students
-    for student in students:
-        cursor.execute(
-            """INSERT INTO notifications (user_id, type, title, message)
-               VALUES (?, ?, ?, ?)""",
-            (
-                student["id"],
-                "event",
-                f"Event Announcement - {event.event_name}",
-                f"Event '{event.event_name}' is scheduled on {event.event_date} at {event.time_slot}. Click 'Attend' to confirm your attendance.",
-            )
-        )
     
-    conn.commit()
+    await conn.commit()
+    publish_broadcast("non_admins", "event", title, notification_message)
     
     # Get created event
-    cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
-    created_event = cursor.fetchone()
-    
-    conn.close()
+    await cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
+    created_event = await cursor.fetchone()
     
     return EventResponse(
         id=created_event["id"],
@@ -2684,27 +3553,25 @@ async def create_event(
 @app.post("/events/{event_id}/attend")
 async def attend_event(
     event_id: int,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    conn = Depends(get_db)
 ):
     """Student attends an event"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Verify event exists
-    cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
-    event = cursor.fetchone()
+    await cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
+    event = await cursor.fetchone()
     if not event:
-        conn.close()
         raise HTTPException(status_code=404, detail="Event not found")
     
     # Check if already attended
-    cursor.execute(
+    await cursor.execute(
         "SELECT * FROM event_attendance_records WHERE event_id = ? AND student_id = ?",
         (event_id, current_user["id"])
     )
-    existing = cursor.fetchone()
+    existing = await cursor.fetchone()
     if existing:
-        conn.close()
         raise HTTPException(status_code=400, detail="You have already attended this event")
     
     # Get student info
@@ -2712,29 +3579,25 @@ async def attend_event(
         student_id = current_user["student_id"]
         student_name = current_user["name"]
     except (KeyError, TypeError):
-        conn.close()
         raise HTTPException(status_code=400, detail="Student information not found")
     
     # Create attendance record
-    cursor.execute(
+    await cursor.execute(
         """INSERT INTO event_attendance_records (event_id, student_id, student_student_id, student_name)
            VALUES (?, ?, ?, ?)""",
         (event_id, current_user["id"], student_id, student_name)
     )
-    conn.commit()
-    conn.close()
+    await conn.commit()
     
     return {"message": "Event attendance recorded successfully"}
 
 @app.get("/events", response_model=List[EventResponse])
-async def get_events(current_user = Depends(get_current_user)):
+async def get_events(current_user = Depends(get_current_user), conn = Depends(get_db)):
     """Get all events (both admin and students can see all events)"""
-    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM events ORDER BY event_date DESC, time_slot DESC")
-    events = cursor.fetchall()
-    conn.close()
+    await cursor.execute("SELECT * FROM events ORDER BY event_date DESC, time_slot DESC")
+    events = await cursor.fetchall()
     
     return [
         EventResponse(
@@ -2751,28 +3614,26 @@ async def get_events(current_user = Depends(get_current_user)):
 @app.get("/events/{event_id}/attendance", response_model=List[EventAttendanceRecordResponse])
 async def get_event_attendance(
     event_id: int,
-    current_user = Depends(get_current_admin)
+    current_user = Depends(get_current_admin),
+    conn = Depends(get_db)
 ):
     """Get attendance records for a specific event (admin only)"""
-    conn = get_db()
     cursor = conn.cursor()
     
     # Verify event exists
-    cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
-    event = cursor.fetchone()
+    await cursor.execute("SELECT * FROM events WHERE id = ?", (event_id,))
+    event = await cursor.fetchone()
     if not event:
-        conn.close()
         raise HTTPException(status_code=404, detail="Event not found")
     
     # Get all attendance records for this event
-    cursor.execute(
+    await cursor.execute(
         """SELECT * FROM event_attendance_records 
            WHERE event_id = ? 
            ORDER BY attended_at ASC""",
         (event_id,)
     )
-    records = cursor.fetchall()
-    conn.close()
+    records = await cursor.fetchall()
     
     return [
         EventAttendanceRecordResponse(
@@ -2797,14 +3658,12 @@ class AdminUserCreate(BaseModel):
     year: Optional[int] = None
 
 @app.get("/admin/users", response_model=List[UserResponse])
-async def get_admin_users(current_user = Depends(get_current_admin)):
+async def get_admin_users(current_user = Depends(get_current_admin), conn = Depends(get_db)):
     """Get all admin users (admin only)"""
-    conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM users WHERE role = 'admin' ORDER BY created_at DESC")
-    admins = cursor.fetchall()
-    conn.close()
+    await cursor.execute("SELECT * FROM users WHERE role = 'admin' ORDER BY created_at DESC")
+    admins = await cursor.fetchall()
     
     return [
         UserResponse(
@@ -2817,34 +3676,32 @@ async def get_admin_users(current_user = Depends(get_current_admin)):
     ]
 
 @app.post("/admin/users", response_model=UserResponse)
-async def create_admin_user(admin_data: AdminUserCreate, current_user = Depends(get_current_admin)):
+async def create_admin_user(admin_data: AdminUserCreate, current_user = Depends(get_current_admin_short)):
     """Create a new admin user or convert existing user to admin (admin only)"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
     # Validate student ID format
     if not admin_data.student_id or len(admin_data.student_id) != 8:
-        conn.close()
         raise HTTPException(status_code=400, detail="Student ID must be exactly 8 digits")
     
     # Validate password
     if not admin_data.password or len(admin_data.password) < 6:
-        conn.close()
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
     
-    # Check if user already exists
-    cursor.execute("SELECT * FROM users WHERE student_id = ?", (admin_data.student_id,))
-    existing_user = cursor.fetchone()
+    # Check if user already exists. As in signup, no connection is held while
+    # the password hashes
+    async with short_db() as conn:
+        existing_user = await get_user_by_student_id(conn, admin_data.student_id)
     
     if existing_user:
         # Convert existing user to admin and update password
-        hashed_password = get_password_hash(admin_data.password)
-        cursor.execute(
-            "UPDATE users SET role = 'admin', password_hash = ? WHERE student_id = ?",
-            (hashed_password, admin_data.student_id)
-        )
-        conn.commit()
-        conn.close()
+        hashed_password = await get_password_hash(admin_data.password)
+        async with short_db() as conn:
+            cursor = conn.cursor()
+            await cursor.execute(
+                "UPDATE users SET role = 'admin', password_hash = ? WHERE student_id = ?",
+                (hashed_password, admin_data.student_id)
+            )
+            await conn.commit()
+        invalidate_cached_user(admin_data.student_id)
         
         return UserResponse(
             id=existing_user["id"],
@@ -2860,23 +3717,22 @@ async def create_admin_user(admin_data: AdminUserCreate, current_user = Depends(
         
         # Validate year if provided
         if year not in [1, 2, 3, 4]:
-            conn.close()
             raise HTTPException(status_code=400, detail="Year must be 1, 2, 3, or 4")
         
-        hashed_password = get_password_hash(admin_data.password)
-        
-        try:
-            cursor.execute(
-                "INSERT INTO users (student_id, name, password_hash, year, role) VALUES (?, ?, ?, ?, 'admin')",
-                (admin_data.student_id, name, hashed_password, year)
-            )
-            conn.commit()
-            user_id = cursor.lastrowid
-        except sqlite3.IntegrityError:
-            conn.close()
-            raise HTTPException(status_code=400, detail="Student ID already exists")
+        hashed_password = await get_password_hash(admin_data.password)
         
-        conn.close()
+        async with short_db() as conn:
+            cursor = conn.cursor()
+            try:
+                await cursor.execute(
+                    "INSERT INTO users (student_id, name, password_hash, year, role) VALUES (?, ?, ?, ?, 'admin')",
+                    (admin_data.student_id, name, hashed_password, year)
+                )
+                await conn.commit()
+                user_id = cursor.lastrowid
+            except sqlite3.IntegrityError:
+                await conn.rollback()
+                raise HTTPException(status_code=400, detail="Student ID already exists")
         
         return UserResponse(
             id=user_id,
@@ -2893,6 +3749,47 @@ async def create_admin_user(admin_data: AdminUserCreate, current_user = Depends(
 async def root():
     return {"message": " Booking System API", "status": "running"}
 
+@app.get("/health/db")
+async def database_health(current_user = Depends(get_current_admin)):
+    """Connection pool health check and pool-size/wait-time metrics (admin only)"""
+    # The check pings every idle connection, so it runs off the event loop
+    health_check = await asyncio.get_running_loop().run_in_executor(None, db_pool.health_check)
+    return {
+        "pool": db_pool.stats(),
+        "health_check": health_check,
+        "checkpointer": checkpointer.stats()
+    }
+
+@app.get("/health/auth")
+async def auth_health(current_user = Depends(get_current_admin)):
+    """Password hashing pool and authenticated-user cache metrics (admin only)"""
+    return {"password_hashing": password_hasher.stats(), "user_cache": user_cache.stats()}
+
+@app.get("/health/chat")
+async def chat_health(current_user = Depends(get_current_admin)):
+    """Open chat websockets, fan-out, hot-room cache and archival metrics (admin only)"""
+    return {
+        "gateway": chat_gateway.stats(),
+        "bus": bus.stats(),
+        "room_cache": room_cache.stats(),
+        "archiver": chat_archiver.stats(),
+        "writer": chat_writer.stats()
+    }
+
+@app.get("/health/notifications")
+async def notifications_health(current_user = Depends(get_current_admin)):
+    """Background notification fan-out metrics (admin only)"""
+    return {"fanout": notification_fanout.stats()}
+
+@app.get("/health/bookings")
+async def bookings_health(current_user = Depends(get_current_admin)):
+    """Slot availability cache, booking hold expiry and completed booking expiry metrics (admin only)"""
+    return {
+        "availability_cache": availability_cache.stats(),
+        "holds": hold_expiry.stats(),
+        "expiry": booking_expirer.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     import logging
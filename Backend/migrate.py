@@ -0,0 +1,175 @@
+"""Versioned schema migrations for portal.db
+
+Migrations live in migrations/NNNN_description.py and are applied in
+order. Each module defines `upgrade(conn)`; the runner records every
+applied version in the schema_version table.
+
+By default a migration runs inside a single write transaction together
+with its schema_version row, so it is applied completely or not at all.
+Long-running data changes (backfills, table rebuilds on big tables) set
+`TRANSACTIONAL = False` and commit in small batches with
+`batched_update()` so other writers keep making progress. Those
+migrations must be safe to re-run, since a crash can interrupt them
+between batches.
+"""
+import importlib.util
+import os
+import re
+import sqlite3
+import sys
+import time
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+BACKFILL_BATCH_SIZE = 1000
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> list:
+    """Return (version, name, path) for every migration file, oldest first"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _load(version: int, path: str):
+    spec = importlib.util.spec_from_file_location(f"migration_{version:04d}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def current_version(conn) -> int:
+    """Latest applied version, or 0 for a database that predates schema_version"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def _ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
+        )
+    """)
+
+
+def _is_applied(conn, version: int) -> bool:
+    return conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone() is not None
+
+
+def _record(conn, version: int, name: str, started: float):
+    conn.execute(
+        "INSERT INTO schema_version (version, name, duration_ms) VALUES (?, ?, ?)",
+        (version, name, int((time.monotonic() - started) * 1000))
+    )
+
+
+def run_migrations(conn, directory: str = MIGRATIONS_DIR) -> list:
+    """Apply every pending migration and return the versions that were applied.
+
+    When the database is already current this costs two reads and issues no DDL.
+    """
+    migrations = discover_migrations(directory)
+    if not migrations:
+        return []
+    if current_version(conn) >= migrations[-1][0]:
+        return []
+
+    _ensure_version_table(conn)
+    conn.commit()
+
+    applied = []
+    for version, name, path in migrations:
+        if _is_applied(conn, version):
+            continue
+        module = _load(version, path)
+        started = time.monotonic()
+
+        if getattr(module, "TRANSACTIONAL", True):
+            # IMMEDIATE takes the write lock up front, so when several workers boot
+            # at once only one applies the migration and the others see it recorded
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if _is_applied(conn, version):
+                    conn.rollback()
+                    continue
+                module.upgrade(conn)
+                _record(conn, version, name, started)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        else:
+            module.upgrade(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            if _is_applied(conn, version):
+                conn.rollback()
+                continue
+            _record(conn, version, name, started)
+            conn.commit()
+
+        print(f"Applied migration {version:04d}_{name}")
+        applied.append(version)
+    return applied
+
+# ============================================
+# HELPERS FOR MIGRATIONS
+# ============================================
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})").fetchall())
+
+
+def batched_update(conn, table: str, set_clause: str, where: str, params: tuple = (),
+                   batch_size: int = BACKFILL_BATCH_SIZE, pause: float = 0.0) -> int:
+    """Run `UPDATE table SET set_clause WHERE where` in rowid-ordered batches.
+
+    Each batch is its own short transaction, so the write lock is released
+    between batches and request handlers are never blocked for long. `where`
+    must stop matching a row once it has been updated, which is also what
+    makes an interrupted backfill resumable. Returns the number of rows updated.
+    """
+    total = 0
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid FROM {table} WHERE rowid > ? AND ({where}) ORDER BY rowid LIMIT ?",
+            (last_rowid, *params, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        first, last_rowid = rows[0][0], rows[-1][0]
+        cursor = conn.execute(
+            f"UPDATE {table} SET {set_clause} WHERE rowid BETWEEN ? AND ? AND ({where})",
+            (first, last_rowid, *params)
+        )
+        conn.commit()
+        total += cursor.rowcount
+        if pause:
+            time.sleep(pause)
+    return total
+
+
+if __name__ == "__main__":
+    # python migrate.py [path/to/portal.db]
+    from database import DATABASE_PATH
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DATABASE_PATH)
+    print(f"Schema version before: {current_version(conn)}")
+    run_migrations(conn)
+    print(f"Schema version after: {current_version(conn)}")
+    conn.close()
@@ -0,0 +1,11 @@
+"""Add role, email and profile_photo to users tables created before those columns existed"""
+from migrate import column_exists
+
+
+def upgrade(conn):
+    if not column_exists(conn, "users", "role"):
+        conn.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'student'")
+    if not column_exists(conn, "users", "email"):
+        conn.execute("ALTER TABLE users ADD COLUMN email TEXT")
+    if not column_exists(conn, "users", "profile_photo"):
+        conn.execute("ALTER TABLE users ADD COLUMN profile_photo TEXT")
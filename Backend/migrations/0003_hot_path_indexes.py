@@ -0,0 +1,15 @@
+"""Secondary indexes for chat history, notifications, bookings and registrations"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_room_timestamp ON chat_messages(room, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user_read_created ON notifications(user_id, is_read, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookings_room_date_slot ON bookings(room_key, booking_date, time_slot)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_room ON bookings(user_id, room_key)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_course_registrations_status_created ON course_registrations(status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_course_registrations_course_status ON course_registrations(course_id, status)")
+    
+    for table in ("chat_messages", "notifications", "bookings", "course_registrations"):
+        cursor.execute(f"ANALYZE {table}")
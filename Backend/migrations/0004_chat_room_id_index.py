@@ -0,0 +1,9 @@
+"""Index chat history on (room, id) for keyset pagination, replacing (room, timestamp)"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_room_id ON chat_messages(room, id)")
+    cursor.execute("DROP INDEX IF EXISTS idx_chat_messages_room_timestamp")
+    cursor.execute("ANALYZE chat_messages")
@@ -0,0 +1,24 @@
+"""Record deleted chat messages so polling clients can drop them (GET /chat/sync)"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_message_tombstones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_message_tombstones_room_id ON chat_message_tombstones(room, id)"
+    )
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_tombstone
+        AFTER DELETE ON chat_messages
+        BEGIN
+            INSERT INTO chat_message_tombstones (room, message_id) VALUES (old.room, old.id);
+        END
+    """)
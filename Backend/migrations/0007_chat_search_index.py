@@ -0,0 +1,45 @@
+"""Full-text index over chat messages for GET /chat/search"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    # External-content table: the text lives in chat_messages only, the
+    # index is kept in step by the triggers below
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+            content,
+            sender_name,
+            content='chat_messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert
+        AFTER INSERT ON chat_messages
+        BEGIN
+            INSERT INTO chat_messages_fts (rowid, content, sender_name)
+            VALUES (new.id, new.content, new.sender_name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete
+        AFTER DELETE ON chat_messages
+        BEGIN
+            INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content, sender_name)
+            VALUES ('delete', old.id, old.content, old.sender_name);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update
+        AFTER UPDATE OF content, sender_name ON chat_messages
+        BEGIN
+            INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content, sender_name)
+            VALUES ('delete', old.id, old.content, old.sender_name);
+            INSERT INTO chat_messages_fts (rowid, content, sender_name)
+            VALUES (new.id, new.content, new.sender_name);
+        END
+    """)
+    # Index the messages that already exist
+    cursor.execute("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('rebuild')")
@@ -0,0 +1,16 @@
+"""Per-user read position in each chat room, for unread counts"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_read_cursors (
+            user_id INTEGER NOT NULL,
+            room TEXT NOT NULL,
+            last_read_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, room),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+    """)
@@ -0,0 +1,21 @@
+"""One booking per room slot, enforced by the database"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    # Double bookings made before the constraint existed: the first one stands
+    cursor.execute("""
+        DELETE FROM bookings WHERE id NOT IN (
+            SELECT MIN(id) FROM bookings GROUP BY room_key, booking_date, time_slot
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS bookings_slot_unique
+        ON bookings(room_key, booking_date, time_slot)
+    """)
+    
+    # The unique index replaces idx_bookings_room_date_slot
+    cursor.execute("DROP INDEX IF EXISTS idx_bookings_room_date_slot")
+    cursor.execute("ANALYZE bookings")
@@ -0,0 +1,22 @@
+"""Short-lived holds that reserve a booking slot while the user confirms"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS booking_holds (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            room_key TEXT NOT NULL,
+            room_name TEXT NOT NULL,
+            booking_date TEXT NOT NULL,
+            time_slot TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(room_key, booking_date, time_slot),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_booking_holds_user_room ON booking_holds(user_id, room_key)")
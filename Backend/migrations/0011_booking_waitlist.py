@@ -0,0 +1,23 @@
+"""First-come, first-served waitlist for booked slots"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS booking_waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            room_key TEXT NOT NULL,
+            room_name TEXT NOT NULL,
+            booking_date TEXT NOT NULL,
+            time_slot TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(room_key, booking_date, time_slot, user_id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_booking_waitlist_slot
+        ON booking_waitlist(room_key, booking_date, time_slot, id)""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_booking_waitlist_user ON booking_waitlist(user_id)")
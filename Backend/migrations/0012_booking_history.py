@@ -0,0 +1,39 @@
+"""Completed bookings and per-day booking counts, kept out of the live bookings table"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    # Bookings whose day has passed, moved here by booking_history.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS booking_history (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            room_key TEXT NOT NULL,
+            room_name TEXT NOT NULL,
+            booking_date TEXT NOT NULL,
+            time_slot TEXT NOT NULL,
+            created_at TIMESTAMP,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Bookings made per day and room, for the dashboards
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS booking_stats_daily (
+            day TEXT NOT NULL,
+            room_key TEXT NOT NULL,
+            room_name TEXT NOT NULL,
+            bookings INTEGER NOT NULL,
+            PRIMARY KEY (day, room_key, room_name)
+        ) WITHOUT ROWID
+    """)
+    
+    # The quota index gains booking_date so it only counts upcoming bookings
+    cursor.execute("DROP INDEX IF EXISTS idx_bookings_user_room")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bookings_user_room_date ON bookings(user_id, room_key, booking_date)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings(booking_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_booking_history_created ON booking_history(created_at)")
+    cursor.execute("ANALYZE bookings")
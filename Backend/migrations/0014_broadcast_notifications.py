@@ -0,0 +1,54 @@
+"""One row per announcement or event instead of a copy per recipient, plus per-user read state"""
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            audience TEXT NOT NULL,
+            type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users(id)
+        )
+    """)
+    
+    # A row means the user has read the broadcast; no row means unread
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_reads (
+            user_id INTEGER NOT NULL,
+            broadcast_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, broadcast_id),
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (broadcast_id) REFERENCES broadcast_notifications(id)
+        ) WITHOUT ROWID
+    """)
+    
+    # Fold the per-student copies of past announcements and events into
+    # broadcasts, keeping who had read them
+    cursor.execute("""
+        INSERT INTO broadcast_notifications (audience, type, title, message, created_at)
+        SELECT CASE type WHEN 'announcement' THEN 'students' ELSE 'non_admins' END,
+               type, title, message, MIN(created_at)
+        FROM notifications
+        WHERE type IN ('announcement', 'event')
+        GROUP BY type, title, message, date(created_at)
+        ORDER BY MIN(created_at)
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO broadcast_reads (user_id, broadcast_id)
+        SELECT n.user_id, b.id
+        FROM notifications n
+        JOIN broadcast_notifications b
+          ON b.type = n.type AND b.title = n.title AND b.message = n.message
+         AND date(b.created_at) = date(n.created_at)
+        WHERE n.type IN ('announcement', 'event') AND n.is_read = 1
+    """)
+    cursor.execute("DELETE FROM notifications WHERE type IN ('announcement', 'event')")
+    
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_broadcast_notifications_created_audience
+        ON broadcast_notifications(created_at, audience)""")
@@ -0,0 +1,23 @@
+"""Recurring booking series, linking the bookings one recurring request made"""
+from migrate import column_exists
+
+
+def upgrade(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS booking_series (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            time_slot TEXT NOT NULL,
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    if not column_exists(conn, "bookings", "series_id"):
+        cursor.execute("ALTER TABLE bookings ADD COLUMN series_id INTEGER REFERENCES booking_series(id)")
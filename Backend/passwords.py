@@ -0,0 +1,98 @@
+"""bcrypt hashing on a bounded worker pool so logins never block the event loop"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# bcrypt releases the GIL while it works, so plain threads run hashes in parallel
+HASH_WORKERS = int(os.environ.get("PORTAL_HASH_WORKERS", "2"))
+# Requests allowed to wait for a worker before new ones are turned away
+HASH_QUEUE_LIMIT = int(os.environ.get("PORTAL_HASH_QUEUE_LIMIT", "32"))
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+class PasswordHasher:
+    """Runs bcrypt on a fixed-size thread pool with a cap on queued work.
+
+    Only touched from the event loop thread, so the counters need no lock.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0  # running + queued
+
+        # Metrics
+        self._completed = 0
+        self._rejected = 0
+        self._max_pending = 0
+        self._total_hash_time = 0.0
+        self._max_hash_time = 0.0
+        self._total_queue_wait = 0.0
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.workers + self.queue_limit:
+            self._rejected += 1
+            raise HashPoolBusy("Password hashing queue is full")
+
+        self._pending += 1
+        self._max_pending = max(self._max_pending, self._pending)
+        submitted = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            result = fn(*args)
+            return result, started - submitted, time.monotonic() - started
+
+        try:
+            loop = asyncio.get_running_loop()
+            result, queue_wait, hash_time = await loop.run_in_executor(self._executor, timed)
+        finally:
+            self._pending -= 1
+
+        self._completed += 1
+        self._total_queue_wait += queue_wait
+        self._total_hash_time += hash_time
+        self._max_hash_time = max(self._max_hash_time, hash_time)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        completed = self._completed
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "queue_length": max(self._pending - self.workers, 0),
+            "in_flight": self._pending,
+            "max_in_flight": self._max_pending,
+            "completed": completed,
+            "rejected": self._rejected,
+            "avg_hash_ms": round(self._total_hash_time / completed * 1000, 1) if completed else 0.0,
+            "max_hash_ms": round(self._max_hash_time * 1000, 1),
+            "avg_queue_wait_ms": round(self._total_queue_wait / completed * 1000, 1) if completed else 0.0,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
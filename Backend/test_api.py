@@ -1,6 +1,8 @@
 """Quick test script to verify API endpoints are working"""
 import requests
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 BASE_URL = "http://localhost:8000"
 
@@ -70,6 +72,69 @@ def test_me(token):
         print(f"✗ /me endpoint failed: {e}")
         return False
 
+CONCURRENT_REQUESTS = 200
+STRESS_DATE = "2099-01-01"  # far enough ahead that real bookings never collide
+
+def fire_concurrently(requests_to_send):
+    """Send every (method, url, json) at once and return the status codes"""
+    barrier = threading.Barrier(len(requests_to_send))
+    
+    def send(request):
+        method, url, body, headers = request
+        barrier.wait()
+        try:
+            return requests.request(method, url, json=body, headers=headers, timeout=60).status_code
+        except Exception:
+            return None
+    
+    with ThreadPoolExecutor(max_workers=len(requests_to_send)) as pool:
+        return list(pool.map(send, requests_to_send))
+
+def cancel_stress_bookings(headers):
+    response = requests.get(f"{BASE_URL}/bookings", headers=headers)
+    for booking in response.json():
+        if booking["booking_date"] == STRESS_DATE:
+            requests.delete(f"{BASE_URL}/bookings/{booking['id']}", headers=headers)
+
+def test_concurrent_booking(token):
+    """Race many identical bookings for one slot, then many bookings against the per-room quota"""
+    try:
+        headers = {"Authorization": f"Bearer {token}"}
+        cancel_stress_bookings(headers)
+        passed = True
+        
+        slot = {"room_key": "meeting", "room_name": "Meeting Room", "booking_date": STRESS_DATE, "time_slot": "9-10am"}
+        codes = fire_concurrently([("POST", f"{BASE_URL}/bookings", slot, headers)] * CONCURRENT_REQUESTS)
+        booked, rejected = codes.count(200), codes.count(400)
+        if booked == 1 and rejected == CONCURRENT_REQUESTS - 1:
+            print(f"[OK] Same-slot race: 1 of {CONCURRENT_REQUESTS} requests booked the slot")
+        else:
+            print(f"[FAIL] Same-slot race: {booked} booked, {rejected} rejected, others {CONCURRENT_REQUESTS - booked - rejected}")
+            passed = False
+        cancel_stress_bookings(headers)
+        
+        # Different slots of one room: only the quota can stop them
+        slots = [
+            ("POST", f"{BASE_URL}/bookings",
+             {"room_key": "kitchen", "room_name": "Kitchen", "booking_date": STRESS_DATE, "time_slot": f"slot-{i}"},
+             headers)
+            for i in range(CONCURRENT_REQUESTS)
+        ]
+        existing = sum(1 for b in requests.get(f"{BASE_URL}/bookings", headers=headers).json() if b["room_key"] == "kitchen")
+        codes = fire_concurrently(slots)
+        booked = codes.count(200)
+        expected = max(0, 2 - existing)
+        if booked == expected:
+            print(f"[OK] Quota race: {booked} of {CONCURRENT_REQUESTS} requests booked (quota 2, {existing} held before)")
+        else:
+            print(f"[FAIL] Quota race: {booked} booked, expected {expected}")
+            passed = False
+        cancel_stress_bookings(headers)
+        return passed
+    except Exception as e:
+        print(f"[FAIL] Concurrent booking test failed: {e}")
+        return False
+
 if __name__ == "__main__":
     print("Testing API endpoints...\n")
     
@@ -85,6 +150,8 @@ if __name__ == "__main__":
     
     if token:
         test_me(token)
+        print()
+        test_concurrent_booking(token)
     
     print("\n[OK] API test complete!")
 